@@ -0,0 +1,39 @@
+from flask import Blueprint, request, jsonify
+from auth import require_auth, require_role
+from services.analytics import inventory_analytics, WINDOW_DAYS, DEAD_STOCK_DAYS
+
+analytics_bp = Blueprint('analytics', __name__)
+
+def _positive_int(name, default):
+    value = request.args.get(name, default)
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise ValueError('{} must be an integer'.format(name))
+    if value < 1:
+        raise ValueError('{} must be at least 1'.format(name))
+    return value
+
+@analytics_bp.route('/inventory', methods=['GET'])
+@require_auth
+@require_role('admin', 'purchasing')
+def get_inventory_analytics():
+    # Turnover, ABC class, days of cover and dead-stock flag per product and warehouse.
+    # Query: window_days (turnover/cover window), dead_days, warehouse_id, abc_class,
+    # dead_stock=true
+    try:
+        window_days = _positive_int('window_days', WINDOW_DAYS)
+        dead_days = _positive_int('dead_days', DEAD_STOCK_DAYS)
+        warehouse_id = _positive_int('warehouse_id', None) if 'warehouse_id' in request.args else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        rows = inventory_analytics(window_days, dead_days, warehouse_id)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    abc_class = request.args.get('abc_class')
+    if abc_class:
+        rows = [row for row in rows if row['abc_class'] == abc_class.upper()]
+    if request.args.get('dead_stock') == 'true':
+        rows = [row for row in rows if row['dead_stock']]
+    return jsonify({'window_days': window_days, 'dead_days': dead_days, 'count': len(rows), 'items': rows})
@@ -0,0 +1,117 @@
+import gzip
+import os
+from flask import Blueprint, Response, jsonify, request
+from flask.json.provider import DefaultJSONProvider
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Registering this blueprint switches the app to orjson (when installed) and compresses
+# responses for clients that send Accept-Encoding
+encoding_bp = Blueprint('encoding', __name__)
+
+# Bodies smaller than this are sent as-is; compressing them costs more than it saves
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', 5))
+COMPRESSIBLE = {'application/json', 'application/x-ndjson', 'application/msgpack', 'text/csv', 'text/plain'}
+# Preferred first when the client accepts both with the same quality
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+# Row formats for list endpoints: json (list of objects), columnar (keys once plus
+# one array per column) and msgpack (the columnar shape in MessagePack)
+MSGPACK_MIMETYPE = 'application/msgpack'
+ROW_FORMATS = ('json', 'columnar', 'msgpack')
+
+class OrjsonProvider(DefaultJSONProvider):
+    # Same output as the default provider (sorted keys, Flask's date and Decimal
+    # handling via default) at a fraction of the encoding time
+    OPTIONS = (orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+               | orjson.OPT_PASSTHROUGH_DATETIME) if orjson is not None else 0
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self.OPTIONS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if self.compact is False or (self.compact is None and self._app.debug):
+            # Indented output, as the default provider gives in debug mode
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj, default=self.default, option=self.OPTIONS) + b'\n',
+                                        mimetype=self.mimetype)
+
+@encoding_bp.record_once
+def use_orjson(state):
+    if orjson is not None:
+        state.app.json = OrjsonProvider(state.app)
+
+def _compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+@encoding_bp.after_app_request
+def compress_response(response):
+    if response.mimetype not in COMPRESSIBLE:
+        return response
+    response.vary.add('Accept-Encoding')
+    # Streams (SSE, NDJSON exports) are flushed as produced and left uncompressed
+    if (response.is_streamed or response.direct_passthrough or response.status_code < 200
+            or response.status_code in (204, 304) or 'Content-Encoding' in response.headers):
+        return response
+    encoding = request.accept_encodings.best_match(ENCODINGS)
+    if encoding is None:
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+    response.set_data(_compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    # The bytes differ per encoding, so a strong validator becomes weak; If-None-Match
+    # still matches it because Werkzeug compares ETags weakly
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+def parse_format(default='json'):
+    # ?format=json|columnar|msgpack, or Accept: application/msgpack
+    fmt = request.args.get('format')
+    if fmt is None:
+        fmt = 'msgpack' if request.accept_mimetypes.best == MSGPACK_MIMETYPE else default
+    if fmt not in ROW_FORMATS:
+        raise ValueError('format must be one of: {}'.format(', '.join(ROW_FORMATS)))
+    if fmt == 'msgpack' and msgpack is None:
+        raise ValueError('msgpack format is not available on this server')
+    return fmt
+
+def columnar(rows):
+    # {'count': n, 'columns': {key: [value per row]}}; rows missing a key get null
+    keys = dict.fromkeys(rows[0]) if rows else {}
+    for row in rows:
+        if row.keys() != keys.keys():
+            keys.update(dict.fromkeys(row))
+    return {'count': len(rows), 'columns': {key: [row.get(key) for row in rows] for key in keys}}
+
+def encoded_response(obj, fmt='json'):
+    if fmt == 'msgpack':
+        response = Response(msgpack.packb(obj, default=str), mimetype=MSGPACK_MIMETYPE)
+    else:
+        response = jsonify(obj)
+    # The format can come from the Accept header, so caches must key on it
+    response.vary.add('Accept')
+    return response
+
+def rows_response(rows, fmt='json'):
+    return encoded_response(rows if fmt == 'json' else columnar(rows), fmt)
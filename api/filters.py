@@ -0,0 +1,75 @@
+import datetime
+from marshmallow import ValidationError
+
+# Whitelisted query-string filters: `field=v`, `field__in=a,b,c`, `field__gte=v`, ...
+# Values are parsed with the resource schema's field, so ids must be integers,
+# movement_type must be a known type and created_at must be an ISO 8601 timestamp.
+OPERATORS = {
+    'eq': 'eq',
+    'in': 'in_',
+    'gt': 'gt',
+    'gte': 'gte',
+    'lt': 'lt',
+    'lte': 'lte',
+}
+
+LOCATION_FILTERS = {
+    'product_id': ('eq', 'in'),
+    'warehouse_id': ('eq', 'in'),
+    'bin_id': ('eq', 'in'),
+    'batch_id': ('eq', 'in'),
+    'serial_number': ('eq', 'in'),
+}
+
+INVENTORY_FILTERS = dict(LOCATION_FILTERS)
+
+MOVEMENT_FILTERS = dict(
+    LOCATION_FILTERS,
+    movement_type=('eq', 'in'),
+    ref_type=('eq',),
+    ref_id=('eq', 'in'),
+    user_id=('eq', 'in'),
+    created_at=('gt', 'gte', 'lt', 'lte'),
+)
+
+def parse_filters(args, allowed, schema):
+    # Returns [(builder method, column, value)]; raises ValueError for anything not whitelisted
+    filters = []
+    for key, raw in args.items():
+        column, _, op = key.partition('__')
+        op = op or 'eq'
+        if column not in allowed or op not in allowed[column]:
+            raise ValueError('Unsupported filter: {}'.format(key))
+        field = schema.fields[column]
+        try:
+            if op == 'in':
+                value = [_serialize(field.deserialize(v)) for v in raw.split(',') if v != '']
+            else:
+                value = _serialize(field.deserialize(raw))
+        except ValidationError as err:
+            raise ValueError('Invalid value for {}: {}'.format(key, ' '.join(err.messages)))
+        filters.append((OPERATORS[op], column, value))
+    return filters
+
+def apply_filters(query, filters):
+    for method, column, value in filters:
+        query = getattr(query, method)(column, value)
+    return query
+
+# In-memory counterpart of apply_filters, for rows that did not come from a query
+MATCHERS = {
+    'eq': lambda v, x: v == x,
+    'in_': lambda v, x: v in x,
+    'gt': lambda v, x: v is not None and v > x,
+    'gte': lambda v, x: v is not None and v >= x,
+    'lt': lambda v, x: v is not None and v < x,
+    'lte': lambda v, x: v is not None and v <= x,
+}
+
+def match_filters(row, filters):
+    return all(MATCHERS[method](row.get(column), value) for method, column, value in filters)
+
+def _serialize(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
@@ -0,0 +1,77 @@
+import functools
+import hashlib
+import os
+from flask import request, jsonify, make_response
+from services.cache import get_cache, MISSING
+from services.auth_cache import current_user_id
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+# Completed responses are replayed for this long; clients must not reuse a key after it
+IDEMPOTENCY_TTL = float(os.environ.get('IDEMPOTENCY_TTL', 86400))
+IDEMPOTENCY_MAXSIZE = int(os.environ.get('IDEMPOTENCY_MAXSIZE', 50000))
+# A request that dies mid-flight (worker killed) releases its key after this long
+PENDING_TTL = 120
+# Conflicts and rate limiting are transient, so retrying them must run the request again
+UNCACHED_STATUSES = (409, 429)
+
+_store = get_cache('idempotency', maxsize=IDEMPOTENCY_MAXSIZE, ttl=IDEMPOTENCY_TTL)
+
+def _scope():
+    # Keys are scoped to the authenticated user and the route, so two clients that pick
+    # the same key do not see each other's responses, while a retry after refreshing the
+    # token still replays. Without a resolved user the credentials themselves scope it.
+    user_id = current_user_id()
+    principal = 'user:{}'.format(user_id) if user_id is not None else 'auth:' + request.headers.get('Authorization', '')
+    return hashlib.sha256('\0'.join((principal, request.method, request.path, request.headers[IDEMPOTENCY_HEADER])).encode('utf-8')).hexdigest()
+
+def idempotent(view):
+    # Requests carrying an Idempotency-Key run once; repeats get the stored response
+    # (marked Idempotent-Replayed: true). Reusing a key with a different body is a 422,
+    # and a repeat that arrives while the first is still running is a 409. Server errors
+    # are not stored, so the request can be retried with the same key.
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if key is None:
+            return view(*args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return jsonify({'error': '{} must be 1-{} characters'.format(IDEMPOTENCY_HEADER, MAX_KEY_LENGTH)}), 400
+        scope = _scope()
+        fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+        if not _store.add(scope, {'state': 'pending', 'fingerprint': fingerprint}, ttl=PENDING_TTL):
+            entry = _store.get(scope)
+            if entry is MISSING:
+                # Expired between the two calls; the client's retry will claim it
+                return _conflict()
+            if entry['fingerprint'] != fingerprint:
+                return jsonify({'error': '{} was already used with a different request'.format(IDEMPOTENCY_HEADER)}), 422
+            if entry['state'] == 'pending':
+                return _conflict()
+            response = make_response(entry['body'], entry['status'])
+            response.headers['Content-Type'] = entry['content_type']
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            _store.delete(scope)
+            raise
+        if response.status_code >= 500 or response.status_code in UNCACHED_STATUSES:
+            _store.delete(scope)
+        else:
+            _store.set(scope, {
+                'state': 'done',
+                'fingerprint': fingerprint,
+                'status': response.status_code,
+                'content_type': response.content_type,
+                'body': response.get_data(),
+            })
+        return response
+    return wrapper
+
+def _conflict():
+    response = jsonify({'error': 'A request with this {} is still in progress'.format(IDEMPOTENCY_HEADER)})
+    response.status_code = 409
+    response.headers['Retry-After'] = '1'
+    return response
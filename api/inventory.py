@@ -1,39 +1,102 @@
-from flask import Blueprint, request, jsonify
-from supabase_client import supabase
+import time
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
+from services.db import supabase
 from marshmallow import ValidationError
 from schemas.inventory import InventorySchema
 from schemas.stock_movement import StockMovementSchema
 from auth import require_auth, require_role
+from api.idempotency import idempotent
+from services.movements import apply_movements, rebuild_balances, InsufficientStock
+from api.pagination import parse_page_args, filter_args, list_response, DEFAULT_LIMIT, MAX_LIMIT
+from api.encoding import parse_format, columnar, encoded_response
+from api.filters import parse_filters, apply_filters, match_filters, INVENTORY_FILTERS, MOVEMENT_FILTERS
+from services.snapshots import take_snapshot, balances_as_of
+from services import jobs
+from api.jobs import wants_async, accepted
+from services.change_feed import feed
 
 inventory_bp = Blueprint('inventory', __name__)
 inventory_schema = InventorySchema()
 movement_schema = StockMovementSchema()
 
+# Change feed: an SSE stream is closed after STREAM_SECONDS so worker threads are
+# recycled (EventSource reconnects with Last-Event-ID); long polls wait at most MAX_WAIT
+STREAM_SECONDS = 300
+HEARTBEAT_SECONDS = 15
+MAX_WAIT = 30
+
+jobs.register('rebuild_balances', lambda payload, progress: {'rebuilt': rebuild_balances()}, concurrency=1, max_attempts=3)
+
 @inventory_bp.route('/', methods=['GET'])
 @require_auth
 def get_inventory():
-    # Filters: product_id, warehouse_id, bin_id, batch_id, serial_number
-    filters = request.args.to_dict()
-    query = supabase.table('inventory').select('*')
-    for k, v in filters.items():
-        query = query.eq(k, v)
-    resp = query.execute()
-    return jsonify(resp.data or [])
+    # Filters: product_id, warehouse_id, bin_id, batch_id, serial_number (eq or __in)
+    try:
+        page = parse_page_args(inventory_schema)
+        filters = parse_filters(filter_args(), INVENTORY_FILTERS, inventory_schema)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return list_response(lambda: apply_filters(supabase.table('inventory').select(page.columns), filters), page)
 
 @inventory_bp.route('/movements', methods=['GET'])
 @require_auth
 def get_movements():
-    # Filters: product_id, warehouse_id, movement_type, date range
-    filters = request.args.to_dict()
-    query = supabase.table('stock_movements').select('*')
-    for k, v in filters.items():
-        query = query.eq(k, v)
-    resp = query.execute()
-    return jsonify(resp.data or [])
+    # Filters: product_id, warehouse_id, movement_type (eq or __in), ref_type, ref_id,
+    # user_id, created_at__gte/__gt/__lte/__lt
+    try:
+        page = parse_page_args(movement_schema)
+        filters = parse_filters(filter_args(), MOVEMENT_FILTERS, movement_schema)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return list_response(lambda: apply_filters(supabase.table('stock_movements').select(page.columns), filters), page)
+
+@inventory_bp.route('/as-of', methods=['GET'])
+@require_auth
+def get_inventory_as_of():
+    # Balances at ?at=<ISO timestamp>, narrowed by the same location filters as /inventory.
+    # Paged by product: ?after_id=<last product id seen>&limit=<products per page>, with
+    # the next cursor in next_after_id and X-Next-After-Id
+    args = filter_args()
+    try:
+        after_id = int(request.args['after_id']) if request.args.get('after_id') else None
+        limit = int(request.args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        return jsonify({'error': 'after_id and limit must be integers'}), 400
+    if not 1 <= limit <= MAX_LIMIT:
+        return jsonify({'error': 'limit must be between 1 and {}'.format(MAX_LIMIT)}), 400
+    try:
+        at = movement_schema.fields['created_at'].deserialize(args.pop('at', None)).isoformat()
+    except ValidationError:
+        return jsonify({'error': 'at must be an ISO 8601 timestamp'}), 400
+    try:
+        filters = parse_filters(args, INVENTORY_FILTERS, inventory_schema)
+        fmt = parse_format()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        result = balances_as_of(at, lambda query: apply_filters(query, filters), after_id, limit)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    if fmt != 'json':
+        result['balances'] = columnar(result['balances'])
+    response = encoded_response(result, fmt)
+    if result['next_after_id'] is not None:
+        response.headers['X-Next-After-Id'] = str(result['next_after_id'])
+    return response
+
+@inventory_bp.route('/snapshots', methods=['POST'])
+@require_auth
+@require_role('admin')
+def create_snapshot():
+    try:
+        return jsonify(take_snapshot()), 201
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
 @inventory_bp.route('/move', methods=['POST'])
 @require_auth
 @require_role('admin', 'warehouse')
+@idempotent
 def create_movement():
     json_data = request.get_json()
     if not json_data:
@@ -42,14 +105,75 @@ def create_movement():
         movement = movement_schema.load(json_data)
     except ValidationError as err:
         return jsonify({'error': err.messages}), 422
-    # Negative stock prevention
-    if movement['movement_type'] in ['sale', 'transfer_out', 'damage', 'adjustment']:
-        inv_resp = supabase.table('inventory').select('qty_on_hand').eq('product_id', movement['product_id']).eq('warehouse_id', movement['warehouse_id']).single().execute()
-        inv = inv_resp.data
-        if not inv or inv['qty_on_hand'] < movement['quantity']:
-            return jsonify({'error': 'Insufficient stock'}), 400
-    # Insert movement
-    result = supabase.table('stock_movements').insert(movement).execute()
-    # Update inventory (simplified, real logic should aggregate movements)
-    # ...
-    return jsonify(result.data[0]), 201
+    # Insert movement and update the inventory balance atomically; outbound
+    # movements fail with InsufficientStock instead of going negative
+    try:
+        result = apply_movements([movement])
+    except InsufficientStock:
+        return jsonify({'error': 'Insufficient stock'}), 400
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    # An outbound movement drawn from several bins/batches is split per location
+    return jsonify(result[0] if len(result) == 1 else result), 201
+
+@inventory_bp.route('/rebuild', methods=['POST'])
+@require_auth
+@require_role('admin')
+def rebuild_inventory():
+    if wants_async():
+        return accepted(jobs.enqueue('rebuild_balances', {}))
+    try:
+        rebuilt = rebuild_balances()
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    return jsonify({'rebuilt': rebuilt}), 200
+
+@inventory_bp.route('/changes', methods=['GET'])
+@require_auth
+def get_changes():
+    # Balance deltas ({location, movement_type, deltas}) as movements are posted, so
+    # clients can patch their copy of /inventory instead of reloading it. With
+    # Accept: text/event-stream this is an SSE stream; otherwise it long-polls for up to
+    # ?wait seconds and returns {'events', 'last_id'}. Resume from Last-Event-ID or
+    # ?after_id (default: only new changes). Filters as /inventory.
+    args = filter_args()
+    wait = args.pop('wait', 0)
+    try:
+        cursor = request.headers.get('Last-Event-ID', request.args.get('after_id'))
+        cursor = int(cursor) if cursor is not None else None
+        wait = min(float(wait), MAX_WAIT)
+    except ValueError:
+        return jsonify({'error': 'after_id, Last-Event-ID and wait must be numbers'}), 400
+    try:
+        filters = parse_filters(args, INVENTORY_FILTERS, inventory_schema)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        if cursor is None:
+            cursor = feed.head()
+        if request.accept_mimetypes.best == 'text/event-stream':
+            return Response(stream_with_context(_event_stream(cursor, filters)), mimetype='text/event-stream',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+        events = feed.since(cursor)
+        if not events and wait > 0 and feed.wait(cursor, wait):
+            events = feed.since(cursor)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    last_id = events[-1]['id'] if events else cursor
+    return jsonify({'events': [e for e in events if match_filters(e, filters)], 'last_id': last_id})
+
+def _event_stream(cursor, filters):
+    dumps = current_app.json.dumps
+    deadline = time.monotonic() + STREAM_SECONDS
+    yield 'retry: 3000\n\n'
+    while time.monotonic() < deadline:
+        events = feed.since(cursor)
+        if events:
+            for event in events:
+                if match_filters(event, filters):
+                    yield 'id: {}\nevent: delta\ndata: {}\n\n'.format(event['id'], dumps(event))
+            cursor = events[-1]['id']
+        elif not feed.wait(cursor, HEARTBEAT_SECONDS):
+            # An id-only message moves the client's Last-Event-ID past filtered-out
+            # movements without dispatching an event
+            yield 'id: {}\n\n'.format(cursor)
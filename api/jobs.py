@@ -0,0 +1,39 @@
+from flask import Blueprint, request, jsonify, url_for
+from auth import require_auth
+from services.jobs import get_job, start_workers
+from services.auth_cache import current_user_id, current_roles
+
+jobs_bp = Blueprint('jobs', __name__)
+
+# Routes that can run in the background do so when the client sends
+# `Prefer: respond-async` or the request is over the route's size threshold
+ASYNC_LINE_THRESHOLD = 200
+ASYNC_BYTES_THRESHOLD = 1 << 20
+
+def wants_async(size=0, threshold=ASYNC_LINE_THRESHOLD):
+    prefer = [p.strip() for p in request.headers.get('Prefer', '').split(',')]
+    return 'respond-async' in prefer or size > threshold
+
+def accepted(job_id):
+    location = url_for('jobs.get_job_status', job_id=job_id)
+    response = jsonify({'job_id': job_id, 'status_url': location})
+    response.status_code = 202
+    response.headers['Location'] = location
+    response.headers['Preference-Applied'] = 'respond-async'
+    return response
+
+@jobs_bp.route('/<job_id>', methods=['GET'])
+@require_auth
+def get_job_status(job_id):
+    # state is queued, running, succeeded or failed; result holds the route's response body.
+    # Only the user who enqueued the job (or an admin) can see it; anyone else gets a 404.
+    start_workers()
+    try:
+        job = get_job(job_id)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    user_id = current_user_id()
+    owner = None if user_id is None else str(user_id)
+    if not job or (job['user_id'] != owner and 'admin' not in current_roles()):
+        return jsonify({'error': 'Not found'}), 404
+    return jsonify(job)
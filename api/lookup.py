@@ -0,0 +1,50 @@
+from flask import Blueprint, request, jsonify
+from auth import require_auth, require_role
+from services.lookup import index
+
+lookup_bp = Blueprint('lookup', __name__)
+
+MAX_BATCH = 500
+
+@lookup_bp.route('/<path:code>', methods=['GET'])
+@require_auth
+def lookup_code(code):
+    # Resolves a barcode, variant SKU or product SKU from the in-memory index
+    try:
+        match = index.lookup(code)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    if not match:
+        return jsonify({'error': 'Not found', 'code': code}), 404
+    return jsonify(match)
+
+@lookup_bp.route('/batch', methods=['POST'])
+@require_auth
+def lookup_batch():
+    # Body: {"codes": [...]}; results are in request order, null for unknown codes
+    json_data = request.get_json()
+    codes = json_data.get('codes') if isinstance(json_data, dict) else None
+    if not isinstance(codes, list) or not all(isinstance(c, (str, int)) for c in codes):
+        return jsonify({'error': 'codes must be a list of strings'}), 400
+    if len(codes) > MAX_BATCH:
+        return jsonify({'error': 'At most {} codes per request'.format(MAX_BATCH)}), 400
+    try:
+        return jsonify({'results': index.lookup_many(codes)})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@lookup_bp.route('/index/stats', methods=['GET'])
+@require_auth
+@require_role('admin')
+def index_stats():
+    return jsonify(index.stats())
+
+@lookup_bp.route('/index/rebuild', methods=['POST'])
+@require_auth
+@require_role('admin')
+def rebuild_index():
+    try:
+        index.rebuild()
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    return jsonify(index.stats()), 200
@@ -0,0 +1,76 @@
+import logging
+import os
+import time
+from flask import Blueprint, Response, g, request
+from auth import require_auth, require_role
+from services import db, cache, auth_cache
+from services.metrics import registry, LATENCY_BUCKETS, COUNT_BUCKETS, ROW_BUCKETS, BYTE_BUCKETS
+
+# Registering this blueprint instruments every request of the app: latency, Supabase
+# round trips, rows and response bytes per route, served at /metrics
+metrics_bp = Blueprint('metrics', __name__)
+
+# Requests slower than this are logged with the list of queries they made
+SLOW_REQUEST_SECONDS = float(os.environ.get('SLOW_REQUEST_SECONDS', 1.0))
+MAX_LOGGED_QUERIES = 50
+
+log = logging.getLogger(__name__)
+
+@metrics_bp.before_app_request
+def start_timer():
+    g.metrics_started = time.perf_counter()
+    g.metrics_queries = db.start_query_log()
+
+@metrics_bp.after_app_request
+def record_request(response):
+    if 'metrics_started' not in g:
+        return response
+    elapsed = time.perf_counter() - g.metrics_started
+    queries = g.metrics_queries
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    labels = (('method', request.method), ('route', route))
+    rows = sum(q['rows'] for q in queries)
+    registry.inc('mls_http_requests_total', 'Requests by route and status', labels + (('status', str(response.status_code)),))
+    registry.observe('mls_http_request_duration_seconds', 'Request latency', labels, elapsed, LATENCY_BUCKETS,
+                     summary='mls_http_request_latency_seconds')
+    registry.observe('mls_db_round_trips_per_request', 'Supabase calls made by one request', labels, len(queries), COUNT_BUCKETS)
+    registry.observe('mls_db_rows_per_request', 'Rows returned by Supabase to one request', labels, rows, ROW_BUCKETS)
+    # Streamed bodies have no known size until sent and are not counted
+    if not response.is_streamed:
+        registry.observe('mls_http_response_bytes', 'Serialized response size', labels,
+                         response.calculate_content_length() or 0, BYTE_BUCKETS)
+    if 'auth_seconds' in g:
+        registry.observe('mls_auth_duration_seconds', 'Time spent authenticating one request', labels,
+                         g.auth_seconds, LATENCY_BUCKETS)
+    if elapsed >= SLOW_REQUEST_SECONDS:
+        log.warning('Slow request %s %s: %.0f ms, %d queries, %d rows: %s', request.method, route, elapsed * 1000,
+                    len(queries), rows, queries[:MAX_LOGGED_QUERIES])
+    response.headers['Server-Timing'] = 'app;dur={:.1f}, db;desc="{} queries"'.format(elapsed * 1000, len(queries))
+    return response
+
+@metrics_bp.teardown_app_request
+def stop_collecting(exc):
+    db.stop_query_log()
+
+@metrics_bp.route('/metrics', methods=['GET'])
+@require_auth
+@require_role('admin')
+def metrics():
+    totals = db.totals()
+    auth = auth_cache.stats()
+    cache_stats = dict(cache.stats(), auth_claims=auth['claims'], auth_roles=auth['roles'])
+    gauges = [
+        ('mls_db_requests_total', 'Supabase HTTP calls', 'counter', [((), totals['requests'])]),
+        ('mls_db_errors_total', 'Supabase calls that failed or returned 4xx/5xx', 'counter', [((), totals['errors'])]),
+        ('mls_db_rows_total', 'Rows returned by Supabase', 'counter', [((), totals['rows'])]),
+        ('mls_db_response_bytes_total', 'Bytes received from Supabase', 'counter', [((), totals['bytes'])]),
+        ('mls_db_seconds_total', 'Time spent in Supabase calls', 'counter', [((), totals['seconds'])]),
+        ('mls_auth_seconds_total', 'Time spent authenticating', 'counter', [((), auth['timing']['seconds'])]),
+        ('mls_cache_hits_total', 'Cache hits', 'counter',
+         [((('cache', name),), s['hits']) for name, s in sorted(cache_stats.items())]),
+        ('mls_cache_misses_total', 'Cache misses', 'counter',
+         [((('cache', name),), s['misses']) for name, s in sorted(cache_stats.items())]),
+        ('mls_cache_entries', 'Entries held by in-process caches', 'gauge',
+         [((('cache', name),), s['size']) for name, s in sorted(cache_stats.items()) if 'size' in s]),
+    ]
+    return Response(registry.render(gauges), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,97 @@
+from collections import namedtuple
+from flask import request, url_for, current_app, Response, stream_with_context
+from api.encoding import parse_format, rows_response
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+STREAM_PAGE_SIZE = 1000
+PAGE_ARGS = ('after_id', 'limit', 'fields', 'stream', 'sort', 'format')
+SORTS = {'id': False, '-id': True}
+STREAM_FORMATS = {'ndjson': 'application/x-ndjson', 'json': 'application/json'}
+
+Page = namedtuple('Page', ['after_id', 'limit', 'columns', 'stream', 'desc', 'format'])
+
+def parse_page_args(schema):
+    # Keyset pagination on id: ?after_id=<last id seen>&limit=<n>&fields=a,b,c&sort=-id
+    # &format=json|columnar|msgpack
+    args = request.args
+    try:
+        after_id = int(args['after_id']) if args.get('after_id') else None
+        limit = int(args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise ValueError('after_id and limit must be integers')
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValueError('limit must be between 1 and {}'.format(MAX_LIMIT))
+    columns = '*'
+    if args.get('fields'):
+        fields = [f.strip() for f in args['fields'].split(',') if f.strip()]
+        unknown = [f for f in fields if f not in schema.fields]
+        if unknown:
+            raise ValueError('Unknown fields: {}'.format(', '.join(unknown)))
+        # id is always selected since it is the cursor
+        columns = ','.join(['id'] + [f for f in fields if f != 'id'])
+    stream = args.get('stream')
+    if stream is None and request.accept_mimetypes.best == STREAM_FORMATS['ndjson']:
+        stream = 'ndjson'
+    if stream is not None and stream not in STREAM_FORMATS:
+        raise ValueError('stream must be one of: {}'.format(', '.join(STREAM_FORMATS)))
+    sort = args.get('sort', 'id')
+    if sort not in SORTS:
+        raise ValueError('sort must be one of: {}'.format(', '.join(SORTS)))
+    fmt = parse_format()
+    if stream is not None and fmt != 'json':
+        raise ValueError('format={} cannot be streamed'.format(fmt))
+    return Page(after_id, limit, columns, stream, SORTS[sort], fmt)
+
+def filter_args():
+    return {k: v for k, v in request.args.to_dict().items() if k not in PAGE_ARGS}
+
+def fetch_page(build_query, after_id, limit, desc=False):
+    # build_query returns a fresh builder; postgrest builders accumulate filters in place
+    query = build_query()
+    if after_id is not None:
+        query = query.lt('id', after_id) if desc else query.gt('id', after_id)
+    return query.order('id', desc=desc).limit(limit).execute().data or []
+
+def list_response(build_query, page):
+    if page.stream:
+        return stream_response(build_query, page)
+    return page_response(fetch_page(build_query, page.after_id, page.limit, page.desc), page)
+
+def iter_rows(build_query, after_id=None, page_size=STREAM_PAGE_SIZE, desc=False):
+    while True:
+        rows = fetch_page(build_query, after_id, page_size, desc)
+        yield from rows
+        if len(rows) < page_size:
+            return
+        after_id = rows[-1]['id']
+
+def stream_response(build_query, page):
+    # Only one page of rows is held in memory at a time
+    dumps = current_app.json.dumps
+    def ndjson():
+        for row in iter_rows(build_query, page.after_id, desc=page.desc):
+            yield dumps(row) + '\n'
+    def json_array():
+        yield '['
+        sep = ''
+        for row in iter_rows(build_query, page.after_id, desc=page.desc):
+            yield sep + dumps(row)
+            sep = ','
+        yield ']'
+    body = ndjson() if page.stream == 'ndjson' else json_array()
+    response = Response(stream_with_context(body), mimetype=STREAM_FORMATS[page.stream])
+    # stream=ndjson can be negotiated from the Accept header
+    response.vary.add('Accept')
+    return response
+
+def page_response(rows, page):
+    resp = rows_response(rows, page.format)
+    if len(rows) == page.limit:
+        next_id = rows[-1]['id']
+        args = dict(request.view_args or {}, **request.args.to_dict())
+        args['after_id'] = next_id
+        resp.headers['X-Next-After-Id'] = str(next_id)
+        resp.headers['Link'] = '<{}>; rel="next"'.format(url_for(request.endpoint, _external=True, **args))
+    resp.add_etag()
+    return resp.make_conditional(request)
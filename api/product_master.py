@@ -1,5 +1,5 @@
 from flask import Blueprint, request, jsonify
-from supabase_client import supabase
+from services.db import supabase
 from marshmallow import ValidationError
 from schemas.product import ProductSchema
 from schemas.product_variant import ProductVariantSchema
@@ -8,16 +8,19 @@ from schemas.unit import UnitSchema
 from schemas.barcode import BarcodeSchema
 from schemas.product_document import ProductDocumentSchema
 from schemas.substitute_item import SubstituteItemSchema
+from schemas.compiled import compile_schema
 from auth import require_auth, require_role
+from services.lookup import index as lookup_index
+from services.search import index as search_index
 
 master_bp = Blueprint('product_master', __name__)
-product_schema = ProductSchema()
-variant_schema = ProductVariantSchema()
-category_schema = CategorySchema()
-unit_schema = UnitSchema()
-barcode_schema = BarcodeSchema()
-document_schema = ProductDocumentSchema()
-substitute_schema = SubstituteItemSchema()
+product_schema = compile_schema(ProductSchema())
+variant_schema = compile_schema(ProductVariantSchema())
+category_schema = compile_schema(CategorySchema())
+unit_schema = compile_schema(UnitSchema())
+barcode_schema = compile_schema(BarcodeSchema())
+document_schema = compile_schema(ProductDocumentSchema())
+substitute_schema = compile_schema(SubstituteItemSchema())
 
 # Example: Create product with variants, categories, units, barcodes, documents, substitutes
 @master_bp.route('/products', methods=['POST'])
@@ -29,32 +32,57 @@ def create_product_master():
         return jsonify({'error': 'No input data provided'}), 400
     try:
         product = product_schema.load(json_data.get('product', {}))
-        variants = [variant_schema.load(v) for v in json_data.get('variants', [])]
-        categories = [category_schema.load(c) for c in json_data.get('categories', [])]
-        units = [unit_schema.load(u) for u in json_data.get('units', [])]
-        barcodes = [barcode_schema.load(b) for b in json_data.get('barcodes', [])]
-        documents = [document_schema.load(d) for d in json_data.get('documents', [])]
-        substitutes = [substitute_schema.load(s) for s in json_data.get('substitutes', [])]
+        variants = variant_schema.load(json_data.get('variants', []), many=True)
+        categories = category_schema.load(json_data.get('categories', []), many=True)
+        units = unit_schema.load(json_data.get('units', []), many=True)
+        barcodes = barcode_schema.load(json_data.get('barcodes', []), many=True)
+        documents = document_schema.load(json_data.get('documents', []), many=True)
+        substitutes = substitute_schema.load(json_data.get('substitutes', []), many=True)
     except ValidationError as err:
         return jsonify({'error': err.messages}), 422
     # Insert product
     prod_result = supabase.table('products').insert(product).execute()
     prod_id = prod_result.data[0]['id']
-    # Insert related data
-    for v in variants:
-        v['product_id'] = prod_id
-        supabase.table('product_variants').insert(v).execute()
-    for c in categories:
-        supabase.table('product_categories').insert({'product_id': prod_id, 'category_id': c['id']}).execute()
-    for u in units:
-        supabase.table('product_units').insert({'product_id': prod_id, 'unit_id': u['id'], 'conversion_factor': u.get('conversion_factor', 1.0)}).execute()
-    for b in barcodes:
-        b['product_id'] = prod_id
-        supabase.table('barcodes').insert(b).execute()
-    for d in documents:
-        d['product_id'] = prod_id
-        supabase.table('product_documents').insert(d).execute()
-    for s in substitutes:
-        s['product_id'] = prod_id
-        supabase.table('substitute_items').insert(s).execute()
+    # Insert related data, one bulk insert per table
+    related = {
+        'product_variants': [dict(v, product_id=prod_id) for v in variants],
+        'product_categories': [{'product_id': prod_id, 'category_id': c['id']} for c in categories],
+        'product_units': [{'product_id': prod_id, 'unit_id': u['id'], 'conversion_factor': u.get('conversion_factor', 1.0)} for u in units],
+        'barcodes': [dict(b, product_id=prod_id) for b in barcodes],
+        'product_documents': [dict(d, product_id=prod_id) for d in documents],
+        'substitute_items': [dict(s, product_id=prod_id) for s in substitutes],
+    }
+    related = {table: rows for table, rows in related.items() if rows}
+    try:
+        inserted = _insert_related(related)
+    except Exception as e:
+        _rollback_product(prod_id, related)
+        return jsonify({'error': str(e)}), 500
+    # Scanners and search see the new product right away on this worker
+    lookup_index.add_product(prod_result.data[0])
+    lookup_index.add_variants(inserted.get('product_variants', []))
+    lookup_index.add_barcodes(inserted.get('barcodes', []))
+    search_index.add_product(prod_result.data[0])
+    search_index.add_variants(inserted.get('product_variants', []))
+    search_index.add_categories(inserted.get('product_categories', []))
     return jsonify({'id': prod_id, 'message': 'Product master created'}), 201
+
+def _insert_related(related):
+    # The related tables only depend on the parent product, so they are written
+    # concurrently; returns the inserted rows per table
+    if not related:
+        return {}
+    results = supabase.gather(*(supabase.aio.table(table).insert(rows) for table, rows in related.items()))
+    errors = [r for r in results if isinstance(r, Exception)]
+    if errors:
+        raise errors[0]
+    return {table: result.data for table, result in zip(related, results)}
+
+def _rollback_product(prod_id, related):
+    # No transaction spans PostgREST calls, so compensate by removing whatever was written
+    for table in related:
+        try:
+            supabase.table(table).delete().eq('product_id', prod_id).execute()
+        except Exception:
+            pass
+    supabase.table('products').delete().eq('id', prod_id).execute()
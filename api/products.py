@@ -1,21 +1,74 @@
 
-from flask import Blueprint, request, jsonify
-from supabase_client import supabase
+import csv
+from flask import Blueprint, request, jsonify, url_for
+from services.db import supabase
 from marshmallow import ValidationError
 from schemas.product import ProductSchema
+from schemas.compiled import compile_schema
 from auth import require_auth, require_role
+from api.pagination import parse_page_args, list_response
+from services import auth_cache, cache, catalog
+from services.bulk_import import is_supported, iter_records, import_records, import_file
+from services import jobs
+from services.lookup import index as lookup_index
+from services.search import index as search_index
+from api.jobs import wants_async, accepted, ASYNC_BYTES_THRESHOLD
 
 products_bp = Blueprint('products', __name__)
-product_schema = ProductSchema()
+product_schema = compile_schema(ProductSchema())
+
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+# Ranked results are paged by offset; deep pages mean the query should be narrower
+SEARCH_MAX_OFFSET = 10000
+
+def _import_job(payload, progress):
+    report = import_file(payload['path'], payload['mimetype'], product_schema, 'products', 'sku', progress=progress)
+    lookup_index.refresh_soon()
+    search_index.refresh_soon()
+    return report
+
+jobs.register('products_import', _import_job, max_attempts=3)
 
 @products_bp.route('/', methods=['GET'])
 @require_auth
 def list_products():
     try:
-        resp = supabase.table('products').select('*').eq('is_deleted', False).execute()
-        return jsonify(resp.data or [])
+        page = parse_page_args(product_schema)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        return list_response(lambda: supabase.table('products').select(page.columns).eq('is_deleted', False), page)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@products_bp.route('/search', methods=['GET'])
+@require_auth
+def search_products():
+    # ?q=<text>&limit=<n>&offset=<n>: prefix, substring and typo-tolerant matching over
+    # name, SKU, category names and tags, and variant attributes, best match first
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'q is required'}), 400
+    try:
+        limit = int(request.args.get('limit', SEARCH_DEFAULT_LIMIT))
+        offset = int(request.args.get('offset', 0))
+    except ValueError:
+        return jsonify({'error': 'limit and offset must be integers'}), 400
+    if not 1 <= limit <= SEARCH_MAX_LIMIT:
+        return jsonify({'error': 'limit must be between 1 and {}'.format(SEARCH_MAX_LIMIT)}), 400
+    if not 0 <= offset <= SEARCH_MAX_OFFSET:
+        return jsonify({'error': 'offset must be between 0 and {}'.format(SEARCH_MAX_OFFSET)}), 400
+    try:
+        total, results = search_index.search(query, limit, offset)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+    resp = jsonify(results)
+    resp.headers['X-Total-Count'] = str(total)
+    if offset + limit < total:
+        args = dict(request.args.to_dict(), offset=offset + limit)
+        resp.headers['Link'] = '<{}>; rel="next"'.format(url_for(request.endpoint, _external=True, **args))
+    return resp
 
 @products_bp.route('/', methods=['POST'])
 @require_auth
@@ -30,18 +83,39 @@ def create_product():
         return jsonify({'error': err.messages}), 422
     try:
         result = supabase.table('products').insert(data).execute()
+        lookup_index.add_product(result.data[0])
+        search_index.add_product(result.data[0])
         return jsonify(result.data[0]), 201
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@products_bp.route('/bulk', methods=['POST'])
+@require_auth
+@require_role('admin', 'purchasing')
+def bulk_import_products():
+    # Streams NDJSON or CSV rows and upserts them in batches keyed on sku
+    if not is_supported(request.mimetype):
+        return jsonify({'error': 'Expected text/csv or application/x-ndjson body'}), 415
+    # Large bodies (or Prefer: respond-async) are spooled to disk and imported by a job
+    if wants_async(request.content_length or 0, ASYNC_BYTES_THRESHOLD):
+        path = jobs.spool(request.stream)
+        return accepted(jobs.enqueue('products_import', {'path': path, 'mimetype': request.mimetype}))
+    try:
+        report = import_records(iter_records(request.stream, request.mimetype), product_schema, 'products', 'sku')
+    except (UnicodeDecodeError, csv.Error) as e:
+        return jsonify({'error': str(e)}), 400
+    lookup_index.refresh_soon()
+    search_index.refresh_soon()
+    return jsonify(report), 200
+
 @products_bp.route('/<int:product_id>', methods=['GET'])
 @require_auth
 def get_product(product_id):
     try:
-        resp = supabase.table('products').select('*').eq('id', product_id).eq('is_deleted', False).single().execute()
-        if not resp.data:
+        product = catalog.get_product(product_id)
+        if not product:
             return jsonify({'error': 'Not found'}), 404
-        return jsonify(resp.data)
+        return jsonify(product)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -58,6 +132,9 @@ def update_product(product_id):
         return jsonify({'error': err.messages}), 422
     try:
         result = supabase.table('products').update(data).eq('id', product_id).execute()
+        catalog.invalidate('products', product_id)
+        lookup_index.add_product(result.data[0])
+        search_index.add_product(result.data[0])
         return jsonify(result.data[0])
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -68,6 +145,23 @@ def update_product(product_id):
 def delete_product(product_id):
     try:
         result = supabase.table('products').update({'is_deleted': True}).eq('id', product_id).execute()
+        catalog.invalidate('products', product_id)
+        lookup_index.remove_product(product_id)
+        search_index.remove_product(product_id)
         return jsonify({'deleted': True})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+@products_bp.route('/cache/stats', methods=['GET'])
+@require_auth
+@require_role('admin')
+def cache_stats():
+    # Hit/miss counters for the catalog read caches (products, suppliers, categories, units)
+    # and the verified-token cache, with average auth time per request
+    return jsonify(dict(cache.stats(), auth=auth_cache.stats()))
+
+@products_bp.route('/search/stats', methods=['GET'])
+@require_auth
+@require_role('admin')
+def search_stats():
+    return jsonify(search_index.stats())
@@ -1,49 +1,127 @@
 from flask import Blueprint, request, jsonify
-from supabase_client import supabase
+from services.db import supabase
 from marshmallow import ValidationError
 from schemas.purchase_order import PurchaseOrderSchema
 from schemas.purchase_order_item import PurchaseOrderItemSchema
+from schemas.compiled import compile_schema
 from auth import require_auth, require_role
+from api.idempotency import idempotent
+from api.jobs import wants_async, accepted
+from services import jobs
+from services.movements import movement_payload, post_movements_rpc
+from services.replenishment import run_forecasts, draft_purchase_orders
+from services.auth_cache import current_user_id
 
 purchase_bp = Blueprint('purchase', __name__)
-po_schema = PurchaseOrderSchema()
-po_item_schema = PurchaseOrderItemSchema()
+po_schema = compile_schema(PurchaseOrderSchema())
+po_item_schema = compile_schema(PurchaseOrderItemSchema())
 
 @purchase_bp.route('/orders', methods=['POST'])
 @require_auth
 @require_role('admin', 'purchasing')
+@idempotent
 def create_po():
     json_data = request.get_json()
     if not json_data:
         return jsonify({'error': 'No input data provided'}), 400
+    # The order is recorded as created by the caller; items get order_id once it exists
+    order = dict(json_data.get('order') or {})
+    user_id = current_user_id()
+    if user_id is not None:
+        order['created_by'] = user_id
     try:
-        po = po_schema.load(json_data.get('order', {}))
-        items = [po_item_schema.load(i) for i in json_data.get('items', [])]
+        po = po_schema.load(order)
+        items = po_item_schema.load(json_data.get('items', []), many=True, partial=('order_id',))
     except ValidationError as err:
         return jsonify({'error': err.messages}), 422
     po_result = supabase.table('purchase_orders').insert(po).execute()
     po_id = po_result.data[0]['id']
-    for item in items:
-        item['order_id'] = po_id
-        supabase.table('purchase_order_items').insert(item).execute()
+    if items:
+        supabase.table('purchase_order_items').insert([dict(item, order_id=po_id) for item in items]).execute()
     return jsonify({'id': po_id, 'message': 'PO created'}), 201
 
 @purchase_bp.route('/orders/<int:order_id>/receive', methods=['POST'])
 @require_auth
 @require_role('admin', 'warehouse')
+@idempotent
 def receive_po(order_id):
     json_data = request.get_json()
-    received_items = json_data.get('items', [])
-    for ritem in received_items:
-        item_resp = supabase.table('purchase_order_items').select('*').eq('id', ritem['id']).single().execute()
-        item = item_resp.data
-        if not item:
-            continue
-        new_qty = item['received_quantity'] + ritem['received_quantity']
-        over_receipt = new_qty > item['quantity']
-        supabase.table('purchase_order_items').update({
-            'received_quantity': new_qty,
-            'over_receipt': over_receipt
-        }).eq('id', item['id']).execute()
-    supabase.table('purchase_orders').update({'status': 'received'}).eq('id', order_id).execute()
-    return jsonify({'id': order_id, 'message': 'PO received'}), 200
+    if not json_data:
+        return jsonify({'error': 'No input data provided'}), 400
+    if wants_async(len(json_data.get('items', []))):
+        return accepted(jobs.enqueue('po_receive', {'order_id': order_id, 'data': json_data}))
+    try:
+        return jsonify(receive_order(order_id, json_data)), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def receive_order(order_id, json_data, progress=None):
+    # Shared by the route and the po_receive job; raises ValueError for bad input. The
+    # stock movements, line quantities and order status are written in one transaction
+    # (receive_purchase_order, migrations/008).
+    received = {}
+    for ritem in json_data.get('items', []):
+        qty = ritem.get('received_quantity') if isinstance(ritem, dict) else None
+        if (not isinstance(ritem, dict) or not isinstance(ritem.get('id'), int) or isinstance(ritem['id'], bool)
+                or not isinstance(qty, (int, float)) or isinstance(qty, bool)):
+            raise ValueError('Each item needs an integer id and a numeric received_quantity')
+        received.setdefault(ritem['id'], []).append(ritem)
+    # One query for every referenced line instead of one per line
+    items = []
+    if received:
+        items_resp = supabase.table('purchase_order_items').select('id,product_id').in_('id', list(received)).eq('order_id', order_id).execute()
+        items = items_resp.data or []
+    lines, movements = [], []
+    for item in items:
+        for ritem in received[item['id']]:
+            warehouse_id = ritem.get('warehouse_id', json_data.get('warehouse_id'))
+            if warehouse_id is None:
+                raise ValueError('warehouse_id is required')
+            lines.append({'id': item['id'], 'received_quantity': ritem['received_quantity']})
+            movements.append({
+                'product_id': item['product_id'],
+                'warehouse_id': warehouse_id,
+                'bin_id': ritem.get('bin_id'),
+                'batch_id': ritem.get('batch_id'),
+                'movement_type': 'purchase',
+                'quantity': ritem['received_quantity'],
+                'ref_type': 'purchase_order',
+                'ref_id': order_id,
+            })
+    payload = [dict(line, **posting) for line, posting in zip(lines, movement_payload(movements))]
+    post_movements_rpc('receive_purchase_order', {'p_order_id': order_id, 'p_lines': payload})
+    if progress:
+        progress(len(movements), len(movements))
+    return {'id': order_id, 'message': 'PO received'}
+
+# Posting stock is not idempotent, so a failed receipt job is not retried automatically
+jobs.register('po_receive', lambda payload, progress: receive_order(payload['order_id'], payload['data'], progress),
+              concurrency=2, max_attempts=1)
+
+@purchase_bp.route('/replenishment', methods=['GET'])
+@require_auth
+@require_role('admin', 'purchasing')
+def get_replenishment():
+    # Draft purchase orders from the stored forecasts; each draft can be reviewed and
+    # posted to /orders as is
+    try:
+        supplier_id = request.args.get('supplier_id', type=int)
+        return jsonify(draft_purchase_orders(supplier_id, current_user_id()))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@purchase_bp.route('/replenishment/run', methods=['POST'])
+@require_auth
+@require_role('admin')
+def run_replenishment():
+    # Recomputes forecasts for products with new movements (?full=true for all products)
+    full = request.args.get('full') == 'true'
+    try:
+        recomputed = run_forecasts(full=full, method=request.args.get('method', 'exp_smoothing'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    return jsonify({'recomputed': recomputed}), 200
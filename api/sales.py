@@ -1,31 +1,34 @@
 from flask import Blueprint, request, jsonify
-from supabase_client import supabase
+from services.db import supabase
 from marshmallow import ValidationError
 from schemas.sales_order import SalesOrderSchema
 from schemas.sales_order_item import SalesOrderItemSchema
+from schemas.compiled import compile_schema
 from auth import require_auth, require_role
+from api.idempotency import idempotent
+from services.movements import movement_payload, post_movements_rpc, InsufficientStock
 
 sales_bp = Blueprint('sales', __name__)
-so_schema = SalesOrderSchema()
-so_item_schema = SalesOrderItemSchema()
+so_schema = compile_schema(SalesOrderSchema())
+so_item_schema = compile_schema(SalesOrderItemSchema())
 
 @sales_bp.route('/orders', methods=['POST'])
 @require_auth
 @require_role('admin', 'sales')
+@idempotent
 def create_so():
     json_data = request.get_json()
     if not json_data:
         return jsonify({'error': 'No input data provided'}), 400
     try:
         so = so_schema.load(json_data.get('order', {}))
-        items = [so_item_schema.load(i) for i in json_data.get('items', [])]
+        items = so_item_schema.load(json_data.get('items', []), many=True)
     except ValidationError as err:
         return jsonify({'error': err.messages}), 422
     so_result = supabase.table('sales_orders').insert(so).execute()
     so_id = so_result.data[0]['id']
-    for item in items:
-        item['order_id'] = so_id
-        supabase.table('sales_order_items').insert(item).execute()
+    if items:
+        supabase.table('sales_order_items').insert([dict(item, order_id=so_id) for item in items]).execute()
     return jsonify({'id': so_id, 'message': 'SO created'}), 201
 
 @sales_bp.route('/orders/<int:order_id>/ship', methods=['POST'])
@@ -33,16 +36,14 @@ def create_so():
 @require_role('admin', 'warehouse')
 def ship_so(order_id):
     json_data = request.get_json()
-    shipped_items = json_data.get('items', [])
-    for sitem in shipped_items:
-        item_resp = supabase.table('sales_order_items').select('*').eq('id', sitem['id']).single().execute()
-        item = item_resp.data
-        if not item:
-            continue
-        supabase.table('sales_order_items').update({
-            'shipped': True
-        }).eq('id', item['id']).execute()
-    supabase.table('sales_orders').update({'status': 'shipped'}).eq('id', order_id).execute()
+    if not json_data:
+        return jsonify({'error': 'No input data provided'}), 400
+    try:
+        _post_lines(order_id, json_data, 'shipped', 'sale')
+    except InsufficientStock:
+        return jsonify({'error': 'Insufficient stock'}), 400
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     return jsonify({'id': order_id, 'message': 'SO shipped'}), 200
 
 @sales_bp.route('/orders/<int:order_id>/return', methods=['POST'])
@@ -50,14 +51,49 @@ def ship_so(order_id):
 @require_role('admin', 'sales')
 def return_so(order_id):
     json_data = request.get_json()
-    returned_items = json_data.get('items', [])
-    for ritem in returned_items:
-        item_resp = supabase.table('sales_order_items').select('*').eq('id', ritem['id']).single().execute()
-        item = item_resp.data
-        if not item:
-            continue
-        supabase.table('sales_order_items').update({
-            'returned': True
-        }).eq('id', item['id']).execute()
-    supabase.table('sales_orders').update({'status': 'returned'}).eq('id', order_id).execute()
+    if not json_data:
+        return jsonify({'error': 'No input data provided'}), 400
+    try:
+        _post_lines(order_id, json_data, 'returned', 'return')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     return jsonify({'id': order_id, 'message': 'SO returned'}), 200
+
+def _post_lines(order_id, json_data, flag, movement_type):
+    # Marks the requested lines with flag and posts their stock movements using one
+    # select and one RPC (post_sales_order_lines, migrations/008), which flags the lines,
+    # posts the movements and sets the order status in one transaction. Lines already
+    # flagged are skipped there, so a repeated request does not move stock twice. Lines
+    # are posted whole; a quantity other than the line's is rejected.
+    requested = {}
+    for line in json_data.get('items', []):
+        if not isinstance(line, dict) or not isinstance(line.get('id'), int) or isinstance(line['id'], bool):
+            raise ValueError('Each item needs an integer id')
+        requested[line['id']] = line
+    items = []
+    if requested:
+        items_resp = supabase.table('sales_order_items').select('id,product_id,quantity,' + flag).in_('id', list(requested)).eq('order_id', order_id).execute()
+        items = items_resp.data or []
+    lines, movements = [], []
+    for item in items:
+        if item[flag]:
+            continue
+        line = requested[item['id']]
+        if 'quantity' in line and line['quantity'] != item['quantity']:
+            raise ValueError('Line {} must be {} in full (quantity {})'.format(item['id'], flag, item['quantity']))
+        warehouse_id = line.get('warehouse_id', json_data.get('warehouse_id'))
+        if warehouse_id is None:
+            raise ValueError('warehouse_id is required')
+        lines.append({'id': item['id']})
+        movements.append({
+            'product_id': item['product_id'],
+            'warehouse_id': warehouse_id,
+            'bin_id': line.get('bin_id'),
+            'batch_id': line.get('batch_id'),
+            'movement_type': movement_type,
+            'quantity': item['quantity'],
+            'ref_type': 'sales_order',
+            'ref_id': order_id,
+        })
+    payload = [dict(line, **posting) for line, posting in zip(lines, movement_payload(movements))]
+    post_movements_rpc('post_sales_order_lines', {'p_order_id': order_id, 'p_lines': payload, 'p_flag': flag})
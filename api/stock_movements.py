@@ -1,8 +1,9 @@
 from flask import Blueprint, request, jsonify
-from supabase_client import supabase
 from marshmallow import ValidationError
 from schemas.stock_movement import StockMovementSchema
 from auth import require_auth, require_role
+from api.idempotency import idempotent
+from services.movements import apply_movements, InsufficientStock
 
 movements_bp = Blueprint('stock_movements', __name__)
 movement_schema = StockMovementSchema()
@@ -10,6 +11,7 @@ movement_schema = StockMovementSchema()
 @movements_bp.route('/', methods=['POST'])
 @require_auth
 @require_role('admin', 'warehouse')
+@idempotent
 def create_movement():
     json_data = request.get_json()
     if not json_data:
@@ -28,8 +30,13 @@ def create_movement():
     # Approval required for reversal
     if movement['movement_type'] == 'reversal' and not movement.get('approved_by'):
         return jsonify({'error': 'Reversal requires approval'}), 403
-    # Insert movement
-    result = supabase.table('stock_movements').insert(movement).execute()
-    # Update inventory (simplified)
-    # ...
-    return jsonify(result.data[0]), 201
+    # Insert movement and update the inventory balance atomically
+    try:
+        result = apply_movements([movement])
+    except InsufficientStock:
+        return jsonify({'error': 'Insufficient stock'}), 400
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    # An outbound movement drawn from several bins/batches is split per location
+    return jsonify(result[0] if len(result) == 1 else result), 201
+
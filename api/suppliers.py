@@ -1,19 +1,32 @@
 
+import csv
 from flask import Blueprint, request, jsonify
-from supabase_client import supabase
+from services.db import supabase
 from marshmallow import ValidationError
 from schemas.supplier import SupplierSchema
+from schemas.compiled import compile_schema
 from auth import require_auth, require_role
+from api.pagination import parse_page_args, list_response
+from services import catalog
+from services.bulk_import import is_supported, iter_records, import_records, import_file
+from services import jobs
+from api.jobs import wants_async, accepted, ASYNC_BYTES_THRESHOLD
 
 suppliers_bp = Blueprint('suppliers', __name__)
-supplier_schema = SupplierSchema()
+supplier_schema = compile_schema(SupplierSchema())
+
+jobs.register('suppliers_import', lambda payload, progress: import_file(
+    payload['path'], payload['mimetype'], supplier_schema, 'suppliers', 'name', progress=progress), max_attempts=3)
 
 @suppliers_bp.route('/', methods=['GET'])
 @require_auth
 def list_suppliers():
     try:
-        resp = supabase.table('suppliers').select('*').eq('is_deleted', False).execute()
-        return jsonify(resp.data or [])
+        page = parse_page_args(supplier_schema)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        return list_response(lambda: supabase.table('suppliers').select(page.columns).eq('is_deleted', False), page)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -34,14 +47,31 @@ def create_supplier():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@suppliers_bp.route('/bulk', methods=['POST'])
+@require_auth
+@require_role('admin', 'purchasing')
+def bulk_import_suppliers():
+    # Streams NDJSON or CSV rows and upserts them in batches keyed on name
+    if not is_supported(request.mimetype):
+        return jsonify({'error': 'Expected text/csv or application/x-ndjson body'}), 415
+    # Large bodies (or Prefer: respond-async) are spooled to disk and imported by a job
+    if wants_async(request.content_length or 0, ASYNC_BYTES_THRESHOLD):
+        path = jobs.spool(request.stream)
+        return accepted(jobs.enqueue('suppliers_import', {'path': path, 'mimetype': request.mimetype}))
+    try:
+        report = import_records(iter_records(request.stream, request.mimetype), supplier_schema, 'suppliers', 'name')
+    except (UnicodeDecodeError, csv.Error) as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(report), 200
+
 @suppliers_bp.route('/<int:supplier_id>', methods=['GET'])
 @require_auth
 def get_supplier(supplier_id):
     try:
-        resp = supabase.table('suppliers').select('*').eq('id', supplier_id).eq('is_deleted', False).single().execute()
-        if not resp.data:
+        supplier = catalog.get_supplier(supplier_id)
+        if not supplier:
             return jsonify({'error': 'Not found'}), 404
-        return jsonify(resp.data)
+        return jsonify(supplier)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -58,6 +88,7 @@ def update_supplier(supplier_id):
         return jsonify({'error': err.messages}), 422
     try:
         result = supabase.table('suppliers').update(data).eq('id', supplier_id).execute()
+        catalog.invalidate('suppliers', supplier_id)
         return jsonify(result.data[0])
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -68,6 +99,7 @@ def update_supplier(supplier_id):
 def delete_supplier(supplier_id):
     try:
         result = supabase.table('suppliers').update({'is_deleted': True}).eq('id', supplier_id).execute()
+        catalog.invalidate('suppliers', supplier_id)
         return jsonify({'deleted': True})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
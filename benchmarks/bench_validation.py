@@ -0,0 +1,40 @@
+# Compares per-item Schema.load (the old request path), Schema.load(many=True) and the
+# compiled schema on order-line and variant payloads.
+#
+#   python -m benchmarks.bench_validation
+import timeit
+from schemas.compiled import compile_schema
+from schemas.purchase_order_item import PurchaseOrderItemSchema
+from schemas.product_variant import ProductVariantSchema
+
+SIZES = (1000, 10000)
+REPEAT = 5
+
+def po_items(n):
+    return [{'order_id': 1, 'product_id': i, 'quantity': 5, 'unit_price': 9.99, 'notes': 'line {}'.format(i)}
+            for i in range(n)]
+
+def variants(n):
+    return [{'product_id': 1, 'sku': 'SKU-{}'.format(i), 'attributes': {'size': 'M', 'color': 'Red'}, 'status': 'active'}
+            for i in range(n)]
+
+def bench(label, schema_cls, make):
+    schema = schema_cls()
+    compiled = compile_schema(schema_cls())
+    for n in SIZES:
+        payload = make(n)
+        assert compiled.load(payload, many=True) == schema.load(payload, many=True)
+        cases = (
+            ('per-item load', lambda: [schema.load(i) for i in payload]),
+            ('many=True', lambda: schema.load(payload, many=True)),
+            ('compiled', lambda: compiled.load(payload, many=True)),
+        )
+        baseline = None
+        for name, fn in cases:
+            best = min(timeit.repeat(fn, number=1, repeat=REPEAT))
+            baseline = baseline or best
+            print('{:<14} n={:<6} {:<14} {:8.2f} ms  {:5.1f}x'.format(label, n, name, best * 1000, baseline / best))
+
+if __name__ == '__main__':
+    bench('po_items', PurchaseOrderItemSchema, po_items)
+    bench('variants', ProductVariantSchema, variants)
@@ -0,0 +1,294 @@
+# In-process stand-in for services.db.supabase used by the benchmark harness and the
+# round-trip budget tests. It keeps tables as lists of dicts, implements the slice of
+# the PostgREST query builder the blueprints use, counts every execute() as one round
+# trip and can sleep to simulate network latency.
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from postgrest.exceptions import APIError
+
+class Result:
+    def __init__(self, data):
+        self.data = data
+
+class Query:
+    def __init__(self, db, table):
+        self.db = db
+        self.table_name = table
+        self.filters = []
+        self.columns = None
+        self.action = 'select'
+        self.payload = None
+        self.on_conflict = 'id'
+        self.ordering = []
+        self.row_limit = None
+        self.one = False
+
+    def select(self, columns='*', **kwargs):
+        self.columns = None if columns == '*' else [c.strip() for c in columns.split(',')]
+        return self
+
+    def _filter(self, column, test):
+        self.filters.append(lambda row: test(row.get(column)))
+        return self
+
+    def eq(self, column, value):
+        return self._filter(column, lambda v: v == value)
+
+    def neq(self, column, value):
+        return self._filter(column, lambda v: v != value)
+
+    def gt(self, column, value):
+        return self._filter(column, lambda v: v is not None and v > value)
+
+    def gte(self, column, value):
+        return self._filter(column, lambda v: v is not None and v >= value)
+
+    def lt(self, column, value):
+        return self._filter(column, lambda v: v is not None and v < value)
+
+    def lte(self, column, value):
+        return self._filter(column, lambda v: v is not None and v <= value)
+
+    def in_(self, column, values):
+        values = set(values)
+        return self._filter(column, lambda v: v in values)
+
+    def is_(self, column, value):
+        return self._filter(column, lambda v: v is None if value in (None, 'null') else v == value)
+
+    def order(self, column, desc=False, **kwargs):
+        self.ordering.append((column, desc))
+        return self
+
+    def limit(self, count, **kwargs):
+        self.row_limit = count
+        return self
+
+    def single(self):
+        self.one = True
+        self.row_limit = 1
+        return self
+
+    maybe_single = single
+
+    def insert(self, rows, **kwargs):
+        self.action, self.payload = 'insert', rows
+        return self
+
+    def upsert(self, rows, on_conflict='id', **kwargs):
+        self.action, self.payload, self.on_conflict = 'upsert', rows, on_conflict
+        return self
+
+    def update(self, values, **kwargs):
+        self.action, self.payload = 'update', values
+        return self
+
+    def delete(self, **kwargs):
+        self.action = 'delete'
+        return self
+
+    def execute(self):
+        self.db.round_trip()
+        with self.db.lock:
+            data = getattr(self, '_' + self.action)(self.db.tables.setdefault(self.table_name, []))
+        if self.one:
+            return Result(data[0] if data else None)
+        return Result(data)
+
+    def _matches(self, rows):
+        return [row for row in rows if all(f(row) for f in self.filters)]
+
+    def _select(self, rows):
+        rows = self._matches(rows)
+        for column, desc in reversed(self.ordering):
+            rows = sorted(rows, key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+        if self.row_limit is not None:
+            rows = rows[:self.row_limit]
+        if self.columns:
+            return [{c: row.get(c) for c in self.columns} for row in rows]
+        return [dict(row) for row in rows]
+
+    def _insert(self, rows):
+        out = []
+        for item in self.payload if isinstance(self.payload, list) else [self.payload]:
+            row = dict(item, id=next(self.db.ids))
+            rows.append(row)
+            out.append(dict(row))
+        return out
+
+    def _upsert(self, rows):
+        keys = self.on_conflict.split(',')
+        index = {tuple(row.get(k) for k in keys): row for row in rows}
+        out = []
+        for item in self.payload if isinstance(self.payload, list) else [self.payload]:
+            existing = index.get(tuple(item.get(k) for k in keys))
+            if existing is None:
+                existing = dict(item, id=item.get('id') or next(self.db.ids))
+                rows.append(existing)
+                index[tuple(item.get(k) for k in keys)] = existing
+            else:
+                existing.update(item)
+            out.append(dict(existing))
+        return out
+
+    def _update(self, rows):
+        matched = self._matches(rows)
+        for row in matched:
+            row.update(self.payload)
+        return [dict(row) for row in matched]
+
+    def _delete(self, rows):
+        matched = self._matches(rows)
+        for row in matched:
+            rows.remove(row)
+        return [dict(row) for row in matched]
+
+class RPC:
+    def __init__(self, db, fn, params):
+        self.db = db
+        self.fn = fn
+        self.params = params
+
+    def execute(self):
+        self.db.round_trip()
+        handler = getattr(self.db, 'rpc_' + self.fn, None)
+        with self.db.lock:
+            return Result(handler(self.params) if handler else None)
+
+LOCATION_KEY = ('product_id', 'warehouse_id', 'bin_id', 'batch_id', 'serial_number')
+
+class FakeSupabase:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.tables = {}
+        self.ids = itertools.count(1)
+        self.lock = threading.RLock()
+        self.round_trips = 0
+        self._count_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=16)
+
+    def round_trip(self):
+        with self._count_lock:
+            self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def table(self, name):
+        return Query(self, name)
+
+    from_ = table
+
+    def rpc(self, fn, params):
+        return RPC(self, fn, params)
+
+    @property
+    def aio(self):
+        # Queries built from aio are the same objects; gather() runs them concurrently
+        return self
+
+    def gather(self, *queries, timeout=None):
+        def run(query):
+            try:
+                return query.execute()
+            except Exception as e:
+                return e
+        return list(self._pool.map(run, queries))
+
+    def seed(self, table, rows):
+        # Adds rows without counting round trips; returns them with ids assigned
+        with self.lock:
+            stored = [dict(row, id=row.get('id') or next(self.ids)) for row in rows]
+            self.tables.setdefault(table, []).extend(stored)
+            return stored
+
+    def rpc_apply_stock_movements(self, params):
+        # Mirrors migrations/003 and 007: outbound movements are drawn from every matching
+        # location row in id order (null bin/batch/serial act as wildcards) and split into
+        # one ledger row per location, with deltas scaled as delta * take / total
+        inventory = self.tables.setdefault('inventory', [])
+        inserted = []
+        for entry in params['p_movements']:
+            movement, deltas = entry['movement'], entry['deltas']
+            outbound = -deltas.get('qty_on_hand', 0)
+            if outbound <= 0:
+                inserted.append(self._post_movement(movement, deltas, 1, 1))
+                continue
+            matching = sorted((row for row in inventory
+                               if row['product_id'] == movement.get('product_id')
+                               and row['warehouse_id'] == movement.get('warehouse_id')
+                               and all(movement.get(k) is None or row.get(k) == movement.get(k) for k in LOCATION_KEY[2:])),
+                              key=lambda row: row['id'])
+            if sum(row['qty_on_hand'] for row in matching) < outbound:
+                raise APIError({'message': 'insufficient stock', 'code': '23514', 'hint': None, 'details': None})
+            needed = outbound
+            for row in matching:
+                if needed <= 0:
+                    break
+                if row['qty_on_hand'] <= 0:
+                    continue
+                take = min(needed, row['qty_on_hand'])
+                part = dict(movement, **{k: row.get(k) for k in LOCATION_KEY[2:]})
+                inserted.append(self._post_movement(part, deltas, take, outbound))
+                needed -= take
+        return inserted
+
+    def _post_movement(self, movement, deltas, take, total):
+        inventory = self.tables.setdefault('inventory', [])
+        key = tuple(movement.get(k) for k in LOCATION_KEY)
+        row = next((r for r in inventory if tuple(r.get(k) for k in LOCATION_KEY) == key), None)
+        if row is None:
+            row = dict(zip(LOCATION_KEY, key), id=next(self.ids), qty_on_hand=0, qty_reserved=0,
+                       qty_damaged=0, qty_in_transit=0)
+            inventory.append(row)
+        for column, delta in deltas.items():
+            row[column] = row.get(column, 0) + delta * take / total
+        stored = dict(movement, id=next(self.ids), quantity=movement['quantity'] * take / total,
+                      created_at=time.strftime('%Y-%m-%dT%H:%M:%S+00:00', time.gmtime()))
+        row['last_movement_id'] = stored['id']
+        self.tables.setdefault('stock_movements', []).append(stored)
+        return dict(stored)
+
+    def rpc_receive_purchase_order(self, params):
+        # Mirrors migrations/008: line quantities, order status and stock in one call
+        items = {row['id']: row for row in self.tables.setdefault('purchase_order_items', [])
+                 if row.get('order_id') == params['p_order_id']}
+        posted, undo = [], []
+        for line in params['p_lines']:
+            item = items.get(line['id'])
+            if item is None:
+                continue
+            undo.append((item, dict(item)))
+            item['received_quantity'] += line['received_quantity']
+            item['over_receipt'] = item['received_quantity'] > item['quantity']
+            posted.append({'movement': line['movement'], 'deltas': line['deltas']})
+        return self._commit(posted, undo, 'purchase_orders', params['p_order_id'], 'received')
+
+    def rpc_post_sales_order_lines(self, params):
+        # Mirrors migrations/008: only lines not yet flagged post their movements
+        flag = params['p_flag']
+        items = {row['id']: row for row in self.tables.setdefault('sales_order_items', [])
+                 if row.get('order_id') == params['p_order_id']}
+        posted, undo = [], []
+        for line in params['p_lines']:
+            item = items.get(line['id'])
+            if item is None or item.get(flag):
+                continue
+            undo.append((item, dict(item)))
+            item[flag] = True
+            posted.append({'movement': line['movement'], 'deltas': line['deltas']})
+        return self._commit(posted, undo, 'sales_orders', params['p_order_id'], flag)
+
+    def _commit(self, posted, undo, table, order_id, status):
+        # Posts the movements; a failed stock check rolls the line updates back
+        try:
+            inserted = self.rpc_apply_stock_movements({'p_movements': posted})
+        except Exception:
+            for item, previous in undo:
+                item.update(previous)
+            raise
+        for row in self.tables.setdefault(table, []):
+            if row['id'] == order_id:
+                row['status'] = status
+        return inserted
@@ -0,0 +1,180 @@
+# Throughput and round-trip benchmark for the hot request paths, run against the
+# in-process FakeSupabase with simulated per-call latency.
+#
+#   python -m benchmarks.harness --latency 0.005 --requests 200
+#
+# Authentication is replaced by pass-through decorators so only the route and data
+# access costs are measured.
+import argparse
+import sys
+import time
+import types
+from flask import Flask
+from benchmarks.fake_supabase import FakeSupabase
+
+BLUEPRINTS = (
+    ('api.products', 'products_bp', '/api/v1/products'),
+    ('api.product_master', 'master_bp', '/api/v1/master'),
+    ('api.purchase', 'purchase_bp', '/api/v1/purchase'),
+    ('api.sales', 'sales_bp', '/api/v1/sales'),
+    ('api.inventory', 'inventory_bp', '/api/v1/inventory'),
+    ('api.stock_movements', 'movements_bp', '/api/v1/stock-movements'),
+    ('api.encoding', 'encoding_bp', None),
+)
+CATALOG_SIZE = 500
+ORDER_LINES = 20
+
+def _pass_through_auth():
+    module = types.ModuleType('auth')
+    module.require_auth = lambda f: f
+    module.require_role = lambda *roles: (lambda f: f)
+    return module
+
+def install(fake):
+    # Points every imported api/services module that bound `supabase` (services.db
+    # included) at the fake; returns the previous bindings for restore()
+    import services.db
+    previous = {}
+    for name, module in list(sys.modules.items()):
+        if name.startswith(('api.', 'services.')) and hasattr(module, 'supabase'):
+            previous[name] = module.supabase
+            module.supabase = fake
+    return previous
+
+def restore(previous):
+    for name, client in previous.items():
+        sys.modules[name].supabase = client
+
+def create_app(fake):
+    # Blueprints imported before this call keep whatever auth module they were built with
+    if 'auth' not in sys.modules:
+        sys.modules['auth'] = _pass_through_auth()
+    previous = install(fake)
+    app = Flask(__name__)
+    for module_name, attr, prefix in BLUEPRINTS:
+        module = __import__(module_name, fromlist=[attr])
+        app.register_blueprint(getattr(module, attr), url_prefix=prefix)
+    app.previous_clients = dict(install(fake), **previous)
+    from services.cache import get_cache
+    for table in ('products', 'suppliers', 'categories', 'units'):
+        get_cache(table).clear()
+    return app
+
+def seed_catalog(fake, size=CATALOG_SIZE):
+    return fake.seed('products', [{'name': 'Product {}'.format(i), 'sku': 'SKU-{}'.format(i), 'description': '',
+                                   'is_deleted': False} for i in range(size)])
+
+# Each scenario is (setup(fake) -> state, request(client, state, i) -> response).
+# Setup runs once; any per-request seeding in request() goes through fake.seed and is
+# not counted as a round trip.
+def catalog_browse():
+    def setup(fake):
+        return [p['id'] for p in seed_catalog(fake)]
+    def request(client, ids, i):
+        if i % 2:
+            return client.get('/api/v1/products/{}'.format(ids[i % len(ids)]))
+        return client.get('/api/v1/products/?limit=50&after_id={}'.format(ids[(i * 50) % len(ids)] - 1))
+    return setup, request
+
+def product_master_create():
+    def setup(fake):
+        return None
+    def request(client, state, i):
+        return client.post('/api/v1/master/products', json={
+            'product': {'name': 'Master {}'.format(i), 'sku': 'M-{}'.format(i)},
+            'variants': [{'product_id': 0, 'sku': 'M-{}-{}'.format(i, v), 'attributes': {'size': v}} for v in 'SML'],
+            'barcodes': [{'product_id': 0, 'code': '40000{:08d}'.format(i), 'type': 'EAN13'}],
+        })
+    return setup, request
+
+def po_receive():
+    def setup(fake):
+        return [p['id'] for p in seed_catalog(fake)]
+    def request(client, ids, i):
+        fake = client.fake
+        order = fake.seed('purchase_orders', [{'supplier_id': 1, 'status': 'ordered'}])[0]
+        lines = fake.seed('purchase_order_items', [
+            {'order_id': order['id'], 'product_id': ids[(i + n) % len(ids)], 'quantity': 10, 'unit_price': 1.0,
+             'received_quantity': 0, 'over_receipt': False} for n in range(ORDER_LINES)])
+        return client.post('/api/v1/purchase/orders/{}/receive'.format(order['id']), json={
+            'warehouse_id': 1, 'items': [{'id': line['id'], 'received_quantity': 10} for line in lines]})
+    return setup, request
+
+def so_ship():
+    def setup(fake):
+        ids = [p['id'] for p in seed_catalog(fake)]
+        fake.seed('inventory', [{'product_id': pid, 'warehouse_id': 1, 'bin_id': None, 'batch_id': None,
+                                 'serial_number': None, 'qty_on_hand': 10 ** 9, 'qty_reserved': 0,
+                                 'qty_damaged': 0, 'qty_in_transit': 0} for pid in ids])
+        return ids
+    def request(client, ids, i):
+        fake = client.fake
+        order = fake.seed('sales_orders', [{'customer_id': 1, 'status': 'confirmed', 'created_by': 1}])[0]
+        lines = fake.seed('sales_order_items', [
+            {'order_id': order['id'], 'product_id': ids[(i + n) % len(ids)], 'quantity': 1, 'unit_price': 1.0,
+             'picked': True, 'packed': True, 'shipped': False, 'returned': False} for n in range(ORDER_LINES)])
+        return client.post('/api/v1/sales/orders/{}/ship'.format(order['id']), json={
+            'warehouse_id': 1, 'items': [{'id': line['id']} for line in lines]})
+    return setup, request
+
+def movement_posting():
+    def setup(fake):
+        return [p['id'] for p in seed_catalog(fake)]
+    def request(client, ids, i):
+        return client.post('/api/v1/inventory/move', json={
+            'product_id': ids[i % len(ids)], 'warehouse_id': 1, 'movement_type': 'purchase', 'quantity': 1})
+    return setup, request
+
+SCENARIOS = {
+    'catalog_browse': catalog_browse,
+    'product_master_create': product_master_create,
+    'po_receive': po_receive,
+    'so_ship': so_ship,
+    'movement_posting': movement_posting,
+}
+
+def run(name, requests=100, latency=0.0):
+    # Returns {'scenario', 'requests', 'seconds', 'rps', 'round_trips', 'p50_ms', 'p95_ms'}
+    fake = FakeSupabase(latency=latency)
+    app = create_app(fake)
+    setup, request = SCENARIOS[name]()
+    state = setup(fake)
+    client = app.test_client()
+    client.fake = fake
+    durations = []
+    started_trips = fake.round_trips
+    started = time.perf_counter()
+    try:
+        for i in range(requests):
+            t = time.perf_counter()
+            response = request(client, state, i)
+            durations.append(time.perf_counter() - t)
+            if response.status_code >= 400:
+                raise RuntimeError('{} request {} failed: {} {}'.format(name, i, response.status_code, response.get_data(as_text=True)))
+    finally:
+        restore(app.previous_clients)
+    elapsed = time.perf_counter() - started
+    durations.sort()
+    return {
+        'scenario': name,
+        'requests': requests,
+        'seconds': elapsed,
+        'rps': requests / elapsed if elapsed else float('inf'),
+        'round_trips': (fake.round_trips - started_trips) / requests,
+        'p50_ms': durations[len(durations) // 2] * 1000,
+        'p95_ms': durations[min(int(len(durations) * 0.95), len(durations) - 1)] * 1000,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.002, help='simulated seconds per Supabase call')
+    parser.add_argument('scenarios', nargs='*', default=list(SCENARIOS))
+    args = parser.parse_args(argv)
+    print('{:<24} {:>9} {:>12} {:>9} {:>9}'.format('scenario', 'req/s', 'trips/req', 'p50 ms', 'p95 ms'))
+    for name in args.scenarios:
+        r = run(name, args.requests, args.latency)
+        print('{:<24} {:>9.1f} {:>12.2f} {:>9.2f} {:>9.2f}'.format(r['scenario'], r['rps'], r['round_trips'], r['p50_ms'], r['p95_ms']))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+# Build time and query latency of the in-process product search index over a synthetic
+# catalog, without Supabase:
+#
+#   python -m benchmarks.search --products 500000
+import argparse
+import random
+import time
+from services.search import SearchState, ProductSearch
+
+ADJECTIVES = ('cotton', 'wool', 'linen', 'denim', 'leather', 'silk', 'organic', 'classic', 'slim', 'relaxed',
+              'heavy', 'light', 'vintage', 'sport', 'outdoor', 'premium', 'basic', 'striped', 'waterproof', 'thermal')
+NOUNS = ('shirt', 'sweater', 'jacket', 'trousers', 'jeans', 'hoodie', 'cardigan', 'scarf', 'gloves', 'boots',
+         'sneakers', 'socks', 'blazer', 'skirt', 'dress', 'shorts', 'vest', 'coat', 'beanie', 'belt')
+COLORS = ('black', 'white', 'navy', 'red', 'olive', 'grey', 'beige', 'yellow', 'teal', 'burgundy')
+SIZES = ('XS', 'S', 'M', 'L', 'XL')
+CATEGORIES = {i: {'id': i, 'name': name, 'tags': tags} for i, (name, tags) in enumerate((
+    ('Tops', ['summer', 'casual']), ('Bottoms', ['denim']), ('Outerwear', ['winter', 'rain']),
+    ('Footwear', ['shoes']), ('Accessories', ['gift'])), 1)}
+QUERIES = ('shirt', 'navy sweater', 'wool card', 'jack', 'sweatr', 'waterprof boots', 'SKU-004217',
+           'sku-12', 'winter coat xl', 'eans', 'premium leather belt black', 'gloves gift')
+
+def catalog(size, seed=1):
+    rng = random.Random(seed)
+    products, product_categories, variants = {}, {}, {}
+    variant_id = 0
+    for pid in range(1, size + 1):
+        name = '{} {} {}'.format(rng.choice(ADJECTIVES), rng.choice(ADJECTIVES), rng.choice(NOUNS)).title()
+        products[pid] = {'id': pid, 'name': name, 'sku': 'SKU-{:06d}'.format(pid)}
+        product_categories[pid] = {rng.choice(list(CATEGORIES))}
+        variants[pid] = {}
+        for size_code in rng.sample(SIZES, 2):
+            variant_id += 1
+            variants[pid][variant_id] = {'id': variant_id, 'product_id': pid, 'sku': 'SKU-{:06d}-{}'.format(pid, size_code),
+                                         'attributes': {'size': size_code, 'color': rng.choice(COLORS)}}
+    return products, dict(CATEGORIES), product_categories, variants
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args(argv)
+    started = time.perf_counter()
+    state = SearchState(*catalog(args.products))
+    print('built {} products, {} terms in {:.1f} s'.format(len(state.doc_terms), len(state.postings), time.perf_counter() - started))
+    index = ProductSearch()
+    index._install(state)
+    index._built, index._built_at = True, time.monotonic()
+    print('{:<30} {:>9} {:>9} {:>9}'.format('query', 'matches', 'p50 ms', 'max ms'))
+    for query in QUERIES:
+        durations = []
+        for _ in range(args.repeat):
+            t = time.perf_counter()
+            total, _ = index.search(query, limit=20)
+            durations.append(time.perf_counter() - t)
+        durations.sort()
+        print('{:<30} {:>9} {:>9.2f} {:>9.2f}'.format(query, total, durations[len(durations) // 2] * 1000, durations[-1] * 1000))
+
+if __name__ == '__main__':
+    main()
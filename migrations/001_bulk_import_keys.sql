@@ -0,0 +1,3 @@
+-- Conflict targets for the /products/bulk and /suppliers/bulk upserts
+create unique index if not exists products_sku_key on products (sku);
+create unique index if not exists suppliers_name_key on suppliers (name);
@@ -0,0 +1,42 @@
+-- One inventory row per location; the key used by apply_stock_movements and rebuild_balances
+create unique index if not exists inventory_location_key
+    on inventory (product_id, warehouse_id, bin_id, batch_id, serial_number) nulls not distinct;
+
+-- Inserts each movement and applies its balance deltas in the same transaction.
+-- p_movements: [{"movement": {...stock_movements columns}, "deltas": {"qty_on_hand": n, ...}}]
+create or replace function apply_stock_movements(p_movements jsonb)
+returns setof stock_movements
+language plpgsql
+as $$
+declare
+    item jsonb;
+    m stock_movements;
+begin
+    for item in select value from jsonb_array_elements(p_movements)
+    loop
+        insert into stock_movements (product_id, warehouse_id, bin_id, movement_type, quantity,
+                                     ref_type, ref_id, notes, user_id, batch_id, serial_number)
+        select r.product_id, r.warehouse_id, r.bin_id, r.movement_type, r.quantity,
+               r.ref_type, r.ref_id, r.notes, r.user_id, r.batch_id, r.serial_number
+        from jsonb_populate_record(null::stock_movements, item->'movement') r
+        returning * into m;
+
+        insert into inventory as i (product_id, warehouse_id, bin_id, batch_id, serial_number,
+                                    qty_on_hand, qty_reserved, qty_damaged, qty_in_transit, last_movement_id)
+        values (m.product_id, m.warehouse_id, m.bin_id, m.batch_id, m.serial_number,
+                coalesce((item->'deltas'->>'qty_on_hand')::numeric, 0),
+                coalesce((item->'deltas'->>'qty_reserved')::numeric, 0),
+                coalesce((item->'deltas'->>'qty_damaged')::numeric, 0),
+                coalesce((item->'deltas'->>'qty_in_transit')::numeric, 0),
+                m.id)
+        on conflict (product_id, warehouse_id, bin_id, batch_id, serial_number)
+        do update set qty_on_hand = i.qty_on_hand + excluded.qty_on_hand,
+                      qty_reserved = i.qty_reserved + excluded.qty_reserved,
+                      qty_damaged = i.qty_damaged + excluded.qty_damaged,
+                      qty_in_transit = i.qty_in_transit + excluded.qty_in_transit,
+                      last_movement_id = excluded.last_movement_id;
+
+        return next m;
+    end loop;
+end;
+$$;
@@ -0,0 +1,99 @@
+-- Applies one movement (or an allocated part of it) to the ledger and inventory.
+create or replace function post_stock_movement(mv stock_movements, deltas jsonb, factor numeric)
+returns stock_movements
+language plpgsql
+as $$
+declare
+    m stock_movements;
+begin
+    insert into stock_movements (product_id, warehouse_id, bin_id, movement_type, quantity,
+                                 ref_type, ref_id, notes, user_id, batch_id, serial_number)
+    values (mv.product_id, mv.warehouse_id, mv.bin_id, mv.movement_type, mv.quantity * factor,
+            mv.ref_type, mv.ref_id, mv.notes, mv.user_id, mv.batch_id, mv.serial_number)
+    returning * into m;
+
+    insert into inventory as i (product_id, warehouse_id, bin_id, batch_id, serial_number,
+                                qty_on_hand, qty_reserved, qty_damaged, qty_in_transit, last_movement_id)
+    values (m.product_id, m.warehouse_id, m.bin_id, m.batch_id, m.serial_number,
+            coalesce((deltas->>'qty_on_hand')::numeric, 0) * factor,
+            coalesce((deltas->>'qty_reserved')::numeric, 0) * factor,
+            coalesce((deltas->>'qty_damaged')::numeric, 0) * factor,
+            coalesce((deltas->>'qty_in_transit')::numeric, 0) * factor,
+            m.id)
+    on conflict (product_id, warehouse_id, bin_id, batch_id, serial_number)
+    do update set qty_on_hand = i.qty_on_hand + excluded.qty_on_hand,
+                  qty_reserved = i.qty_reserved + excluded.qty_reserved,
+                  qty_damaged = i.qty_damaged + excluded.qty_damaged,
+                  qty_in_transit = i.qty_in_transit + excluded.qty_in_transit,
+                  last_movement_id = excluded.last_movement_id;
+    return m;
+end;
+$$;
+
+-- Replaces the version from 002. Movements that reduce qty_on_hand lock every matching
+-- location row (bin/batch/serial act as wildcards when null), check the aggregate, and
+-- draw the quantity down in id order. The movement is split into one ledger row per
+-- location it was drawn from so rebuilds from the ledger agree with the balances.
+-- Raises check_violation (23514) when stock is insufficient.
+create or replace function apply_stock_movements(p_movements jsonb)
+returns setof stock_movements
+language plpgsql
+as $$
+declare
+    item jsonb;
+    target stock_movements;
+    part stock_movements;
+    loc inventory;
+    outbound numeric;
+    needed numeric;
+    available numeric;
+    take numeric;
+begin
+    for item in select value from jsonb_array_elements(p_movements)
+    loop
+        target := jsonb_populate_record(null::stock_movements, item->'movement');
+        outbound := -coalesce((item->'deltas'->>'qty_on_hand')::numeric, 0);
+        if outbound <= 0 then
+            return next post_stock_movement(target, item->'deltas', 1);
+            continue;
+        end if;
+
+        perform 1 from inventory
+        where product_id = target.product_id and warehouse_id = target.warehouse_id
+          and (target.bin_id is null or bin_id = target.bin_id)
+          and (target.batch_id is null or batch_id = target.batch_id)
+          and (target.serial_number is null or serial_number = target.serial_number)
+        order by id
+        for update;
+
+        select coalesce(sum(qty_on_hand), 0) into available from inventory
+        where product_id = target.product_id and warehouse_id = target.warehouse_id
+          and (target.bin_id is null or bin_id = target.bin_id)
+          and (target.batch_id is null or batch_id = target.batch_id)
+          and (target.serial_number is null or serial_number = target.serial_number);
+        if available < outbound then
+            raise exception 'Insufficient stock for product % in warehouse %', target.product_id, target.warehouse_id
+                using errcode = 'check_violation';
+        end if;
+
+        needed := outbound;
+        for loc in select * from inventory
+                   where product_id = target.product_id and warehouse_id = target.warehouse_id
+                     and (target.bin_id is null or bin_id = target.bin_id)
+                     and (target.batch_id is null or batch_id = target.batch_id)
+                     and (target.serial_number is null or serial_number = target.serial_number)
+                     and qty_on_hand > 0
+                   order by id
+        loop
+            exit when needed <= 0;
+            take := least(needed, loc.qty_on_hand);
+            part := target;
+            part.bin_id := loc.bin_id;
+            part.batch_id := loc.batch_id;
+            part.serial_number := loc.serial_number;
+            return next post_stock_movement(part, item->'deltas', take / outbound);
+            needed := needed - take;
+        end loop;
+    end loop;
+end;
+$$;
@@ -0,0 +1,10 @@
+-- Indexes for the /inventory and /inventory/movements filters. List endpoints page by id,
+-- so equality filters are paired with id to serve `where x = ? and id > ? order by id limit n`
+-- straight from the index.
+create index if not exists stock_movements_product_id_idx on stock_movements (product_id, id);
+create index if not exists stock_movements_warehouse_id_idx on stock_movements (warehouse_id, id);
+create index if not exists stock_movements_type_id_idx on stock_movements (movement_type, id);
+create index if not exists stock_movements_ref_idx on stock_movements (ref_type, ref_id);
+-- created_at grows with id, so a BRIN index keeps date-range scans small at little cost
+create index if not exists stock_movements_created_at_brin on stock_movements using brin (created_at);
+create index if not exists inventory_warehouse_id_idx on inventory (warehouse_id, id);
@@ -0,0 +1,53 @@
+-- Point-in-time copies of inventory used by /inventory/as-of. A snapshot reflects
+-- every movement with id <= last_movement_id and none after it.
+create table if not exists stock_snapshots (
+    id bigserial primary key,
+    taken_at timestamptz not null default now(),
+    last_movement_id bigint not null default 0
+);
+create index if not exists stock_snapshots_taken_at_idx on stock_snapshots (taken_at);
+
+create table if not exists stock_snapshot_balances (
+    id bigserial primary key,
+    snapshot_id bigint not null references stock_snapshots (id) on delete cascade,
+    product_id integer not null,
+    warehouse_id integer not null,
+    bin_id integer,
+    batch_id integer,
+    serial_number text,
+    qty_on_hand numeric not null default 0,
+    qty_reserved numeric not null default 0,
+    qty_damaged numeric not null default 0,
+    qty_in_transit numeric not null default 0
+);
+create index if not exists stock_snapshot_balances_snapshot_idx
+    on stock_snapshot_balances (snapshot_id, id);
+create index if not exists stock_snapshot_balances_lookup_idx
+    on stock_snapshot_balances (snapshot_id, warehouse_id, product_id);
+
+-- Locks stock_movements then inventory in share mode: in-flight postings finish first
+-- and new ones wait for the copy, so the balances and the watermark agree. Postings
+-- that deadlock against it are retried by apply_movements.
+create or replace function take_stock_snapshot()
+returns stock_snapshots
+language plpgsql
+as $$
+declare
+    s stock_snapshots;
+begin
+    lock table stock_movements, inventory in share mode;
+    insert into stock_snapshots (last_movement_id)
+    select coalesce(max(id), 0) from stock_movements
+    returning * into s;
+    insert into stock_snapshot_balances (snapshot_id, product_id, warehouse_id, bin_id, batch_id, serial_number,
+                                         qty_on_hand, qty_reserved, qty_damaged, qty_in_transit)
+    select s.id, product_id, warehouse_id, bin_id, batch_id, serial_number,
+           qty_on_hand, qty_reserved, qty_damaged, qty_in_transit
+    from inventory
+    where qty_on_hand <> 0 or qty_reserved <> 0 or qty_damaged <> 0 or qty_in_transit <> 0;
+    return s;
+end;
+$$;
+
+-- Optional: nightly snapshot with pg_cron
+-- select cron.schedule('stock-snapshot', '0 2 * * *', 'select take_stock_snapshot()');
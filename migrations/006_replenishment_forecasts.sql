@@ -0,0 +1,17 @@
+-- Per-product demand forecast state written by services/replenishment.py. Each row
+-- reflects every movement with id <= last_movement_id; the nightly run only
+-- recomputes products that have movements after that watermark.
+create table if not exists replenishment_forecasts (
+    product_id integer primary key,
+    daily_demand numeric not null default 0,
+    demand_std numeric not null default 0,
+    lead_time_days numeric not null default 0,
+    safety_stock numeric not null default 0,
+    reorder_point numeric not null default 0,
+    order_up_to numeric not null default 0,
+    supplier_id integer,
+    unit_price numeric,
+    last_movement_id bigint not null default 0,
+    computed_at timestamptz not null default now()
+);
+create index if not exists replenishment_forecasts_supplier_idx on replenishment_forecasts (supplier_id);
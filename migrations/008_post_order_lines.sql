@@ -0,0 +1,62 @@
+-- Receipts and shipments post their stock movements and update the order lines in one
+-- transaction, so a failure after posting cannot leave lines unmarked (a retry would
+-- then move the stock a second time).
+
+-- p_lines: [{id, received_quantity, movement, deltas}], one entry per received line (a
+-- line may appear more than once, e.g. split across bins). Lines not on the order are
+-- ignored. received_quantity is incremented in place, so concurrent receipts add up.
+create or replace function receive_purchase_order(p_order_id bigint, p_lines jsonb)
+returns setof stock_movements
+language plpgsql
+as $$
+declare
+    line jsonb;
+    posted jsonb := '[]';
+begin
+    for line in select value from jsonb_array_elements(p_lines)
+    loop
+        update purchase_order_items
+        set received_quantity = received_quantity + (line->>'received_quantity')::numeric,
+            over_receipt = received_quantity + (line->>'received_quantity')::numeric > quantity
+        where id = (line->>'id')::bigint and order_id = p_order_id;
+        if found then
+            posted := posted || jsonb_build_array(jsonb_build_object('movement', line->'movement', 'deltas', line->'deltas'));
+        end if;
+    end loop;
+    update purchase_orders set status = 'received' where id = p_order_id;
+    return query select * from apply_stock_movements(posted);
+end;
+$$;
+
+-- p_lines: [{id, movement, deltas}]; p_flag is 'shipped' or 'returned' and is also the
+-- new order status. A line is flagged and its movement posted only if it was not flagged
+-- already, checked under the row lock the update takes, so a repeated or concurrent
+-- request cannot move the same line's stock twice.
+create or replace function post_sales_order_lines(p_order_id bigint, p_lines jsonb, p_flag text)
+returns setof stock_movements
+language plpgsql
+as $$
+declare
+    line jsonb;
+    posted jsonb := '[]';
+begin
+    if p_flag not in ('shipped', 'returned') then
+        raise exception 'Unknown sales line flag %', p_flag using errcode = 'invalid_parameter_value';
+    end if;
+    for line in select value from jsonb_array_elements(p_lines)
+    loop
+        if p_flag = 'shipped' then
+            update sales_order_items set shipped = true
+            where id = (line->>'id')::bigint and order_id = p_order_id and not shipped;
+        else
+            update sales_order_items set returned = true
+            where id = (line->>'id')::bigint and order_id = p_order_id and not returned;
+        end if;
+        if found then
+            posted := posted || jsonb_build_array(jsonb_build_object('movement', line->'movement', 'deltas', line->'deltas'));
+        end if;
+    end loop;
+    update sales_orders set status = p_flag where id = p_order_id;
+    return query select * from apply_stock_movements(posted);
+end;
+$$;
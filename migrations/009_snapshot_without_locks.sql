@@ -0,0 +1,43 @@
+-- Replaces take_stock_snapshot from 005, which locked stock_movements and inventory in
+-- share mode and so held back every posting for as long as the copy took. The watermark
+-- and the inventory copy are now taken by one statement, so both see the same MVCC
+-- snapshot and postings carry on meanwhile. A posting commits its movement rows and
+-- their inventory deltas together, so the copy includes exactly the movements visible
+-- to that statement. Movement ids are allocated before commit, so ids at or below the
+-- watermark that were not visible yet (in flight, or rolled back) are recorded in
+-- pending_movement_ids and replayed along with everything after the watermark.
+alter table stock_snapshots add column if not exists pending_movement_ids bigint[] not null default '{}';
+
+create or replace function take_stock_snapshot()
+returns stock_snapshots
+language plpgsql
+as $$
+declare
+    s stock_snapshots;
+begin
+    with watermark as (
+        select coalesce(max(id), 0) as id from stock_movements
+    ), snapshot as (
+        insert into stock_snapshots (last_movement_id, pending_movement_ids)
+        -- The last 10000 ids are checked: far more than postings in flight allocate
+        select w.id,
+               array(select g from generate_series(greatest(w.id - 10000, 0) + 1, w.id) g
+                     where not exists (select 1 from stock_movements m where m.id = g))
+        from watermark w
+        returning *
+    ), copied as (
+        insert into stock_snapshot_balances (snapshot_id, product_id, warehouse_id, bin_id, batch_id, serial_number,
+                                             qty_on_hand, qty_reserved, qty_damaged, qty_in_transit)
+        select snapshot.id, i.product_id, i.warehouse_id, i.bin_id, i.batch_id, i.serial_number,
+               i.qty_on_hand, i.qty_reserved, i.qty_damaged, i.qty_in_transit
+        from snapshot, inventory i
+        where i.qty_on_hand <> 0 or i.qty_reserved <> 0 or i.qty_damaged <> 0 or i.qty_in_transit <> 0
+    )
+    select * into s from snapshot;
+    return s;
+end;
+$$;
+
+-- /inventory/as-of pages by product_id
+create index if not exists stock_snapshot_balances_product_idx
+    on stock_snapshot_balances (snapshot_id, product_id);
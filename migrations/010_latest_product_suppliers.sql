@@ -0,0 +1,11 @@
+-- Supplier and unit price of the most recent purchase order line per product, for the
+-- replenishment forecast run. Read with product_id=in.(...) (or paged by product_id), so
+-- the cost follows the products asked for instead of the whole purchase order history.
+create index if not exists purchase_order_items_product_idx on purchase_order_items (product_id, id desc);
+
+create or replace view latest_product_suppliers as
+select distinct on (i.product_id) i.product_id, o.supplier_id, i.unit_price
+from purchase_order_items i
+join purchase_orders o on o.id = i.order_id
+where o.supplier_id is not null
+order by i.product_id, i.id desc;
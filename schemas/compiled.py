@@ -0,0 +1,141 @@
+import math
+from marshmallow import RAISE, ValidationError, fields, missing, validate
+
+# Field types whose canonical input can be checked inline. Anything else is handed to
+# field.deserialize; anything unexpected sends the item down the regular Schema.load path.
+_INLINE_CHECKS = (
+    (fields.Bool, 'type(v) is bool', 'v'),
+    (fields.Float, '(type(v) is float and _isfinite(v)) or (type(v) is int and -_FMAX < v < _FMAX)', 'float(v)'),
+    (fields.Int, 'type(v) is int', 'v'),
+    (fields.Email, None, None),
+    (fields.Str, 'type(v) is str', 'v'),
+    (fields.Dict, 'type(v) is dict', 'dict(v)'),
+)
+
+# Drop-in wrapper around a marshmallow schema with a generated fast path for loads.
+# Each item is first checked by a function generated from the schema's fields, which
+# only accepts already-canonical input (ints for Int, str for Str, ...) and builds the
+# same dict Schema.load would. Items it cannot vouch for (coercion, unknown keys, any
+# validation failure) go through Schema.load, so results and error messages are
+# identical to the plain schema.
+class CompiledSchema:
+    def __init__(self, schema):
+        self.schema = schema
+        self._fast = _generate(schema)
+
+    def __getattr__(self, name):
+        return getattr(self.schema, name)
+
+    def load(self, data, many=None, partial=None, **kwargs):
+        many = self.schema.many if many is None else many
+        if self._fast is None or partial or kwargs:
+            return self.schema.load(data, many=many, partial=partial, **kwargs)
+        if not many:
+            result = self._fast(data)
+            return self.schema.load(data) if result is None else result
+        if not isinstance(data, list):
+            return self.schema.load(data, many=True)
+        results, errors = [], {}
+        for index, item in enumerate(data):
+            result = self._fast(item)
+            if result is None:
+                try:
+                    result = self.schema.load(item)
+                except ValidationError as err:
+                    errors[index] = err.messages
+                    result = err.valid_data
+            results.append(result)
+        if errors:
+            raise ValidationError(errors, data=data, valid_data=results)
+        return results
+
+def compile_schema(schema):
+    return CompiledSchema(schema)
+
+def _generate(schema):
+    if schema.unknown != RAISE or any(getattr(schema, '_hooks', {}).values()):
+        return None
+    namespace = {'_missing': missing, '_isfinite': math.isfinite, '_FMAX': 2 ** 1023, '_ValidationError': ValidationError}
+    load_fields = schema.load_fields
+    lines = [
+        'def fast(d):',
+        '    if type(d) is not dict:',
+        '        return None',
+        '    for k in d:',
+        '        if k not in _names:',
+        '            return None',
+        '    out = {}',
+    ]
+    namespace['_names'] = frozenset(load_fields)
+    for i, (name, field) in enumerate(load_fields.items()):
+        if field.data_key not in (None, name) or field.attribute not in (None, name):
+            return None
+        check, convert = _inline_check(field)
+        f = '_f{}'.format(i)
+        namespace[f] = field
+        lines.append('    v = d.get({!r}, _missing)'.format(name))
+        lines.append('    if v is _missing:')
+        if field.required:
+            lines.append('        return None')
+        elif field.load_default is missing:
+            lines.append('        pass')
+        else:
+            call = '()' if callable(field.load_default) else ''
+            lines.append('        out[{!r}] = {}.load_default{}'.format(name, f, call))
+        lines.append('    elif v is None:')
+        if field.allow_none:
+            lines.append('        out[{!r}] = None'.format(name))
+        else:
+            lines.append('        return None')
+        lines.append('    else:')
+        if check is None:
+            lines.append('        try:')
+            lines.append('            out[{!r}] = {}.deserialize(v, {!r}, d)'.format(name, f, name))
+            lines.append('        except _ValidationError:')
+            lines.append('            return None')
+            continue
+        lines.append('        if not ({}):'.format(check))
+        lines.append('            return None')
+        for j, validator in enumerate(field.validators):
+            lines.extend('        ' + line for line in _validator_lines(validator, '{}v{}'.format(f, j), namespace))
+        lines.append('        out[{!r}] = {}'.format(name, convert))
+    lines.append('    return out')
+    exec('\n'.join(lines), namespace)
+    return namespace['fast']
+
+def _inline_check(field):
+    if isinstance(field, fields.List):
+        if type(field.inner) is fields.Str and not field.inner.validators:
+            return 'type(v) is list and all(type(x) is str for x in v)', 'list(v)'
+        return None, None
+    for field_type, check, convert in _INLINE_CHECKS:
+        if isinstance(field, field_type):
+            if type(field) is not field_type:
+                return None, None
+            if isinstance(field, fields.Dict) and (field.key_field or field.value_field):
+                return None, None
+            if isinstance(field, fields.Int) and field.strict:
+                return None, None
+            if isinstance(field, fields.Float) and field.allow_nan:
+                return 'type(v) is float or (type(v) is int and -_FMAX < v < _FMAX)', 'float(v)'
+            return check, convert
+    return None, None
+
+def _validator_lines(validator, name, namespace):
+    namespace[name] = validator
+    if type(validator) is validate.Length and validator.equal is None:
+        lines = []
+        if validator.min is not None:
+            lines += ['if len(v) < {}.min:'.format(name), '    return None']
+        if validator.max is not None:
+            lines += ['if len(v) > {}.max:'.format(name), '    return None']
+        return lines
+    if type(validator) is validate.OneOf:
+        return ['if v not in {}.choices:'.format(name), '    return None']
+    return [
+        'try:',
+        '    if {}(v) is False:'.format(name),
+        '        return None',
+        'except _ValidationError:',
+        '    return None',
+    ]
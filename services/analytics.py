@@ -0,0 +1,136 @@
+import datetime
+import numpy as np
+from services.db import supabase
+from services.cache import TTLCache, MISSING
+from services.movements import MOVEMENT_DELTAS
+
+PAGE_SIZE = 10000
+WINDOW_DAYS = 365
+DEAD_STOCK_DAYS = 180
+# Cumulative revenue share upper bounds for the A and B classes
+ABC_BOUNDS = (0.8, 0.95)
+DEMAND_TYPES = ('sale', 'goods_issue')
+KEY_SHIFT = np.int64(1 << 32)
+
+# Keyed on the latest movement id, so a posted movement makes earlier results unreachable
+_results = TTLCache('analytics', maxsize=32, ttl=3600)
+
+def fetch_columns(build_query, columns, after_id=0, key='id'):
+    # Pages through a table by key and returns {column: ndarray}; rows are never held as
+    # dicts beyond one page
+    chunks = {c: [] for c in columns}
+    while True:
+        rows = build_query().gt(key, after_id).order(key).limit(PAGE_SIZE).execute().data or []
+        for c in columns:
+            chunks[c].append([row[c] for row in rows])
+        if len(rows) < PAGE_SIZE:
+            break
+        after_id = rows[-1][key]
+    return {c: np.array([v for chunk in chunks[c] for v in chunk]) for c in columns}
+
+def latest_movement_id():
+    rows = supabase.table('stock_movements').select('id').order('id', desc=True).limit(1).execute().data
+    return rows[0]['id'] if rows else 0
+
+def inventory_analytics(window_days=WINDOW_DAYS, dead_days=DEAD_STOCK_DAYS, warehouse_id=None):
+    # Results are reused until a new movement is posted
+    key = (window_days, dead_days, warehouse_id, latest_movement_id())
+    cached = _results.get(key)
+    if cached is not MISSING:
+        return cached
+    result = _compute(window_days, dead_days, warehouse_id)
+    _results.set(key, result)
+    return result
+
+def timestamps(values):
+    # PostgREST returns ISO 8601 with an offset; stored times are UTC, so the offset is cut off
+    return values.astype('U19').astype('datetime64[s]')
+
+def _compute(window_days, dead_days, warehouse_id):
+    now = np.datetime64(datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None), 's')
+    since = now - np.timedelta64(window_days, 'D')
+    # Dead stock may look further back than the turnover window
+    fetch_since = now - np.timedelta64(max(window_days, dead_days), 'D')
+    def scoped(table, columns):
+        def build():
+            query = supabase.table(table).select(columns)
+            return query.eq('warehouse_id', warehouse_id) if warehouse_id is not None else query
+        return build
+
+    inv = fetch_columns(scoped('inventory', 'id,product_id,warehouse_id,qty_on_hand'),
+                        ('product_id', 'warehouse_id', 'qty_on_hand'))
+    mov = fetch_columns(lambda: scoped('stock_movements', 'id,product_id,warehouse_id,movement_type,quantity,created_at')()
+                        .gte('created_at', str(fetch_since)),
+                        ('product_id', 'warehouse_id', 'movement_type', 'quantity', 'created_at'))
+    sales = fetch_columns(lambda: supabase.table('sales_order_items').select('id,product_id,quantity,unit_price').eq('returned', False),
+                          ('product_id', 'quantity', 'unit_price'))
+
+    inv_keys = inv['product_id'].astype(np.int64) * KEY_SHIFT + inv['warehouse_id'].astype(np.int64)
+    mov_keys = mov['product_id'].astype(np.int64) * KEY_SHIFT + mov['warehouse_id'].astype(np.int64)
+    keys, inverse = np.unique(np.concatenate([inv_keys, mov_keys]), return_inverse=True)
+    n = len(keys)
+    inv_idx, mov_idx = inverse[:len(inv_keys)], inverse[len(inv_keys):]
+
+    on_hand = np.bincount(inv_idx, weights=inv['qty_on_hand'].astype(float), minlength=n)
+    stamps = timestamps(mov['created_at'])
+    in_window = stamps >= since
+    qty = np.where(in_window, mov['quantity'].astype(float), 0.0)
+    types = mov['movement_type'].astype(str)
+    signs = np.zeros(len(qty))
+    for movement_type, deltas in MOVEMENT_DELTAS.items():
+        signs[types == movement_type] = deltas.get('qty_on_hand', 0)
+    net = np.bincount(mov_idx, weights=qty * signs, minlength=n)
+    is_demand = np.isin(types, DEMAND_TYPES)
+    issued = np.bincount(mov_idx, weights=np.where(is_demand, qty, 0.0), minlength=n)
+
+    # Average of the balance at the start of the window (now minus the window's net
+    # change) and the current balance
+    average = (on_hand - net + on_hand) / 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        turnover = np.where(average > 0, issued / average, np.nan)
+        daily_demand = issued / window_days
+        cover = np.where(daily_demand > 0, on_hand / daily_demand, np.nan)
+
+    last_issue = np.full(n, np.datetime64('NaT'), dtype='datetime64[s]')
+    if is_demand.any():
+        latest = np.full(n, np.iinfo(np.int64).min)
+        np.maximum.at(latest, mov_idx[is_demand], stamps[is_demand].astype(np.int64))
+        seen = latest != np.iinfo(np.int64).min
+        last_issue[seen] = latest[seen].astype('datetime64[s]')
+    idle = np.isnat(last_issue) | (last_issue < now - np.timedelta64(dead_days, 'D'))
+    dead = (on_hand > 0) & idle
+
+    product_ids = (keys // KEY_SHIFT).astype(np.int64)
+    abc = _abc_classes(product_ids, sales)
+
+    return [
+        {
+            'product_id': int(product_ids[i]),
+            'warehouse_id': int(keys[i] % KEY_SHIFT),
+            'qty_on_hand': float(on_hand[i]),
+            'issued': float(issued[i]),
+            'turnover': None if np.isnan(turnover[i]) else round(float(turnover[i]), 4),
+            'days_of_cover': None if np.isnan(cover[i]) else round(float(cover[i]), 1),
+            'abc_class': abc[i],
+            'dead_stock': bool(dead[i]),
+            'last_issue_at': None if np.isnat(last_issue[i]) else str(last_issue[i]),
+        }
+        for i in range(n)
+    ]
+
+def _abc_classes(product_ids, sales):
+    # Pareto classes by sales revenue per product: top 80% of revenue A, next 15% B, rest C
+    if not len(sales['product_id']):
+        return ['C'] * len(product_ids)
+    products, inverse = np.unique(sales['product_id'].astype(np.int64), return_inverse=True)
+    revenue = np.bincount(inverse, weights=sales['quantity'].astype(float) * sales['unit_price'].astype(float))
+    order = np.argsort(-revenue, kind='stable')
+    share = np.cumsum(revenue[order]) / max(revenue.sum(), 1e-12)
+    # A product is classed by the share reached before adding it, so the top seller is always A
+    before = share - revenue[order] / max(revenue.sum(), 1e-12)
+    classes = np.full(len(products), 'C', dtype='<U1')
+    classes[order[before < ABC_BOUNDS[1]]] = 'B'
+    classes[order[before < ABC_BOUNDS[0]]] = 'A'
+    pos = np.searchsorted(products, product_ids)
+    found = (pos < len(products)) & (products[np.minimum(pos, len(products) - 1)] == product_ids)
+    return np.where(found, classes[np.minimum(pos, len(products) - 1)], 'C').tolist()
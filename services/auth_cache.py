@@ -0,0 +1,113 @@
+import functools
+import hashlib
+import os
+import threading
+import time
+from flask import g, has_request_context
+from services.cache import TTLCache, MISSING
+
+TOKEN_CACHE_SIZE = int(os.environ.get('AUTH_TOKEN_CACHE_SIZE', 10000))
+# Upper bound on how long a verified token is trusted without re-checking, even when its
+# exp is further away; this is also the delay before a revoked session is noticed
+MAX_TOKEN_TTL = float(os.environ.get('AUTH_TOKEN_TTL', 300))
+
+_claims = TTLCache('auth_claims', maxsize=TOKEN_CACHE_SIZE, ttl=MAX_TOKEN_TTL)
+_roles = TTLCache('auth_roles', maxsize=TOKEN_CACHE_SIZE, ttl=MAX_TOKEN_TTL)
+_timing_lock = threading.Lock()
+_timing = {'requests': 0, 'seconds': 0.0}
+
+def token_key(token):
+    # Raw tokens are never kept in memory as cache keys
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+def _ttl(claims):
+    exp = claims.get('exp')
+    if exp is None:
+        return MAX_TOKEN_TTL
+    return min(exp - time.time(), MAX_TOKEN_TTL)
+
+def memoize_verifier(verify):
+    # Wraps verify(token) -> claims (raising on an invalid token) so the signature and
+    # claims check runs once per token until it expires. Failures are not cached.
+    @functools.wraps(verify)
+    def wrapper(token):
+        with auth_timer():
+            key = token_key(token)
+            claims = _claims.get(key)
+            if claims is MISSING:
+                claims = verify(token)
+                ttl = _ttl(claims)
+                if ttl > 0:
+                    _claims.set(key, claims, ttl=ttl)
+            return claims
+    return wrapper
+
+def memoize_roles(resolve):
+    # Wraps resolve(token, claims) -> iterable of role names; resolved once per token
+    @functools.wraps(resolve)
+    def wrapper(token, claims):
+        with auth_timer():
+            key = token_key(token)
+            roles = _roles.get(key)
+            if roles is MISSING:
+                roles = frozenset(resolve(token, claims))
+                ttl = _ttl(claims)
+                if ttl > 0:
+                    _roles.set(key, roles, ttl=ttl)
+            return roles
+    return wrapper
+
+def current_user_id():
+    # Id of the user require_auth resolved for this request (g.user, a row or claims
+    # dict), or None outside an authenticated request
+    user = g.get('user') if has_request_context() else None
+    if user is None:
+        return None
+    if isinstance(user, dict):
+        return user.get('id', user.get('sub'))
+    return getattr(user, 'id', user)
+
+def current_roles():
+    # Roles resolved for this request (g.roles, or the roles/role of g.user), empty
+    # outside an authenticated request
+    if not has_request_context():
+        return frozenset()
+    roles = g.get('roles')
+    if roles is None:
+        user = g.get('user')
+        if isinstance(user, dict):
+            roles = user.get('roles', user.get('role'))
+        else:
+            roles = getattr(user, 'roles', getattr(user, 'role', None))
+    if roles is None:
+        return frozenset()
+    return frozenset([roles] if isinstance(roles, str) else roles)
+
+def forget_token(token):
+    key = token_key(token)
+    _claims.delete(key)
+    _roles.delete(key)
+
+class auth_timer:
+    # Accumulates time spent authenticating into g.auth_seconds for the current request
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        if has_request_context():
+            first = 'auth_seconds' not in g
+            g.auth_seconds = g.get('auth_seconds', 0.0) + elapsed
+        else:
+            first = True
+        with _timing_lock:
+            _timing['seconds'] += elapsed
+            _timing['requests'] += 1 if first else 0
+        return False
+
+def stats():
+    with _timing_lock:
+        timing = dict(_timing)
+    timing['avg_ms'] = timing['seconds'] * 1000 / timing['requests'] if timing['requests'] else 0.0
+    return {'claims': _claims.stats(), 'roles': _roles.stats(), 'timing': timing}
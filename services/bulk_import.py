@@ -0,0 +1,103 @@
+import csv
+import io
+import json
+import os
+from itertools import islice
+from marshmallow import ValidationError
+from services.db import supabase
+from services.catalog import invalidate
+
+BATCH_SIZE = 500
+MAX_REPORTED_ERRORS = 1000
+CSV_TYPES = ('text/csv',)
+NDJSON_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+
+def is_supported(mimetype):
+    return mimetype in CSV_TYPES or mimetype in NDJSON_TYPES
+
+def iter_records(stream, mimetype):
+    # Yields (row_number, record, error) one row at a time so the body is never buffered whole
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    if mimetype in CSV_TYPES:
+        for row_no, row in enumerate(csv.DictReader(text), start=1):
+            # Empty cells fall back to the schema's load_default
+            yield row_no, {k: v for k, v in row.items() if k and v != ''}, None
+        return
+    row_no = 0
+    for line in text:
+        line = line.strip()
+        if not line:
+            continue
+        row_no += 1
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield row_no, None, {'_schema': ['Invalid JSON: {}'.format(e)]}
+            continue
+        if not isinstance(record, dict):
+            yield row_no, None, {'_schema': ['Invalid input type.']}
+            continue
+        yield row_no, record, None
+
+def import_records(records, schema, table, key, batch_size=BATCH_SIZE, progress=None):
+    report = {'received': 0, 'upserted': 0, 'failed': 0, 'errors': []}
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, batch_size))
+        if not chunk:
+            break
+        report['received'] += len(chunk)
+        _import_chunk(chunk, schema, table, key, report)
+        if progress:
+            progress(report['received'])
+    return report
+
+def import_file(path, mimetype, schema, table, key, progress=None):
+    # Background variant for a spooled request body; the file is removed once imported.
+    # Malformed files raise ValueError so the job is not retried.
+    try:
+        with open(path, 'rb') as f:
+            report = import_records(iter_records(f, mimetype), schema, table, key, progress=progress)
+    except csv.Error as e:
+        raise ValueError(str(e))
+    os.remove(path)
+    return report
+
+def _import_chunk(chunk, schema, table, key, report):
+    parsed = []
+    for row_no, record, error in chunk:
+        if error:
+            _add_error(report, row_no, error)
+        else:
+            parsed.append((row_no, record))
+    if not parsed:
+        return
+    try:
+        loaded = schema.load([record for _, record in parsed], many=True)
+        messages = {}
+    except ValidationError as err:
+        loaded, messages = err.valid_data, err.messages
+    # Later rows win when the same key appears twice in a batch; Postgres rejects an
+    # upsert that touches one row twice
+    accepted, rows = [], {}
+    for i, (row_no, _) in enumerate(parsed):
+        if i in messages:
+            _add_error(report, row_no, messages[i])
+        else:
+            accepted.append(row_no)
+            rows[loaded[i][key]] = dict(loaded[i], is_deleted=False)
+    if not rows:
+        return
+    try:
+        result = supabase.table(table).upsert(list(rows.values()), on_conflict=key).execute()
+    except Exception as e:
+        for row_no in accepted:
+            _add_error(report, row_no, {'_schema': [str(e)]})
+        return
+    invalidate(table, *(row['id'] for row in result.data or []))
+    report['upserted'] += len(accepted)
+
+def _add_error(report, row_no, messages):
+    report['failed'] += 1
+    if len(report['errors']) < MAX_REPORTED_ERRORS:
+        report['errors'].append({'row': row_no, 'errors': messages})
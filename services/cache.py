@@ -0,0 +1,179 @@
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+CACHE_MAXSIZE = int(os.environ.get('CACHE_MAXSIZE', 10000))
+# In-process caches are per worker, so an update made through another worker is seen
+# after at most CACHE_TTL seconds. Point CACHE_REDIS_URL at a local Redis-compatible
+# server to share entries (and invalidations) between workers.
+CACHE_TTL = float(os.environ.get('CACHE_TTL', 300))
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+
+MISSING = object()
+
+# Sets a value only if the key's version is still the one read before loading it
+SET_IF_VERSION = '''
+if (redis.call('get', KEYS[2]) or '0') == ARGV[2] then
+    return redis.call('set', KEYS[1], ARGV[1], 'EX', ARGV[3])
+end
+return false
+'''
+
+class TTLCache:
+    def __init__(self, name, maxsize=CACHE_MAXSIZE, ttl=CACHE_TTL):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        # Every delete advances _clock and records it for the key (the most recent
+        # maxsize keys; older ones are covered by _deleted_floor)
+        self._clock = 0
+        self._deleted = OrderedDict()
+        self._deleted_floor = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return MISSING
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def version(self, key):
+        # Token for set(..., version=): the set is dropped if key is deleted after this
+        with self._lock:
+            return self._clock
+
+    def set(self, key, value, ttl=None, version=None):
+        with self._lock:
+            if version is not None and self._deleted.get(key, self._deleted_floor) > version:
+                return
+            self._data[key] = (time.monotonic() + (ttl or self.ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def add(self, key, value, ttl=None):
+        # Sets key only if it is absent or expired; returns whether it was set
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] >= time.monotonic():
+                return False
+            self._data[key] = (time.monotonic() + (ttl or self.ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+            self._clock += 1
+            self._deleted[key] = self._clock
+            self._deleted.move_to_end(key)
+            while len(self._deleted) > self.maxsize:
+                self._deleted_floor = self._deleted.popitem(last=False)[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._clock += 1
+            self._deleted.clear()
+            self._deleted_floor = self._clock
+
+    def stats(self):
+        return {'backend': 'memory', 'size': len(self._data), 'hits': self.hits, 'misses': self.misses}
+
+class RedisCache:
+    # maxsize is accepted for interface parity; Redis bounds memory with its own eviction
+    def __init__(self, name, client, ttl=CACHE_TTL, maxsize=None):
+        self.name = name
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._client = client
+        self._set_if_version = client.register_script(SET_IF_VERSION)
+
+    def _key(self, key):
+        return 'mls:{}:{}'.format(self.name, key)
+
+    def _version_key(self, key):
+        return 'mls:{}:version:{}'.format(self.name, key)
+
+    def get(self, key):
+        raw = self._client.get(self._key(key))
+        if raw is None:
+            self.misses += 1
+            return MISSING
+        self.hits += 1
+        return pickle.loads(raw)
+
+    def version(self, key):
+        # Token for set(..., version=): the set is dropped if key is deleted after this
+        return (self._client.get(self._version_key(key)) or b'0').decode()
+
+    def set(self, key, value, ttl=None, version=None):
+        if version is None:
+            self._client.set(self._key(key), pickle.dumps(value), ex=int(ttl or self.ttl))
+        else:
+            self._set_if_version(keys=[self._key(key), self._version_key(key)],
+                                 args=[pickle.dumps(value), version, int(ttl or self.ttl)])
+
+    def add(self, key, value, ttl=None):
+        return bool(self._client.set(self._key(key), pickle.dumps(value), ex=int(ttl or self.ttl), nx=True))
+
+    def delete(self, key):
+        pipe = self._client.pipeline()
+        pipe.delete(self._key(key))
+        pipe.incr(self._version_key(key))
+        pipe.expire(self._version_key(key), int(self.ttl))
+        pipe.execute()
+
+    def clear(self):
+        for key in self._client.scan_iter(self._key('*')):
+            self._client.delete(key)
+
+    def stats(self):
+        return {'backend': 'redis', 'hits': self.hits, 'misses': self.misses}
+
+_caches = {}
+_redis = None
+
+def get_cache(name, **kwargs):
+    global _redis
+    if name not in _caches:
+        if CACHE_REDIS_URL and redis is not None:
+            if _redis is None:
+                _redis = redis.Redis.from_url(CACHE_REDIS_URL)
+            _caches[name] = RedisCache(name, _redis, **kwargs)
+        else:
+            _caches[name] = TTLCache(name, **kwargs)
+    return _caches[name]
+
+def read_through(cache, key, loader):
+    # None results (not found) are not cached so a later insert is visible at once. A
+    # row loaded before a concurrent invalidation (delete) is returned but not cached.
+    value = cache.get(key)
+    if value is MISSING:
+        version = cache.version(key)
+        value = loader()
+        if value is not None:
+            cache.set(key, value, version=version)
+    return value
+
+def stats():
+    return {name: cache.stats() for name, cache in _caches.items()}
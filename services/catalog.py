@@ -0,0 +1,32 @@
+from services.db import supabase
+from services.cache import get_cache, read_through
+
+# Tables whose rows are soft-deleted with is_deleted
+SOFT_DELETE_TABLES = ('products', 'suppliers')
+
+def _load(table, row_id):
+    query = supabase.table(table).select('*').eq('id', row_id)
+    if table in SOFT_DELETE_TABLES:
+        query = query.eq('is_deleted', False)
+    rows = query.limit(1).execute().data
+    return rows[0] if rows else None
+
+def get_row(table, row_id):
+    return read_through(get_cache(table), row_id, lambda: _load(table, row_id))
+
+def invalidate(table, *row_ids):
+    cache = get_cache(table)
+    for row_id in row_ids:
+        cache.delete(row_id)
+
+def get_product(product_id):
+    return get_row('products', product_id)
+
+def get_supplier(supplier_id):
+    return get_row('suppliers', supplier_id)
+
+def get_category(category_id):
+    return get_row('categories', category_id)
+
+def get_unit(unit_id):
+    return get_row('units', unit_id)
@@ -0,0 +1,125 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from services.db import supabase
+from services.movements import LEDGER_COLUMNS, LOCATION_KEY, movement_deltas, _reversed_originals
+
+POLL_INTERVAL = float(os.environ.get('CHANGE_FEED_POLL_INTERVAL', 0.5))
+POLL_BATCH = 1000
+# Recent events kept in memory; subscribers resuming from further back read the ledger
+BUFFER_SIZE = 10000
+# The poller stops querying this long after the last subscriber leaves
+IDLE_AFTER = 30.0
+# Movement ids are allocated before commit, so a lower id can become visible after a
+# higher one was read. Each movement is held back this long after it is first read and
+# events are released strictly in id order, so a transaction committing within the
+# window is still delivered before anything after it.
+COMMIT_LAG = float(os.environ.get('CHANGE_FEED_LAG', 2.0))
+FEED_COLUMNS = LEDGER_COLUMNS + ',created_at'
+
+log = logging.getLogger(__name__)
+
+def to_event(movement, original=None):
+    # A balance delta for one location, keyed by the movement id it came from
+    event = {k: movement.get(k) for k in LOCATION_KEY}
+    event.update(id=movement['id'], movement_type=movement['movement_type'], created_at=movement.get('created_at'),
+                 deltas=movement_deltas(movement, original))
+    return event
+
+def to_events(movements):
+    originals = _reversed_originals(movements)
+    return [to_event(m, originals.get(m.get('ref_id'))) for m in movements]
+
+def latest_id():
+    rows = supabase.table('stock_movements').select('id').order('id', desc=True).limit(1).execute().data
+    return rows[0]['id'] if rows else 0
+
+def read_events(after_id, limit=POLL_BATCH):
+    rows = (supabase.table('stock_movements').select(FEED_COLUMNS).gt('id', after_id)
+            .order('id').limit(limit).execute().data or [])
+    return to_events(rows)
+
+# One poller per worker process reads new movements and fans them out to every open
+# stream, so N connected dashboards cost one query per interval instead of N.
+class ChangeFeed:
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._events = deque(maxlen=BUFFER_SIZE)
+        self._floor = 0
+        self._last_id = 0
+        # Movement id -> time.monotonic() it was first read, until it is released
+        self._held = {}
+        self._pid = None
+        self._last_wanted = 0.0
+
+    def _ensure(self):
+        self._last_wanted = time.monotonic()
+        if self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            self._floor = self._last_id = latest_id()
+            self._events.clear()
+            self._held.clear()
+            threading.Thread(target=self._run, name='change-feed', daemon=True).start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            if time.monotonic() - self._last_wanted > IDLE_AFTER:
+                # Nobody listening; restart from the ledger head when someone returns
+                with self._cond:
+                    self._pid = None
+                return
+            try:
+                self.poll()
+            except Exception:
+                log.warning('Change feed poll failed', exc_info=True)
+            time.sleep(POLL_INTERVAL)
+
+    def poll(self):
+        events = read_events(self._last_id)
+        while events:
+            now = time.monotonic()
+            first_read = [self._held.setdefault(event['id'], now) for event in events]
+            ready = []
+            for event, seen in zip(events, first_read):
+                if now - seen < COMMIT_LAG:
+                    break
+                ready.append(event)
+            if ready:
+                with self._cond:
+                    for event in ready:
+                        if len(self._events) == self._events.maxlen:
+                            self._floor = self._events[0]['id']
+                        self._events.append(event)
+                        self._held.pop(event['id'], None)
+                    self._last_id = ready[-1]['id']
+                    self._cond.notify_all()
+            if len(ready) < len(events) or len(events) < POLL_BATCH:
+                break
+            events = read_events(self._last_id)
+
+    def head(self):
+        self._ensure()
+        return self._last_id
+
+    def since(self, after_id, limit=POLL_BATCH):
+        # Events after after_id, from memory when the buffer reaches back that far and
+        # from the ledger otherwise
+        self._ensure()
+        with self._cond:
+            if after_id >= self._floor:
+                return [e for e in self._events if e['id'] > after_id][:limit]
+        return read_events(after_id, limit)
+
+    def wait(self, after_id, timeout):
+        # Blocks until an event after after_id is available or timeout passes
+        self._ensure()
+        with self._cond:
+            return self._cond.wait_for(lambda: self._last_id > after_id, timeout)
+
+feed = ChangeFeed()
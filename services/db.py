@@ -0,0 +1,224 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+import httpx
+from postgrest import SyncPostgrestClient, AsyncPostgrestClient
+
+SUPABASE_URL = os.environ.get('SUPABASE_URL', '')
+SUPABASE_KEY = os.environ.get('SUPABASE_KEY', '')
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 20))
+KEEPALIVE_EXPIRY = 30.0
+TIMEOUT = float(os.environ.get('DB_TIMEOUT', 10))
+CONNECT_TIMEOUT = 3.0
+# Connect failures are retried for every method since nothing reached the server
+CONNECT_RETRIES = 2
+READ_RETRIES = 3
+RETRY_BACKOFF = 0.1
+RETRY_STATUSES = (502, 503, 504)
+IDEMPOTENT_METHODS = ('GET', 'HEAD')
+
+_timeout = ContextVar('db_timeout', default=None)
+# Set per request by the metrics hooks: a list that receives one entry per PostgREST call
+_query_log = ContextVar('db_query_log', default=None)
+_totals_lock = threading.Lock()
+_totals = {'requests': 0, 'errors': 0, 'rows': 0, 'bytes': 0, 'seconds': 0.0}
+
+@contextmanager
+def timeout(seconds):
+    # Per-call override: `with timeout(2): supabase.table(...).execute()`
+    token = _timeout.set(httpx.Timeout(seconds, connect=min(seconds, CONNECT_TIMEOUT)))
+    try:
+        yield
+    finally:
+        _timeout.reset(token)
+
+def _limits():
+    return httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE,
+                        keepalive_expiry=KEEPALIVE_EXPIRY)
+
+def _apply_timeout(request):
+    override = _timeout.get()
+    if override is not None:
+        request.extensions['timeout'] = override.as_dict()
+
+def _retries(request):
+    return READ_RETRIES if request.method in IDEMPOTENT_METHODS else 0
+
+def _backoff(attempt):
+    # Full jitter so workers that failed together do not retry together
+    return random.uniform(0, RETRY_BACKOFF * 2 ** attempt)
+
+def _rows(response):
+    # PostgREST reports the returned range as `0-24/*` (or `*/0` when empty)
+    content_range = response.headers.get('content-range', '')
+    span = content_range.split('/')[0]
+    if '-' not in span:
+        return 0
+    first, _, last = span.partition('-')
+    try:
+        return int(last) - int(first) + 1
+    except ValueError:
+        return 0
+
+def _record(request, response, started):
+    elapsed = time.perf_counter() - started
+    entry = {
+        'method': request.method,
+        'path': request.url.path.rsplit('/rest/v1/', 1)[-1],
+        'query': request.url.query.decode('ascii', 'replace'),
+        'status': response.status_code if response is not None else None,
+        'rows': _rows(response) if response is not None else 0,
+        'bytes': len(response.content) if response is not None else 0,
+        'ms': round(elapsed * 1000, 2),
+    }
+    with _totals_lock:
+        _totals['requests'] += 1
+        _totals['errors'] += 1 if response is None or response.status_code >= 400 else 0
+        _totals['rows'] += entry['rows']
+        _totals['bytes'] += entry['bytes']
+        _totals['seconds'] += elapsed
+    log = _query_log.get()
+    if log is not None:
+        log.append(entry)
+
+def start_query_log():
+    # Collects every PostgREST call made in this context from now on, including those
+    # run through gather(); returns the list that receives them
+    log = []
+    _query_log.set(log)
+    return log
+
+def stop_query_log():
+    _query_log.set(None)
+
+def totals():
+    with _totals_lock:
+        return dict(_totals)
+
+class RetryTransport(httpx.HTTPTransport):
+    def handle_request(self, request):
+        started = time.perf_counter()
+        response = None
+        try:
+            response = self._send(request)
+            response.read()
+            return response
+        finally:
+            _record(request, response, started)
+
+    def _send(self, request):
+        _apply_timeout(request)
+        retries = _retries(request)
+        for attempt in range(retries + 1):
+            try:
+                response = super().handle_request(request)
+            except (httpx.TimeoutException, httpx.NetworkError):
+                if attempt == retries:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == retries:
+                    return response
+                response.close()
+            time.sleep(_backoff(attempt))
+
+class AsyncRetryTransport(httpx.AsyncHTTPTransport):
+    async def handle_async_request(self, request):
+        started = time.perf_counter()
+        response = None
+        try:
+            response = await self._send(request)
+            await response.aread()
+            return response
+        finally:
+            _record(request, response, started)
+
+    async def _send(self, request):
+        _apply_timeout(request)
+        retries = _retries(request)
+        for attempt in range(retries + 1):
+            try:
+                response = await super().handle_async_request(request)
+            except (httpx.TimeoutException, httpx.NetworkError):
+                if attempt == retries:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == retries:
+                    return response
+                await response.aclose()
+            await asyncio.sleep(_backoff(attempt))
+
+# Pooled PostgREST access with the same table()/rpc() surface as the supabase client.
+# Clients are created lazily per process so forked workers never share sockets. `aio`
+# is an async client running on a background event loop; `gather` runs a set of its
+# queries concurrently from synchronous request handlers.
+class Database:
+    def __init__(self, url, key):
+        self.rest_url = url.rstrip('/') + '/rest/v1'
+        self.headers = {'apikey': key, 'Authorization': 'Bearer {}'.format(key)}
+        self._lock = threading.Lock()
+        self._pid = None
+        self._client = None
+        self._aio = None
+        self._loop = None
+
+    def _ensure(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            http = httpx.Client(timeout=httpx.Timeout(TIMEOUT, connect=CONNECT_TIMEOUT),
+                                transport=RetryTransport(limits=_limits(), retries=CONNECT_RETRIES))
+            self._client = SyncPostgrestClient(self.rest_url, headers=self.headers, http_client=http)
+            self._aio = None
+            self._loop = None
+            self._pid = os.getpid()
+
+    def _ensure_aio(self):
+        self._ensure()
+        with self._lock:
+            if self._aio is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='db-aio', daemon=True).start()
+                http = httpx.AsyncClient(timeout=httpx.Timeout(TIMEOUT, connect=CONNECT_TIMEOUT),
+                                         transport=AsyncRetryTransport(limits=_limits(), retries=CONNECT_RETRIES))
+                self._aio = AsyncPostgrestClient(self.rest_url, headers=self.headers, http_client=http)
+                self._loop = loop
+        return self._aio, self._loop
+
+    @property
+    def client(self):
+        self._ensure()
+        return self._client
+
+    @property
+    def aio(self):
+        return self._ensure_aio()[0]
+
+    def table(self, name):
+        return self.client.from_(name)
+
+    def from_(self, name):
+        return self.table(name)
+
+    def rpc(self, fn, params):
+        return self.client.rpc(fn, params)
+
+    def gather(self, *queries, timeout=None):
+        # queries are builders from `aio`; returns their responses in order, with the
+        # exception in place of any query that failed
+        _, loop = self._ensure_aio()
+        log, override = _query_log.get(), _timeout.get()
+        async def run():
+            # The loop thread does not share the caller's context; carry the query log and
+            # any timeout() override over
+            _query_log.set(log)
+            _timeout.set(override)
+            return await asyncio.gather(*(q.execute() for q in queries), return_exceptions=True)
+        return asyncio.run_coroutine_threadsafe(run(), loop).result(timeout or TIMEOUT * (READ_RETRIES + 1))
+
+supabase = Database(SUPABASE_URL, SUPABASE_KEY)
@@ -0,0 +1,221 @@
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from services.auth_cache import current_user_id
+
+# Local job queue for work too long for a request (large PO receipts, catalog imports,
+# balance rebuilds). Jobs live in a SQLite file shared by every worker process on the
+# host; each process runs a small thread pool that claims queued jobs, so no broker is
+# needed. Handlers are registered by the modules that own the work.
+JOBS_DB = os.environ.get('JOBS_DB', os.path.join(tempfile.gettempdir(), 'mls-jobs.sqlite3'))
+JOBS_SPOOL_DIR = os.environ.get('JOBS_SPOOL_DIR', os.path.join(tempfile.gettempdir(), 'mls-jobs'))
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+POLL_INTERVAL = 1.0
+# A running job whose heartbeat is older than this is requeued; run_job refreshes it
+# every STALE_AFTER / 3 while the handler runs, so only dead workers go stale
+STALE_AFTER = float(os.environ.get('JOB_STALE_AFTER', 600))
+RETRY_BACKOFF = 5.0
+# Finished jobs are kept this long for polling
+RETENTION = 7 * 86400
+STATES = ('queued', 'running', 'succeeded', 'failed')
+
+log = logging.getLogger(__name__)
+
+_handlers = {}
+_local = threading.local()
+_start_lock = threading.Lock()
+_started_pid = None
+_wakeup = threading.Event()
+
+SCHEMA = '''
+create table if not exists jobs (
+    id text primary key,
+    type text not null,
+    user_id text,
+    state text not null default 'queued',
+    payload text not null,
+    result text,
+    error text,
+    attempts integer not null default 0,
+    max_attempts integer not null default 1,
+    progress_done integer not null default 0,
+    progress_total integer,
+    created_at real not null,
+    run_after real not null,
+    started_at real,
+    finished_at real,
+    heartbeat real
+);
+create index if not exists jobs_queue_idx on jobs (state, run_after);
+'''
+
+def register(job_type, handler, concurrency=1, max_attempts=3):
+    # handler(payload, progress) -> JSON-serializable result; progress(done, total=None).
+    # concurrency caps running jobs of this type across every process on the host.
+    # Only handlers that are safe to run twice should allow more than one attempt; a
+    # ValueError from the handler is treated as bad input and never retried.
+    _handlers[job_type] = {'handler': handler, 'concurrency': concurrency, 'max_attempts': max_attempts}
+
+def _db():
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.pid != os.getpid():
+        conn = sqlite3.connect(JOBS_DB, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute('pragma journal_mode=wal')
+        conn.executescript(SCHEMA)
+        if 'user_id' not in {col['name'] for col in conn.execute('pragma table_info(jobs)')}:
+            # Job files created before jobs recorded who enqueued them
+            conn.execute('alter table jobs add column user_id text')
+        _local.conn, _local.pid = conn, os.getpid()
+    return conn
+
+def enqueue(job_type, payload):
+    # The job belongs to the user of the request enqueuing it (see get_job)
+    if job_type not in _handlers:
+        raise ValueError('Unknown job type: {}'.format(job_type))
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    user_id = current_user_id()
+    _db().execute(
+        'insert into jobs (id, type, user_id, payload, max_attempts, created_at, run_after) values (?, ?, ?, ?, ?, ?, ?)',
+        (job_id, job_type, None if user_id is None else str(user_id), json.dumps(payload),
+         _handlers[job_type]['max_attempts'], now, now))
+    start_workers()
+    _wakeup.set()
+    return job_id
+
+def get_job(job_id):
+    row = _db().execute('select * from jobs where id = ?', (job_id,)).fetchone()
+    if row is None:
+        return None
+    job = {k: row[k] for k in ('id', 'type', 'user_id', 'state', 'attempts', 'max_attempts', 'error')}
+    job['progress'] = {'done': row['progress_done'], 'total': row['progress_total']}
+    job['result'] = json.loads(row['result']) if row['result'] is not None else None
+    for col in ('created_at', 'started_at', 'finished_at'):
+        job[col] = _iso(row[col])
+    return job
+
+def spool(stream, suffix=''):
+    # Copies a request body to a file the job can read after the request has ended
+    os.makedirs(JOBS_SPOOL_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=JOBS_SPOOL_DIR)
+    with os.fdopen(fd, 'wb') as f:
+        while True:
+            chunk = stream.read(1 << 16)
+            if not chunk:
+                break
+            f.write(chunk)
+    return path
+
+def claim():
+    # Takes the oldest runnable job whose type is below its concurrency limit. BEGIN
+    # IMMEDIATE holds SQLite's write lock, so two processes cannot claim the same job.
+    conn = _db()
+    now = time.time()
+    conn.execute('begin immediate')
+    try:
+        # Jobs whose worker died are retried if they have attempts left, else failed
+        conn.execute("update jobs set state = 'queued', run_after = ? "
+                     "where state = 'running' and heartbeat < ? and attempts < max_attempts", (now, now - STALE_AFTER))
+        conn.execute("update jobs set state = 'failed', error = 'Worker stopped responding', finished_at = ? "
+                     "where state = 'running' and heartbeat < ?", (now, now - STALE_AFTER))
+        running = dict(conn.execute("select type, count(*) from jobs where state = 'running' group by type").fetchall())
+        open_types = [t for t, h in _handlers.items() if running.get(t, 0) < h['concurrency']]
+        row = None
+        if open_types:
+            row = conn.execute(
+                "select id, type, payload, attempts, max_attempts from jobs where state = 'queued' and run_after <= ? "
+                'and type in ({}) order by created_at limit 1'.format(','.join('?' * len(open_types))),
+                [now] + open_types).fetchone()
+        if row is not None:
+            conn.execute("update jobs set state = 'running', attempts = attempts + 1, started_at = ?, heartbeat = ? where id = ?",
+                         (now, now, row['id']))
+        conn.execute('commit')
+    except BaseException:
+        conn.execute('rollback')
+        raise
+    return row
+
+def _beat(job_id, attempt, stop):
+    # Keeps the heartbeat fresh until the handler returns, whether or not it reports progress
+    while not stop.wait(STALE_AFTER / 3):
+        try:
+            _db().execute("update jobs set heartbeat = ? where id = ? and state = 'running' and attempts = ?",
+                          (time.time(), job_id, attempt))
+        except sqlite3.Error:
+            log.warning('Heartbeat for job %s failed', job_id, exc_info=True)
+
+def run_job(row):
+    conn = _db()
+    job_id = row['id']
+    attempt = row['attempts'] + 1
+    def progress(done, total=None):
+        conn.execute('update jobs set progress_done = ?, progress_total = coalesce(?, progress_total), heartbeat = ? where id = ?',
+                     (done, total, time.time(), job_id))
+    # Final updates only apply to this run; one that was reaped as stale must not
+    # overwrite the state the reaper or a newer attempt set
+    current = "where id = ? and state = 'running' and attempts = ?"
+    stop = threading.Event()
+    threading.Thread(target=_beat, args=(job_id, attempt, stop), name='job-heartbeat', daemon=True).start()
+    try:
+        result = _handlers[row['type']]['handler'](json.loads(row['payload']), progress)
+    except Exception as e:
+        retry = not isinstance(e, ValueError) and attempt < row['max_attempts']
+        if retry:
+            conn.execute("update jobs set state = 'queued', error = ?, run_after = ? " + current,
+                         (str(e), time.time() + RETRY_BACKOFF * 2 ** (attempt - 1), job_id, attempt))
+        else:
+            log.exception('Job %s (%s) failed', job_id, row['type'])
+            conn.execute("update jobs set state = 'failed', error = ?, finished_at = ? " + current,
+                         (str(e), time.time(), job_id, attempt))
+        return
+    finally:
+        stop.set()
+    conn.execute("update jobs set state = 'succeeded', result = ?, error = null, finished_at = ? " + current,
+                 (json.dumps(result), time.time(), job_id, attempt))
+
+def purge(older_than=RETENTION):
+    cutoff = time.time() - older_than
+    _db().execute("delete from jobs where state in ('succeeded', 'failed') and finished_at < ?", (cutoff,))
+    # Spooled bodies of jobs that failed for good are left for inspection until then
+    if os.path.isdir(JOBS_SPOOL_DIR):
+        for name in os.listdir(JOBS_SPOOL_DIR):
+            path = os.path.join(JOBS_SPOOL_DIR, name)
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+
+def _worker():
+    while True:
+        try:
+            row = claim()
+        except sqlite3.Error:
+            log.exception('Job claim failed')
+            row = None
+        if row is None:
+            _wakeup.wait(POLL_INTERVAL)
+            _wakeup.clear()
+            continue
+        run_job(row)
+
+def start_workers(threads=JOB_WORKERS):
+    # Started once per process, on first use, so forked web workers each get their own pool
+    global _started_pid
+    if _started_pid == os.getpid() or threads < 1:
+        return
+    with _start_lock:
+        if _started_pid == os.getpid():
+            return
+        purge()
+        for i in range(threads):
+            threading.Thread(target=_worker, name='job-worker-{}'.format(i), daemon=True).start()
+        _started_pid = os.getpid()
+
+def _iso(ts):
+    if ts is None:
+        return None
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(ts))
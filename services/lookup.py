@@ -0,0 +1,207 @@
+import logging
+import os
+import threading
+import time
+from services.db import supabase
+from services.movements import iter_pages
+
+# Rebuilt in the background this often so writes made through other workers show up
+LOOKUP_REFRESH = float(os.environ.get('LOOKUP_REFRESH', 300))
+PAGE_SIZE = 5000
+# When one code matches several things, the most specific wins
+KINDS = ('barcode', 'variant_sku', 'product_sku')
+PRODUCT_COLUMNS = 'id,name,sku'
+VARIANT_COLUMNS = 'id,product_id,sku,barcode,attributes,status'
+BARCODE_COLUMNS = 'id,product_id,variant_id,code,type'
+
+log = logging.getLogger(__name__)
+
+def normalize(code):
+    # Scanners add whitespace and SKUs are typed in either case
+    return str(code).strip().upper()
+
+# Base for per-worker in-memory indexes: built on first use (or warm() at startup) and
+# rebuilt in the background once older than `refresh` seconds. Subclasses implement
+# _load(), which queries without holding the lock, and _install(state), run under it.
+# The first build is single-flight: concurrent cold callers wait for it instead of each
+# scanning the catalog. Incremental writes go through _apply(), which also replays them
+# onto any state still loading so a rebuild does not drop them.
+class RefreshingIndex:
+    refresh = LOOKUP_REFRESH
+    thread_name = 'index-rebuild'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._built = False
+        self._built_at = 0.0
+        self._rebuilding = False
+        self._state = None
+        # One list per rebuild in _load(), receiving the writes made meanwhile
+        self._journals = []
+
+    def rebuild(self):
+        journal = []
+        with self._lock:
+            self._journals.append(journal)
+        try:
+            state = self._load()
+            with self._lock:
+                for write in journal:
+                    write(state)
+                self._install(state)
+                self._built = True
+                self._built_at = time.monotonic()
+                self._rebuilding = False
+        finally:
+            with self._lock:
+                self._journals.remove(journal)
+
+    def _apply(self, write):
+        # write(state) updates a state in place. It is applied to the installed state and
+        # recorded for every rebuild still loading, which may have read the catalog before
+        # the write committed.
+        with self._lock:
+            if self._built:
+                write(self._state)
+            for journal in self._journals:
+                journal.append(write)
+
+    def warm(self):
+        # Call at startup to build before the first request arrives
+        if not self._built:
+            with self._build_lock:
+                if not self._built:
+                    self.rebuild()
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        def run():
+            try:
+                self.rebuild()
+            except Exception:
+                log.warning('%s rebuild failed', type(self).__name__, exc_info=True)
+                with self._lock:
+                    self._rebuilding = False
+        threading.Thread(target=run, name=self.thread_name, daemon=True).start()
+
+    def refresh_soon(self):
+        # For bulk writes: keep serving the current index and swap in a rebuilt one
+        if self._built:
+            self._refresh_in_background()
+
+    def _ready(self):
+        if not self._built:
+            self.warm()
+        elif time.monotonic() - self._built_at > self.refresh:
+            self._refresh_in_background()
+
+    def age(self):
+        return time.monotonic() - self._built_at if self._built else None
+
+# In-memory hash index from scanned code to product/variant. Each kind is a dict from
+# normalized code to row. A rebuild swaps in the (codes, products, variants) tuple
+# whole and readers take it in one read, so lookups never take a lock and never mix
+# dicts from two builds.
+class CodeIndex(RefreshingIndex):
+    thread_name = 'lookup-rebuild'
+
+    def _load(self):
+        products, variants = {}, {}
+        codes = {kind: {} for kind in KINDS}
+        for rows in iter_pages(lambda: supabase.table('products').select(PRODUCT_COLUMNS).eq('is_deleted', False), page_size=PAGE_SIZE):
+            for row in rows:
+                products[row['id']] = row
+                codes['product_sku'][normalize(row['sku'])] = row['id']
+        for rows in iter_pages(lambda: supabase.table('product_variants').select(VARIANT_COLUMNS), page_size=PAGE_SIZE):
+            for row in rows:
+                variants[row['id']] = row
+                codes['variant_sku'][normalize(row['sku'])] = row['id']
+                if row.get('barcode'):
+                    codes['barcode'][normalize(row['barcode'])] = {'product_id': row['product_id'], 'variant_id': row['id']}
+        for rows in iter_pages(lambda: supabase.table('barcodes').select(BARCODE_COLUMNS), page_size=PAGE_SIZE):
+            for row in rows:
+                codes['barcode'][normalize(row['code'])] = {'product_id': row['product_id'], 'variant_id': row.get('variant_id'),
+                                                            'type': row.get('type')}
+        return codes, products, variants
+
+    def _install(self, state):
+        self._state = state
+
+    def lookup(self, code):
+        # Returns {'code', 'kind', 'product', 'variant'} or None
+        self._ready()
+        codes, products, variants = self._state
+        key = normalize(code)
+        for kind in KINDS:
+            hit = codes[kind].get(key)
+            if hit is None:
+                continue
+            if kind == 'barcode':
+                product_id, variant_id = hit['product_id'], hit.get('variant_id')
+            elif kind == 'variant_sku':
+                variant = variants.get(hit)
+                if variant is None:
+                    continue
+                variant_id, product_id = hit, variant['product_id']
+            else:
+                product_id, variant_id = hit, None
+            product = products.get(product_id)
+            if product is None:
+                # Deleted product, or indexed before its product was seen
+                continue
+            return {'code': code, 'kind': kind, 'product': product,
+                    'variant': variants.get(variant_id) if variant_id else None}
+        return None
+
+    def lookup_many(self, codes):
+        return [self.lookup(code) for code in codes]
+
+    # Incremental updates from this worker's write paths, applied to the current dicts
+    # in place (and to a rebuild in progress)
+    def add_product(self, product):
+        row = {'id': product['id'], 'name': product['name'], 'sku': product['sku']}
+        def write(state):
+            codes, products, _ = state
+            previous = products.get(row['id'])
+            if previous and normalize(previous['sku']) != normalize(row['sku']):
+                codes['product_sku'].pop(normalize(previous['sku']), None)
+            products[row['id']] = row
+            codes['product_sku'][normalize(row['sku'])] = row['id']
+        self._apply(write)
+
+    def remove_product(self, product_id):
+        def write(state):
+            codes, products, _ = state
+            product = products.pop(product_id, None)
+            if product:
+                codes['product_sku'].pop(normalize(product['sku']), None)
+        self._apply(write)
+
+    def add_variants(self, variants):
+        rows = [{k: row.get(k) for k in VARIANT_COLUMNS.split(',')} for row in variants]
+        def write(state):
+            codes, _, indexed = state
+            for row in rows:
+                indexed[row['id']] = row
+                codes['variant_sku'][normalize(row['sku'])] = row['id']
+                if row.get('barcode'):
+                    codes['barcode'][normalize(row['barcode'])] = {'product_id': row['product_id'], 'variant_id': row['id']}
+        self._apply(write)
+
+    def add_barcodes(self, barcodes):
+        entries = [(normalize(row['code']), {'product_id': row['product_id'], 'variant_id': row.get('variant_id'),
+                                             'type': row.get('type')}) for row in barcodes]
+        def write(state):
+            state[0]['barcode'].update(entries)
+        self._apply(write)
+
+    def stats(self):
+        codes = self._state[0] if self._state else {}
+        return {'built': self._built, 'age_seconds': self.age(),
+                **{kind: len(codes.get(kind, {})) for kind in KINDS}}
+
+index = CodeIndex()
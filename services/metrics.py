@@ -0,0 +1,122 @@
+import random
+import threading
+
+# In-process metric families rendered in the Prometheus text format. Values are per
+# worker process; scrape each worker (or aggregate) when running several.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+BYTE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+QUANTILES = (0.5, 0.95, 0.99)
+RESERVOIR_SIZE = 1024
+
+class Histogram:
+    # Cumulative buckets for Prometheus plus a uniform reservoir sample (Algorithm R) so
+    # p50/p95/p99 can be reported directly
+    def __init__(self, buckets, reservoir=False):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.sample = [] if reservoir else None
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        if self.sample is not None:
+            if len(self.sample) < RESERVOIR_SIZE:
+                self.sample.append(value)
+            else:
+                slot = random.randrange(self.count)
+                if slot < RESERVOIR_SIZE:
+                    self.sample[slot] = value
+
+    def quantile(self, q):
+        if not self.sample:
+            return 0.0
+        ordered = sorted(self.sample)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._families = {}
+
+    def _family(self, name, kind, help_text, **kwargs):
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = {'kind': kind, 'help': help_text, 'series': {}, 'kwargs': kwargs}
+        return family
+
+    def inc(self, name, help_text, labels, value=1):
+        with self._lock:
+            series = self._family(name, 'counter', help_text)['series']
+            series[labels] = series.get(labels, 0) + value
+
+    def observe(self, name, help_text, labels, value, buckets, summary=None):
+        # summary names a companion summary family with p50/p95/p99 from a reservoir
+        with self._lock:
+            series = self._family(name, 'histogram', help_text, summary=summary)['series']
+            histogram = series.get(labels)
+            if histogram is None:
+                histogram = series[labels] = Histogram(buckets, reservoir=summary is not None)
+            histogram.observe(value)
+
+    def quantiles(self, name):
+        # {labels: {quantile: value}} for a histogram observed with a summary
+        with self._lock:
+            family = self._families.get(name, {'series': {}})
+            return {labels: {q: h.quantile(q) for q in QUANTILES} for labels, h in family['series'].items()
+                    if h.sample is not None}
+
+    def render(self, gauges=()):
+        # gauges: (name, help, kind, [(labels, value)]) computed at scrape time
+        lines = []
+        with self._lock:
+            for name, family in sorted(self._families.items()):
+                lines.append('# HELP {} {}'.format(name, family['help']))
+                lines.append('# TYPE {} {}'.format(name, family['kind']))
+                series = sorted(family['series'].items())
+                for labels, value in series:
+                    if family['kind'] == 'counter':
+                        lines.append(_sample(name, labels, value))
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(value.buckets, value.counts):
+                        cumulative += count
+                        lines.append(_sample(name + '_bucket', labels + (('le', _number(bound)),), cumulative))
+                    lines.append(_sample(name + '_bucket', labels + (('le', '+Inf'),), value.count))
+                    lines.append(_sample(name + '_sum', labels, value.sum))
+                    lines.append(_sample(name + '_count', labels, value.count))
+                summary = family['kwargs'].get('summary')
+                if summary:
+                    lines.append('# HELP {} {} (sampled quantiles)'.format(summary, family['help']))
+                    lines.append('# TYPE {} summary'.format(summary))
+                    for labels, value in series:
+                        for q in QUANTILES:
+                            lines.append(_sample(summary, labels + (('quantile', _number(q)),), value.quantile(q)))
+                        lines.append(_sample(summary + '_sum', labels, value.sum))
+                        lines.append(_sample(summary + '_count', labels, value.count))
+        for name, help_text, kind, samples in gauges:
+            lines.append('# HELP {} {}'.format(name, help_text))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            for labels, value in samples:
+                lines.append(_sample(name, labels, value))
+        return '\n'.join(lines) + '\n'
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _sample(name, labels, value):
+    if labels:
+        name += '{' + ','.join('{}="{}"'.format(k, _escape(v)) for k, v in labels) + '}'
+    return '{} {}'.format(name, _number(value))
+
+registry = Registry()
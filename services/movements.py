@@ -0,0 +1,175 @@
+import random
+import time
+from collections import defaultdict
+from decimal import Decimal
+import numpy as np
+from postgrest.exceptions import APIError
+from services.db import supabase
+
+BALANCE_COLUMNS = ('qty_on_hand', 'qty_reserved', 'qty_damaged', 'qty_in_transit')
+LOCATION_KEY = ('product_id', 'warehouse_id', 'bin_id', 'batch_id', 'serial_number')
+REBUILD_PAGE_SIZE = 5000
+UPSERT_BATCH_SIZE = 1000
+MAX_RETRIES = 3
+RETRY_BACKOFF = 0.05
+INSUFFICIENT_STOCK_CODE = '23514'
+# Serialization failure / deadlock between concurrent pickers locking the same rows
+RETRYABLE_CODES = ('40001', '40P01')
+
+# Sign applied to the movement quantity for each balance column. adjustment and
+# cycle_count carry a signed quantity (negative to reduce stock).
+MOVEMENT_DELTAS = {
+    'purchase': {'qty_on_hand': 1},
+    'goods_receipt': {'qty_on_hand': 1},
+    'sale': {'qty_on_hand': -1},
+    'goods_issue': {'qty_on_hand': -1},
+    'transfer_in': {'qty_on_hand': 1},
+    'transfer_out': {'qty_on_hand': -1},
+    'return': {'qty_on_hand': 1},
+    'customer_return': {'qty_on_hand': 1},
+    'supplier_return': {'qty_on_hand': -1},
+    'damage': {'qty_on_hand': -1, 'qty_damaged': 1},
+    'write_off': {'qty_on_hand': -1},
+    'adjustment': {'qty_on_hand': 1},
+    'cycle_count': {'qty_on_hand': 1},
+}
+
+class InsufficientStock(ValueError):
+    pass
+
+MOVEMENT_TYPES = tuple(MOVEMENT_DELTAS)
+TYPE_INDEX = {t: i for i, t in enumerate(MOVEMENT_TYPES)}
+# Row i holds the sign applied to each balance column by MOVEMENT_TYPES[i]
+DELTA_SIGNS = np.array([[MOVEMENT_DELTAS[t].get(c, 0) for c in BALANCE_COLUMNS] for t in MOVEMENT_TYPES], dtype=np.int64)
+
+def movement_deltas(movement, original=None):
+    # A reversal undoes the movement it references (ref_id)
+    if movement['movement_type'] == 'reversal':
+        if original is None:
+            raise ValueError('Reversal requires the original movement')
+        return {col: -qty for col, qty in movement_deltas(original).items()}
+    signs = MOVEMENT_DELTAS.get(movement['movement_type'])
+    if signs is None:
+        raise ValueError('Unknown movement type: {}'.format(movement['movement_type']))
+    return {col: sign * movement['quantity'] for col, sign in signs.items()}
+
+def location_key(row):
+    return tuple(row.get(k) for k in LOCATION_KEY)
+
+def movement_payload(movements):
+    # [{'movement', 'deltas'}] as apply_stock_movements (migrations/003 and 007) takes them
+    originals = _reversed_originals(movements)
+    return [{'movement': m, 'deltas': movement_deltas(m, originals.get(m.get('ref_id')))}
+            for m in movements]
+
+def post_movements_rpc(name, params):
+    # Runs an RPC that posts stock movements in one transaction. Serialization failures
+    # and deadlocks roll the whole call back, so it is retried; a failed stock check
+    # raises InsufficientStock.
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            return supabase.rpc(name, params).execute().data
+        except APIError as e:
+            if e.code == INSUFFICIENT_STOCK_CODE:
+                raise InsufficientStock(e.message)
+            if e.code not in RETRYABLE_CODES or attempt == MAX_RETRIES:
+                raise
+            time.sleep(random.uniform(0, RETRY_BACKOFF * 2 ** attempt))
+
+def apply_movements(movements):
+    # Inserts the movements and applies their deltas to inventory in one transaction
+    # (apply_stock_movements, migrations/003 and 007); returns the inserted movement rows.
+    # Outbound movements are checked against the stock summed over bins/batches under
+    # row locks, so concurrent callers cannot oversell.
+    return post_movements_rpc('apply_stock_movements', {'p_movements': movement_payload(movements)})
+
+LEDGER_COLUMNS = ','.join(('id', 'movement_type', 'quantity', 'ref_id') + LOCATION_KEY)
+
+def new_balances():
+    return defaultdict(lambda: dict.fromkeys(BALANCE_COLUMNS, 0))
+
+def iter_pages(build_query, after_id=0, page_size=REBUILD_PAGE_SIZE):
+    # Pages of rows in id order; build_query returns a fresh, filtered builder
+    while True:
+        rows = build_query().gt('id', after_id).order('id').limit(page_size).execute().data or []
+        if rows:
+            yield rows
+        if len(rows) < page_size:
+            return
+        after_id = rows[-1]['id']
+
+def accumulate(balances, movements, last_ids=None):
+    originals = _reversed_originals(movements)
+    for m in movements:
+        key = location_key(m)
+        balance = balances[key]
+        for col, qty in movement_deltas(m, originals.get(m.get('ref_id'))).items():
+            balance[col] += qty
+        if last_ids is not None:
+            last_ids[key] = m['id']
+
+def scaled_quantities(quantities):
+    # Quantities (numeric columns) as exact integers at a common decimal scale:
+    # (int64 array, places), so 0.1 becomes 1 at places=1
+    decimals = [Decimal(str(q)) for q in quantities]
+    places = max([0] + [-d.as_tuple().exponent for d in decimals])
+    return np.array([int(d.scaleb(places)) for d in decimals], dtype=np.int64), places
+
+def unscaled(value, places):
+    # Inverse of scaled_quantities for one value. A fractional result is returned as the
+    # float whose shortest repr is the exact decimal, which is what gets written to numeric.
+    exact = Decimal(int(value)).scaleb(-places)
+    return int(exact) if exact == exact.to_integral_value() else float(exact)
+
+def delta_matrix(movements, originals):
+    # Balance deltas of each movement as an (n, len(BALANCE_COLUMNS)) int64 array scaled
+    # by 10 ** places, the same as movement_deltas gives; a reversal takes the negated
+    # deltas of its original. Returns (deltas, places).
+    sources = [originals.get(m.get('ref_id')) if m['movement_type'] == 'reversal' else m for m in movements]
+    try:
+        types = np.fromiter((TYPE_INDEX[src['movement_type']] for src in sources), dtype=np.intp, count=len(sources))
+    except (KeyError, TypeError):
+        # Unknown type, or a reversal without its original: raise movement_deltas' error
+        for m in movements:
+            movement_deltas(m, originals.get(m.get('ref_id')))
+        raise
+    quantities, places = scaled_quantities(src['quantity'] for src in sources)
+    reversal = np.array([m['movement_type'] == 'reversal' for m in movements], dtype=bool)
+    return DELTA_SIGNS[types] * np.where(reversal, -quantities, quantities)[:, None], places
+
+def rebuild_balances():
+    # Recomputes every ledger-backed inventory row in a single pass over stock_movements.
+    # Each page is added onto dense location codes with np.add.at, in exact integers at
+    # the largest decimal scale seen, so fractional quantities leave no rounding residue.
+    # Movements posted while this runs can be overwritten; run it during a quiet window.
+    locations = {}
+    totals = np.zeros((0, len(BALANCE_COLUMNS)), dtype=np.int64)
+    last_ids = np.zeros(0, dtype=np.int64)
+    places = 0
+    for rows in iter_pages(lambda: supabase.table('stock_movements').select(LEDGER_COLUMNS)):
+        deltas, page_places = delta_matrix(rows, _reversed_originals(rows))
+        if page_places > places:
+            totals *= 10 ** (page_places - places)
+            places = page_places
+        elif page_places < places:
+            deltas *= 10 ** (places - page_places)
+        codes = np.fromiter((locations.setdefault(location_key(m), len(locations)) for m in rows), dtype=np.intp, count=len(rows))
+        grow = len(locations) - len(totals)
+        if grow:
+            totals = np.vstack([totals, np.zeros((grow, len(BALANCE_COLUMNS)), dtype=np.int64)])
+            last_ids = np.concatenate([last_ids, np.zeros(grow, dtype=np.int64)])
+        np.add.at(totals, codes, deltas)
+        np.maximum.at(last_ids, codes, np.array([m['id'] for m in rows], dtype=np.int64))
+    upserts = [dict(zip(LOCATION_KEY, key), last_movement_id=int(last_ids[i]),
+                    **{col: unscaled(total, places) for col, total in zip(BALANCE_COLUMNS, totals[i])})
+               for key, i in locations.items()]
+    for i in range(0, len(upserts), UPSERT_BATCH_SIZE):
+        supabase.table('inventory').upsert(upserts[i:i + UPSERT_BATCH_SIZE], on_conflict=','.join(LOCATION_KEY)).execute()
+    return len(upserts)
+
+def _reversed_originals(movements):
+    ids = {m['ref_id'] for m in movements if m['movement_type'] == 'reversal' and m.get('ref_id')}
+    if not ids:
+        return {}
+    rows = supabase.table('stock_movements').select('*').in_('id', list(ids)).execute().data or []
+    return {row['id']: row for row in rows}
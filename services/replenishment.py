@@ -0,0 +1,213 @@
+import datetime
+import math
+import os
+from statistics import NormalDist
+import numpy as np
+from services.db import supabase
+from services.analytics import fetch_columns, latest_movement_id, timestamps, DEMAND_TYPES
+from services.movements import UPSERT_BATCH_SIZE
+
+HISTORY_DAYS = 91
+MOVING_AVERAGE_DAYS = 28
+SMOOTHING_ALPHA = 0.2
+SERVICE_LEVEL = float(os.environ.get('REPLENISHMENT_SERVICE_LEVEL', 0.95))
+LEAD_TIME_DAYS = float(os.environ.get('REPLENISHMENT_LEAD_TIME_DAYS', 14))
+REVIEW_DAYS = float(os.environ.get('REPLENISHMENT_REVIEW_DAYS', 7))
+# Products without new movements are still recomputed this often, so their forecast
+# decays as days without demand pass
+MAX_STATE_AGE_DAYS = 7
+# Up to this many products are read with product_id=in.(...); more than that reads the
+# whole demand window once
+IN_FILTER_LIMIT = 5000
+IN_FILTER_CHUNK = 200
+METHODS = ('moving_average', 'exp_smoothing')
+FORECAST_COLUMNS = ('product_id', 'daily_demand', 'demand_std', 'lead_time_days', 'safety_stock',
+                    'reorder_point', 'order_up_to', 'supplier_id', 'unit_price')
+
+def _utcnow():
+    return np.datetime64(datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None), 's')
+
+def fetch_for_products(build_query, product_ids, columns, key='id'):
+    # fetch_columns narrowed to product_ids with product_id=in.(...) in chunks, or over
+    # everything build_query() returns when there are too many products for that
+    if len(product_ids) > IN_FILTER_LIMIT:
+        return fetch_columns(build_query, columns, key=key)
+    ids = [int(p) for p in product_ids]
+    parts = [fetch_columns(lambda chunk=ids[i:i + IN_FILTER_CHUNK]: build_query().in_('product_id', chunk), columns, key=key)
+             for i in range(0, len(ids), IN_FILTER_CHUNK)]
+    return {c: np.concatenate([part[c] for part in parts]) if parts else np.array([]) for c in columns}
+
+def demand_matrix(product_ids, days=HISTORY_DAYS, now=None):
+    # Daily outbound demand, one row per product_id (sorted), one column per day, oldest first
+    now = _utcnow() if now is None else now
+    since = now - np.timedelta64(days, 'D')
+    columns = ('product_id', 'quantity', 'created_at')
+    build = lambda: (supabase.table('stock_movements').select('id,product_id,quantity,created_at')
+                     .in_('movement_type', list(DEMAND_TYPES)).gte('created_at', str(since)))
+    mov = fetch_for_products(build, product_ids, columns)
+    n = len(product_ids)
+    matrix = np.zeros((n, days))
+    if not len(mov['product_id']):
+        return matrix
+    keys = mov['product_id'].astype(np.int64)
+    pos = np.minimum(np.searchsorted(product_ids, keys), max(n - 1, 0))
+    day = ((timestamps(mov['created_at']) - since) // np.timedelta64(1, 'D')).astype(np.int64)
+    keep = (product_ids[pos] == keys) & (day >= 0) & (day < days)
+    flat = np.bincount(pos[keep] * days + day[keep], weights=mov['quantity'][keep].astype(float), minlength=n * days)
+    return flat.reshape(n, days)
+
+def forecast(matrix, method='exp_smoothing', alpha=SMOOTHING_ALPHA, window=MOVING_AVERAGE_DAYS):
+    # Next-day demand per row: mean of the last `window` days, or simple exponential
+    # smoothing seeded with the first day, written as one weighted sum over the history
+    days = matrix.shape[1]
+    if method == 'moving_average':
+        return matrix[:, -window:].mean(axis=1)
+    weights = alpha * (1 - alpha) ** np.arange(days - 1, -1, -1, dtype=float)
+    weights[0] = (1 - alpha) ** (days - 1)
+    return matrix @ weights
+
+def reorder_levels(daily_demand, demand_std, lead_time=LEAD_TIME_DAYS, review=REVIEW_DAYS, service_level=SERVICE_LEVEL):
+    # Safety stock covers demand variability over the lead time at the given service level
+    z = NormalDist().inv_cdf(service_level)
+    safety = z * demand_std * np.sqrt(lead_time)
+    return safety, daily_demand * lead_time + safety, daily_demand * (lead_time + review) + safety
+
+def last_suppliers(product_ids):
+    # Supplier and unit price of the most recent purchase order line per product, read
+    # for these products only from the latest_product_suppliers view (migrations/010)
+    columns = ('product_id', 'supplier_id', 'unit_price')
+    latest = fetch_for_products(lambda: supabase.table('latest_product_suppliers').select(','.join(columns)),
+                                product_ids, columns, key='product_id')
+    n = len(product_ids)
+    supplier = np.full(n, np.nan)
+    price = np.full(n, np.nan)
+    if not n or not len(latest['product_id']):
+        return supplier, price
+    keys = latest['product_id'].astype(np.int64)
+    pos = np.minimum(np.searchsorted(product_ids, keys), n - 1)
+    found = product_ids[pos] == keys
+    supplier[pos[found]] = latest['supplier_id'][found].astype(float)
+    price[pos[found]] = np.array([np.nan if p is None else p for p in latest['unit_price'][found]], dtype=float)
+    return supplier, price
+
+def _changed_products(after_id, up_to_id):
+    moved = fetch_columns(lambda: supabase.table('stock_movements').select('id,product_id').lte('id', up_to_id),
+                          ('product_id',), after_id=after_id)
+    return np.unique(moved['product_id'].astype(np.int64))
+
+def run_forecasts(full=False, method='exp_smoothing'):
+    # Recomputes forecasts for products with movements after the stored watermark, plus
+    # those not refreshed for MAX_STATE_AGE_DAYS; full=True recomputes every product
+    # with demand in the history window. Returns the number of products written.
+    if method not in METHODS:
+        raise ValueError('method must be one of: {}'.format(', '.join(METHODS)))
+    now = _utcnow()
+    watermark = latest_movement_id()
+    state = fetch_columns(lambda: supabase.table('replenishment_forecasts').select('product_id,last_movement_id,computed_at'),
+                          ('product_id', 'last_movement_id', 'computed_at'), key='product_id')
+    known = state['product_id'].astype(np.int64)
+    if full or not len(known):
+        targets = np.union1d(known, _changed_products(0, watermark))
+    else:
+        previous = int(state['last_movement_id'].astype(np.int64).max())
+        stale = known[timestamps(state['computed_at']) < now - np.timedelta64(MAX_STATE_AGE_DAYS, 'D')]
+        targets = np.union1d(_changed_products(previous, watermark), stale)
+    if not len(targets):
+        return 0
+
+    matrix = demand_matrix(targets, now=now)
+    daily = forecast(matrix, method)
+    std = matrix.std(axis=1, ddof=1) if matrix.shape[1] > 1 else np.zeros(len(targets))
+    safety, reorder_point, order_up_to = reorder_levels(daily, std)
+    supplier, price = last_suppliers(targets)
+
+    computed_at = str(now)
+    rows = [
+        {
+            'product_id': int(targets[i]),
+            'daily_demand': round(float(daily[i]), 4),
+            'demand_std': round(float(std[i]), 4),
+            'lead_time_days': LEAD_TIME_DAYS,
+            'safety_stock': round(float(safety[i]), 2),
+            'reorder_point': round(float(reorder_point[i]), 2),
+            'order_up_to': round(float(order_up_to[i]), 2),
+            'supplier_id': None if np.isnan(supplier[i]) else int(supplier[i]),
+            'unit_price': None if np.isnan(price[i]) else float(price[i]),
+            'last_movement_id': watermark,
+            'computed_at': computed_at,
+        }
+        for i in range(len(targets))
+    ]
+    for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+        supabase.table('replenishment_forecasts').upsert(rows[start:start + UPSERT_BATCH_SIZE], on_conflict='product_id').execute()
+    return len(rows)
+
+def _per_product(product_ids, keys, values):
+    # Sums values onto the positions of product_ids (sorted); keys not in product_ids are dropped
+    out = np.zeros(len(product_ids))
+    if not len(keys) or not len(product_ids):
+        return out
+    keys = keys.astype(np.int64)
+    pos = np.minimum(np.searchsorted(product_ids, keys), len(product_ids) - 1)
+    keep = product_ids[pos] == keys
+    return np.bincount(pos[keep], weights=values.astype(float)[keep], minlength=len(product_ids))
+
+def draft_purchase_orders(supplier_id=None, created_by=None):
+    # Products whose stock position (on hand + in transit - reserved + open PO lines) is at
+    # or below the reorder point, ordered up to order_up_to and grouped into one draft
+    # purchase order payload per supplier in the shape POST /purchase/orders accepts
+    def scoped():
+        query = supabase.table('replenishment_forecasts').select(','.join(FORECAST_COLUMNS))
+        return query.eq('supplier_id', supplier_id) if supplier_id is not None else query
+    f = fetch_columns(scoped, FORECAST_COLUMNS, key='product_id')
+    product_ids = f['product_id'].astype(np.int64)
+    if not len(product_ids):
+        return {'drafts': [], 'unassigned': []}
+
+    inv = fetch_columns(lambda: supabase.table('inventory').select('id,product_id,qty_on_hand,qty_reserved,qty_in_transit'),
+                        ('product_id', 'qty_on_hand', 'qty_reserved', 'qty_in_transit'))
+    open_orders = fetch_columns(lambda: supabase.table('purchase_orders').select('id').eq('status', 'ordered'), ('id',))
+    lines = fetch_columns(lambda: supabase.table('purchase_order_items').select('id,order_id,product_id,quantity,received_quantity'),
+                          ('order_id', 'product_id', 'quantity', 'received_quantity'))
+    position = _per_product(product_ids, inv['product_id'],
+                            inv['qty_on_hand'].astype(float) + inv['qty_in_transit'].astype(float) - inv['qty_reserved'].astype(float))
+    if len(lines['order_id']) and len(open_orders['id']):
+        outstanding = np.maximum(lines['quantity'].astype(float) - lines['received_quantity'].astype(float), 0)
+        is_open = np.isin(lines['order_id'].astype(np.int64), open_orders['id'].astype(np.int64))
+        position += _per_product(product_ids, lines['product_id'][is_open], outstanding[is_open])
+
+    reorder_point = f['reorder_point'].astype(float)
+    quantity = np.ceil(f['order_up_to'].astype(float) - position)
+    due = (position <= reorder_point) & (quantity > 0)
+    suppliers = f['supplier_id'].astype(float)
+    prices = np.nan_to_num(f['unit_price'].astype(float))
+    lead_times = f['lead_time_days'].astype(float)
+
+    today = datetime.date.today()
+    drafts, unassigned = {}, []
+    for i in np.flatnonzero(due):
+        item = {'product_id': int(product_ids[i]), 'quantity': float(quantity[i]), 'unit_price': float(prices[i])}
+        if np.isnan(suppliers[i]):
+            unassigned.append(item)
+            continue
+        sid = int(suppliers[i])
+        draft = drafts.get(sid)
+        if draft is None:
+            draft = drafts[sid] = {
+                'order': {
+                    'supplier_id': sid,
+                    'status': 'draft',
+                    'expected_date': (today + datetime.timedelta(days=math.ceil(lead_times[i]))).isoformat(),
+                    'total': 0.0,
+                    'created_by': created_by,
+                    'notes': 'Replenishment suggestion',
+                },
+                'items': [],
+            }
+        draft['items'].append(item)
+        draft['order']['total'] = round(draft['order']['total'] + item['quantity'] * item['unit_price'], 2)
+    return {'drafts': list(drafts.values()), 'unassigned': unassigned}
+
+if __name__ == '__main__':
+    # Nightly job entry point, e.g. from cron: python -m services.replenishment
+    print(run_forecasts())
@@ -0,0 +1,337 @@
+import heapq
+import os
+import re
+from bisect import bisect_left
+from collections import Counter
+from services.db import supabase
+from services.movements import iter_pages
+from services.lookup import RefreshingIndex, PAGE_SIZE
+
+SEARCH_REFRESH = float(os.environ.get('SEARCH_REFRESH', 300))
+PRODUCT_COLUMNS = 'id,name,sku'
+CATEGORY_COLUMNS = 'id,name,tags'
+PRODUCT_CATEGORY_COLUMNS = 'id,product_id,category_id'
+VARIANT_COLUMNS = 'id,product_id,sku,attributes'
+# A term found in a more specific field ranks the product higher
+FIELD_WEIGHTS = {'sku': 4.0, 'name': 3.0, 'category': 2.0, 'variant': 1.0}
+# How well a query token matched a term; multiplied by the field weight
+EXACT, PREFIX, SUBSTRING, FUZZY = 1.0, 0.7, 0.4, 0.3
+MIN_PREFIX = 2
+# Cap on the terms one query token expands to, so short prefixes stay cheap
+MAX_EXPANSIONS = 64
+FUZZY_MIN_LENGTH = 4
+# Trigrams shared by this many terms say little about a typo and are skipped
+FUZZY_GRAM_CAP = 20000
+# Terms sharing the most trigrams with a token that are checked by edit distance
+FUZZY_CANDIDATES = 2000
+# Terms added after a build wait in a short sorted list that is merged into the main one
+# at this size, so adding a term does not shift the whole vocabulary
+MERGE_TERMS = 1024
+WORD = re.compile(r'\w+')
+
+def tokenize(text, parts=False):
+    # Each whitespace-separated word becomes its alphanumeric run ('T-Shirt' -> 'tshirt'),
+    # so SKUs match whether or not the dashes are typed. Indexed text (parts=True) also
+    # yields the pieces ('t', 'shirt').
+    for word in str(text).casefold().split():
+        pieces = WORD.findall(word)
+        if not pieces:
+            continue
+        yield ''.join(pieces)
+        if parts and len(pieces) > 1:
+            yield from pieces
+
+def trigrams(term):
+    return {term[i:i + 3] for i in range(len(term) - 2)}
+
+def edit_distance(a, b, limit):
+    # Edit distance counting an adjacent transposition as one edit ('shrit' -> 'shirt'),
+    # or limit + 1 as soon as it is known to exceed limit
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before, previous = None, list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            cost = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                cost = min(cost, before[j - 2] + 1)
+            current.append(cost)
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return previous[-1]
+
+def document_terms(product, categories, variants):
+    # {term: weight} for one product, keeping the best field each term appears in
+    terms = {}
+    def add(text, field):
+        if text is None:
+            return
+        for term in tokenize(text, parts=True):
+            if FIELD_WEIGHTS[field] > terms.get(term, 0):
+                terms[term] = FIELD_WEIGHTS[field]
+    add(product['name'], 'name')
+    add(product['sku'], 'sku')
+    for category in categories:
+        add(category['name'], 'category')
+        for tag in category.get('tags') or []:
+            add(tag, 'category')
+    for variant in variants:
+        add(variant.get('sku'), 'variant')
+        for value in (variant.get('attributes') or {}).values():
+            add(value, 'variant')
+    return terms
+
+# Inverted index over product name, SKU, category names and tags, and variant SKUs and
+# attribute values. Terms are kept sorted for prefix matching and by padded trigram for
+# substring and typo-tolerant matching. Once built, a state is searched without a lock:
+# reindex() replaces the posting dicts, trigram sets and term lists it changes instead of
+# changing them in place, so a search never iterates one mid-update.
+class SearchState:
+    def __init__(self, products, categories, product_categories, variants):
+        self.products = products
+        self.categories = categories
+        self.product_categories = product_categories
+        self.variants = variants
+        self.doc_terms = {}
+        self.postings = {}
+        self.grams = {}
+        # (sorted terms, sorted terms added since); None while building
+        self.vocab = None
+        for product_id in products:
+            self.reindex(product_id)
+        self.vocab = (sorted(self.postings), [])
+
+    def reindex(self, product_id):
+        # Diffs the product's terms against what is indexed
+        live = self.vocab is not None
+        old = self.doc_terms.pop(product_id, {})
+        product = self.products.get(product_id)
+        new = {}
+        if product is not None:
+            categories = [self.categories[c] for c in self.product_categories.get(product_id, ()) if c in self.categories]
+            new = document_terms(product, categories, self.variants.get(product_id, {}).values())
+            self.doc_terms[product_id] = new
+        for term in old.keys() - new.keys():
+            postings = {pid: weight for pid, weight in self.postings[term].items() if pid != product_id}
+            if postings:
+                self.postings[term] = postings
+            else:
+                # Left in the vocabulary and grams, where lookups skip it, until the next rebuild
+                del self.postings[term]
+        for term, weight in new.items():
+            postings = self.postings.get(term)
+            if postings is None:
+                for gram in trigrams('$' + term + '$'):
+                    terms = self.grams.get(gram)
+                    if terms is None:
+                        self.grams[gram] = {term}
+                    elif live:
+                        self.grams[gram] = terms | {term}
+                    else:
+                        terms.add(term)
+                if live:
+                    self._add_term(term)
+                self.postings[term] = {product_id: weight}
+            elif not live:
+                postings[product_id] = weight
+            elif postings.get(product_id) != weight:
+                self.postings[term] = {**postings, product_id: weight}
+
+    def _add_term(self, term):
+        terms, added = self.vocab
+        for known in (terms, added):
+            i = bisect_left(known, term)
+            if i < len(known) and known[i] == term:
+                return
+        i = bisect_left(added, term)
+        added = added[:i] + [term] + added[i:]
+        if len(added) >= MERGE_TERMS:
+            self.vocab = (list(heapq.merge(terms, added)), [])
+        else:
+            self.vocab = (terms, added)
+
+    def expand(self, token):
+        # [(term, quality)] for the indexed terms a query token matches
+        postings = self.postings
+        matches = {}
+        if token in postings:
+            matches[token] = EXACT
+        if len(token) >= MIN_PREFIX:
+            for term in heapq.merge(*(prefixed(terms, token) for terms in self.vocab)):
+                if len(matches) >= MAX_EXPANSIONS:
+                    break
+                if term in postings:
+                    matches.setdefault(term, PREFIX)
+        if len(token) >= 3 and len(matches) < MAX_EXPANSIONS:
+            # Every term containing the token has all of its trigrams, so scanning the
+            # rarest one is enough
+            rarest = min((self.grams.get(g, ()) for g in trigrams(token)), key=len)
+            for term in rarest:
+                if len(matches) >= MAX_EXPANSIONS:
+                    break
+                if token in term and term not in matches and term in postings:
+                    matches[term] = SUBSTRING
+        if not matches and len(token) >= FUZZY_MIN_LENGTH:
+            matches = self.fuzzy(token)
+        return list(matches.items())
+
+    def fuzzy(self, token):
+        # Terms within 1 edit (2 for tokens of 8+ characters), found by trigram overlap:
+        # each edit changes at most 4 of the padded trigrams
+        limit = 1 if len(token) < 8 else 2
+        grams = [self.grams.get(g, ()) for g in trigrams('$' + token + '$')]
+        grams = [terms for terms in grams if len(terms) <= FUZZY_GRAM_CAP]
+        counts = Counter()
+        for terms in grams:
+            counts.update(terms)
+        needed = max(1, len(grams) - 4 * limit)
+        matches = {}
+        for term, shared in counts.most_common(FUZZY_CANDIDATES):
+            if shared < needed or len(matches) >= MAX_EXPANSIONS:
+                break
+            if term in self.postings and edit_distance(token, term, limit) <= limit:
+                matches[term] = FUZZY
+        return matches
+
+    def size(self, matched):
+        return sum(len(self.postings.get(term, ())) for term, _ in matched)
+
+    def score(self, matched, candidates=None):
+        # {product_id: best score} for one token, limited to candidates when given. Each
+        # term is scored by a comprehension over whichever of its postings and the
+        # candidates is smaller; only products matching several terms are merged by hand.
+        scores = {}
+        for term, quality in matched:
+            # A term removed by a concurrent write matches nothing
+            postings = self.postings.get(term, {})
+            if candidates is None:
+                hits = dict(postings) if quality == EXACT else {pid: quality * weight for pid, weight in postings.items()}
+            elif len(candidates) < len(postings):
+                hits = {pid: quality * postings[pid] for pid in candidates if pid in postings}
+            else:
+                hits = {pid: quality * weight for pid, weight in postings.items() if pid in candidates}
+            if not scores:
+                scores = hits
+                continue
+            kept = {pid: scores[pid] for pid in hits.keys() & scores.keys() if scores[pid] > hits[pid]}
+            scores.update(hits)
+            scores.update(kept)
+        return scores
+
+def prefixed(terms, prefix):
+    # Terms of a sorted list that start with prefix, in order
+    i = bisect_left(terms, prefix)
+    while i < len(terms) and terms[i].startswith(prefix):
+        yield terms[i]
+        i += 1
+
+def top(scores, count):
+    # The count best (product_id, score) pairs by score, then id. Scores take few
+    # distinct values, so only the buckets that reach count are sorted.
+    ranked = []
+    for value in sorted(set(scores.values()), reverse=True):
+        bucket = [product_id for product_id, score in scores.items() if score == value]
+        bucket.sort()
+        ranked.extend((product_id, value) for product_id in bucket[:count - len(ranked)])
+        if len(ranked) >= count:
+            break
+    return ranked
+
+# The rebuilt SearchState is swapped in whole; writes on this worker update the current
+# one (and any being rebuilt) under the lock, searches read it without one, and the
+# periodic rebuild picks up everything else.
+class ProductSearch(RefreshingIndex):
+    refresh = SEARCH_REFRESH
+    thread_name = 'search-rebuild'
+
+    def __init__(self):
+        super().__init__()
+        self._state = SearchState({}, {}, {}, {})
+
+    def _load(self):
+        products, categories, product_categories, variants = {}, {}, {}, {}
+        for rows in iter_pages(lambda: supabase.table('products').select(PRODUCT_COLUMNS).eq('is_deleted', False), page_size=PAGE_SIZE):
+            for row in rows:
+                products[row['id']] = row
+        for rows in iter_pages(lambda: supabase.table('categories').select(CATEGORY_COLUMNS), page_size=PAGE_SIZE):
+            for row in rows:
+                categories[row['id']] = row
+        for rows in iter_pages(lambda: supabase.table('product_categories').select(PRODUCT_CATEGORY_COLUMNS), page_size=PAGE_SIZE):
+            for row in rows:
+                product_categories.setdefault(row['product_id'], set()).add(row['category_id'])
+        for rows in iter_pages(lambda: supabase.table('product_variants').select(VARIANT_COLUMNS), page_size=PAGE_SIZE):
+            for row in rows:
+                variants.setdefault(row['product_id'], {})[row['id']] = row
+        return SearchState(products, categories, product_categories, variants)
+
+    def _install(self, state):
+        self._state = state
+
+    def search(self, query, limit=20, offset=0):
+        # Every token must match; returns (total, [{id, name, sku, score}]) ranked by
+        # summed score, then id
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return 0, []
+        self._ready()
+        state = self._state
+        expanded = [state.expand(token) for token in tokens]
+        if not all(expanded):
+            return 0, []
+        # The most selective token first; the rest only score its candidates
+        expanded.sort(key=state.size)
+        scores = None
+        for matched in expanded:
+            token_scores = state.score(matched, scores)
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {pid: scores[pid] + score for pid, score in token_scores.items() if pid in scores}
+            if not scores:
+                return 0, []
+        ranked = [(state.products.get(pid), score) for pid, score in top(scores, offset + limit)[offset:]]
+        return len(scores), [dict(product, score=round(score, 3)) for product, score in ranked if product is not None]
+
+    # Incremental updates from this worker's write paths, applied under the lock (and
+    # to a rebuild in progress)
+    def add_product(self, product):
+        row = {'id': product['id'], 'name': product['name'], 'sku': product['sku']}
+        def write(state):
+            state.products[row['id']] = row
+            state.reindex(row['id'])
+        self._apply(write)
+
+    def remove_product(self, product_id):
+        def write(state):
+            state.products.pop(product_id, None)
+            state.reindex(product_id)
+        self._apply(write)
+
+    def add_variants(self, variants):
+        rows = [{k: row.get(k) for k in VARIANT_COLUMNS.split(',')} for row in variants]
+        def write(state):
+            for row in rows:
+                state.variants.setdefault(row['product_id'], {})[row['id']] = row
+            for product_id in {row['product_id'] for row in rows}:
+                state.reindex(product_id)
+        self._apply(write)
+
+    def add_categories(self, product_categories):
+        # product_categories rows; categories created since the last rebuild are not
+        # known here and are picked up by the next one
+        pairs = [(row['product_id'], row['category_id']) for row in product_categories]
+        def write(state):
+            for product_id, category_id in pairs:
+                state.product_categories.setdefault(product_id, set()).add(category_id)
+            for product_id in {product_id for product_id, _ in pairs}:
+                state.reindex(product_id)
+        self._apply(write)
+
+    def stats(self):
+        state = self._state
+        return {'built': self._built, 'age_seconds': self.age(), 'products': len(state.doc_terms),
+                'terms': len(state.postings), 'trigrams': len(state.grams)}
+
+index = ProductSearch()
@@ -0,0 +1,69 @@
+from services.db import supabase
+from services.movements import BALANCE_COLUMNS, LOCATION_KEY, LEDGER_COLUMNS, new_balances, iter_pages, accumulate, location_key
+
+# Movements left in flight by a snapshot are read this many ids per request
+PENDING_CHUNK = 500
+
+def take_snapshot():
+    # Materializes current balances at the latest movement id without blocking postings
+    # (take_stock_snapshot, migrations/005 and 009)
+    return supabase.rpc('take_stock_snapshot', {}).execute().data
+
+def nearest_snapshot(at):
+    rows = (supabase.table('stock_snapshots').select('*').lte('taken_at', at)
+            .order('taken_at', desc=True).limit(1).execute().data)
+    return rows[0] if rows else None
+
+def page_bound(after_id, limit):
+    # Highest product id in the page of `limit` products after after_id, or None when
+    # the page runs to the end
+    rows = (supabase.table('products').select('id').gt('id', after_id or 0)
+            .order('id').limit(limit).execute().data or [])
+    return rows[-1]['id'] if len(rows) == limit else None
+
+def balances_as_of(at, apply_filters=lambda query: query, after_id=None, limit=None):
+    # Starts from the newest snapshot taken at or before `at` and replays only the
+    # movements posted after it (and those still in flight when it was taken), up to
+    # `at`. apply_filters narrows every read (e.g. to one warehouse or product). With
+    # limit, covers the next `limit` products after product id after_id; next_after_id
+    # continues from there.
+    upper = page_bound(after_id, limit) if limit else None
+    def narrow(query):
+        query = apply_filters(query)
+        if after_id is not None:
+            query = query.gt('product_id', after_id)
+        if upper is not None:
+            query = query.lte('product_id', upper)
+        return query
+    snapshot = nearest_snapshot(at)
+    balances = new_balances()
+    after_movement = 0
+    pending = []
+    if snapshot:
+        after_movement = snapshot['last_movement_id']
+        pending = snapshot.get('pending_movement_ids') or []
+        columns = ','.join(('id',) + LOCATION_KEY + BALANCE_COLUMNS)
+        stored = lambda: narrow(supabase.table('stock_snapshot_balances').select(columns).eq('snapshot_id', snapshot['id']))
+        for rows in iter_pages(stored):
+            for row in rows:
+                balance = balances[location_key(row)]
+                for col in BALANCE_COLUMNS:
+                    balance[col] += row[col]
+    replay = lambda: narrow(supabase.table('stock_movements').select(LEDGER_COLUMNS)).lte('created_at', at)
+    replayed = 0
+    for i in range(0, len(pending), PENDING_CHUNK):
+        rows = replay().in_('id', pending[i:i + PENDING_CHUNK]).execute().data or []
+        accumulate(balances, rows)
+        replayed += len(rows)
+    for rows in iter_pages(replay, after_movement):
+        accumulate(balances, rows)
+        replayed += len(rows)
+    result = [dict(zip(LOCATION_KEY, key), **balance)
+              for key, balance in sorted(balances.items(), key=lambda item: item[0][0])
+              if any(balance.values())]
+    return {'as_of': at, 'snapshot': snapshot, 'replayed_movements': replayed, 'balances': result,
+            'next_after_id': upper}
+
+if __name__ == '__main__':
+    # Periodic job entry point, e.g. from cron: python -m services.snapshots
+    print(take_snapshot())
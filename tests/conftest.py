@@ -0,0 +1,13 @@
+import sys
+import pytest
+from benchmarks.fake_supabase import FakeSupabase
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    # A FakeSupabase bound as `supabase` in every imported api/ and services/ module;
+    # seed tables with fake_db.seed(name, rows) and read them back from fake_db.tables
+    fake = FakeSupabase()
+    for name, module in list(sys.modules.items()):
+        if name.startswith(('api.', 'services.')) and hasattr(module, 'supabase'):
+            monkeypatch.setattr(module, 'supabase', fake)
+    return fake
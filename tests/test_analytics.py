@@ -0,0 +1,33 @@
+import datetime
+from services import analytics
+
+def _ago(days):
+    return (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=days)).isoformat()
+
+def test_inventory_analytics(monkeypatch, fake_db):
+    tables = {
+        'inventory': [
+            {'id': 1, 'product_id': 1, 'warehouse_id': 1, 'qty_on_hand': 10},
+            {'id': 2, 'product_id': 2, 'warehouse_id': 1, 'qty_on_hand': 50},
+        ],
+        'stock_movements': [
+            {'id': 1, 'product_id': 1, 'warehouse_id': 1, 'movement_type': 'purchase', 'quantity': 100, 'created_at': _ago(300)},
+            {'id': 2, 'product_id': 1, 'warehouse_id': 1, 'movement_type': 'sale', 'quantity': 90, 'created_at': _ago(10)},
+            {'id': 3, 'product_id': 2, 'warehouse_id': 1, 'movement_type': 'sale', 'quantity': 5, 'created_at': _ago(250)},
+        ],
+        'sales_order_items': [
+            {'id': 1, 'product_id': 1, 'quantity': 90, 'unit_price': 10.0, 'returned': False},
+            {'id': 2, 'product_id': 2, 'quantity': 5, 'unit_price': 2.0, 'returned': False},
+        ],
+    }
+    for name, rows in tables.items():
+        fake_db.seed(name, rows)
+    monkeypatch.setattr(analytics, '_results', analytics.TTLCache('analytics', maxsize=4))
+    rows = {row['product_id']: row for row in analytics.inventory_analytics()}
+    # Started at 0, ended at 10: average 5, 90 issued
+    assert rows[1]['turnover'] == 18.0
+    assert rows[1]['days_of_cover'] == round(10 / (90 / 365), 1)
+    assert rows[1]['abc_class'] == 'A'
+    assert not rows[1]['dead_stock']
+    assert rows[2]['abc_class'] == 'C'
+    assert rows[2]['dead_stock']
@@ -0,0 +1,41 @@
+import time
+import pytest
+from services import auth_cache
+
+def test_verified_token_is_reused_until_expiry():
+    calls = []
+    @auth_cache.memoize_verifier
+    def verify(token):
+        calls.append(token)
+        return {'sub': 'u1', 'exp': time.time() + 60}
+    assert verify('tok-a')['sub'] == 'u1'
+    assert verify('tok-a')['sub'] == 'u1'
+    assert calls == ['tok-a']
+    auth_cache.forget_token('tok-a')
+    verify('tok-a')
+    assert calls == ['tok-a', 'tok-a']
+
+def test_invalid_and_expired_tokens_are_not_cached():
+    calls = []
+    @auth_cache.memoize_verifier
+    def verify(token):
+        calls.append(token)
+        if token == 'bad':
+            raise ValueError('invalid token')
+        return {'sub': 'u2', 'exp': time.time() - 1}
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            verify('bad')
+        verify('expired')
+    assert calls == ['bad', 'expired', 'bad', 'expired']
+
+def test_roles_resolved_once_per_token():
+    calls = []
+    @auth_cache.memoize_roles
+    def resolve(token, claims):
+        calls.append(token)
+        return ['admin', 'warehouse']
+    claims = {'exp': time.time() + 60}
+    assert resolve('tok-b', claims) == frozenset({'admin', 'warehouse'})
+    resolve('tok-b', claims)
+    assert calls == ['tok-b']
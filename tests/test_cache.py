@@ -0,0 +1,50 @@
+from services.cache import TTLCache, MISSING, read_through
+
+def test_read_through_counts_hits_and_misses():
+    cache = TTLCache('test')
+    loads = []
+    def loader():
+        loads.append(1)
+        return {'id': 1}
+    assert read_through(cache, 1, loader) == {'id': 1}
+    assert read_through(cache, 1, loader) == {'id': 1}
+    assert len(loads) == 1
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+def test_not_found_is_not_cached():
+    cache = TTLCache('test')
+    assert read_through(cache, 2, lambda: None) is None
+    assert cache.get(2) is MISSING
+
+def test_lru_eviction_and_expiry():
+    cache = TTLCache('test', maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is MISSING
+    assert cache.get('a') == 1
+    cache.set('d', 4, ttl=-1)
+    assert cache.get('d') is MISSING
+
+def test_load_racing_an_invalidation_is_not_cached():
+    cache = TTLCache('test')
+    def loader():
+        # An update commits and invalidates while this (now stale) row is in flight
+        cache.delete(3)
+        return {'id': 3, 'name': 'old'}
+    assert read_through(cache, 3, loader) == {'id': 3, 'name': 'old'}
+    assert cache.get(3) is MISSING
+    assert read_through(cache, 3, lambda: {'id': 3, 'name': 'new'}) == {'id': 3, 'name': 'new'}
+    assert cache.get(3) == {'id': 3, 'name': 'new'}
+
+def test_versions_survive_eviction_of_deleted_keys():
+    cache = TTLCache('test', maxsize=1)
+    version = cache.version('a')
+    cache.delete('a')
+    cache.delete('b')
+    cache.set('a', 1, version=version)
+    assert cache.get('a') is MISSING
+    cache.set('a', 2, version=cache.version('a'))
+    assert cache.get('a') == 2
@@ -0,0 +1,45 @@
+import time
+from services import change_feed
+
+def test_feed_buffers_and_falls_back_to_ledger(monkeypatch):
+    ledger = [{'id': i, 'movement_type': 'sale', 'quantity': 1, 'ref_id': None, 'product_id': 1, 'warehouse_id': 2,
+               'bin_id': None, 'batch_id': None, 'serial_number': None} for i in range(1, 8)]
+    reads = []
+    def read_events(after_id, limit=change_feed.POLL_BATCH):
+        reads.append(after_id)
+        return change_feed.to_events([m for m in ledger if m['id'] > after_id][:limit])
+    monkeypatch.setattr(change_feed, 'read_events', read_events)
+    monkeypatch.setattr(change_feed, 'BUFFER_SIZE', 3)
+    monkeypatch.setattr(change_feed, 'COMMIT_LAG', 0)
+    feed = change_feed.ChangeFeed()
+    monkeypatch.setattr(feed, '_ensure', lambda: None)
+    feed.poll()
+    # Only the last three events stay in memory
+    assert [e['id'] for e in feed.since(4)] == [5, 6, 7]
+    assert feed.since(6)[0]['deltas'] == {'qty_on_hand': -1}
+    reads.clear()
+    assert [e['id'] for e in feed.since(2)] == [3, 4, 5, 6, 7]
+    assert reads == [2]
+    assert feed.wait(7, timeout=0) is False
+
+def test_late_commit_of_lower_id_is_delivered(monkeypatch):
+    def movement(i):
+        return {'id': i, 'movement_type': 'sale', 'quantity': 1, 'ref_id': None, 'product_id': 1, 'warehouse_id': 2,
+                'bin_id': None, 'batch_id': None, 'serial_number': None}
+    committed = [movement(1), movement(3)]
+    def read_events(after_id, limit=change_feed.POLL_BATCH):
+        return change_feed.to_events(sorted((m for m in committed if m['id'] > after_id), key=lambda m: m['id'])[:limit])
+    monkeypatch.setattr(change_feed, 'read_events', read_events)
+    monkeypatch.setattr(change_feed, 'COMMIT_LAG', 0.05)
+    feed = change_feed.ChangeFeed()
+    monkeypatch.setattr(feed, '_ensure', lambda: None)
+    feed.poll()
+    assert feed.since(0) == []
+    # Movement 2 was allocated before 3 but commits after 3 was first read
+    committed.append(movement(2))
+    time.sleep(0.06)
+    feed.poll()
+    assert [e['id'] for e in feed.since(0)] == [1]
+    time.sleep(0.06)
+    feed.poll()
+    assert [e['id'] for e in feed.since(0)] == [1, 2, 3]
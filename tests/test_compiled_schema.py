@@ -0,0 +1,40 @@
+import pytest
+from marshmallow import ValidationError
+from schemas.compiled import compile_schema
+from schemas.barcode import BarcodeSchema
+from schemas.product_variant import ProductVariantSchema
+from schemas.purchase_order_item import PurchaseOrderItemSchema
+from schemas.supplier import SupplierSchema
+
+def errors(schema, data, **kwargs):
+    with pytest.raises(ValidationError) as exc:
+        schema.load(data, **kwargs)
+    return exc.value.messages
+
+def test_canonical_items_match_schema_load():
+    items = [{'order_id': 1, 'product_id': 2, 'quantity': 3, 'unit_price': 4.5}]
+    compiled = compile_schema(PurchaseOrderItemSchema())
+    assert compiled._fast(items[0]) is not None
+    assert compiled.load(items, many=True) == PurchaseOrderItemSchema().load(items, many=True)
+
+def test_coerced_values_fall_back_to_schema():
+    item = {'product_id': '7', 'sku': 'V-1', 'attributes': {'size': 'M'}}
+    compiled = compile_schema(ProductVariantSchema())
+    assert compiled._fast(item) is None
+    assert compiled.load(item) == ProductVariantSchema().load(item)
+
+def test_error_messages_are_identical():
+    items = [
+        {'product_id': 1, 'code': '123', 'type': 'UPC'},
+        {'product_id': 1, 'code': '123', 'type': 'EAN-8'},
+        {'code': 5, 'bogus': True},
+    ]
+    compiled = compile_schema(BarcodeSchema())
+    assert errors(compiled, items, many=True) == errors(BarcodeSchema(), items, many=True)
+    assert errors(compiled, items[2]) == errors(BarcodeSchema(), items[2])
+
+def test_email_and_partial_loads():
+    compiled = compile_schema(SupplierSchema())
+    assert compiled.load({'name': 'Acme', 'email': 'a@b.com'}) == SupplierSchema().load({'name': 'Acme', 'email': 'a@b.com'})
+    assert errors(compiled, {'name': 'Acme', 'email': 'nope'}) == errors(SupplierSchema(), {'name': 'Acme', 'email': 'nope'})
+    assert compiled.load({'phone': '1'}, partial=True) == {'phone': '1'}
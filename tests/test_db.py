@@ -0,0 +1,28 @@
+import json
+import httpx
+from services import db
+
+def respond(seen, request):
+    seen.append(request.extensions.get('timeout'))
+    return httpx.Response(200, headers={'Content-Range': '0-0/*'}, content=json.dumps([{'id': 1}]).encode(), request=request)
+
+def test_timeout_override_applies_to_sync_calls(monkeypatch):
+    seen = []
+    monkeypatch.setattr(httpx.HTTPTransport, 'handle_request', lambda self, request: respond(seen, request))
+    database = db.Database('https://x.supabase.co', 'key')
+    with db.timeout(2):
+        database.table('products').select('id').execute()
+    database.table('products').select('id').execute()
+    assert seen[0]['read'] == 2 and seen[1]['read'] == db.TIMEOUT
+
+def test_timeout_override_applies_to_gather(monkeypatch):
+    seen = []
+    async def handle(self, request):
+        return respond(seen, request)
+    monkeypatch.setattr(httpx.AsyncHTTPTransport, 'handle_async_request', handle)
+    database = db.Database('https://x.supabase.co', 'key')
+    with db.timeout(2):
+        results = database.gather(database.aio.table('products').select('id'), database.aio.table('units').select('id'))
+    assert [r.data for r in results] == [[{'id': 1}], [{'id': 1}]]
+    database.gather(database.aio.table('products').select('id'))
+    assert [t['read'] for t in seen] == [2, 2, db.TIMEOUT]
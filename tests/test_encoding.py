@@ -0,0 +1,47 @@
+import gzip
+from decimal import Decimal
+from flask import Flask, jsonify, request
+from flask.json.provider import DefaultJSONProvider
+from api.encoding import encoding_bp, columnar, orjson, rows_response
+
+def make_app():
+    app = Flask(__name__)
+    app.register_blueprint(encoding_bp)
+    @app.route('/formatted')
+    def formatted():
+        return rows_response([{'id': 1}], request.args.get('format', 'json'))
+    @app.route('/rows')
+    def rows():
+        resp = jsonify([{'id': i, 'qty': i * 2} for i in range(int(request.args.get('n', 200)))])
+        resp.add_etag()
+        return resp.make_conditional(request)
+    return app
+
+def test_columnar_keeps_keys_once():
+    assert columnar([{'id': 1, 'qty': 2}, {'id': 2, 'qty': 3, 'bin_id': 9}]) == {
+        'count': 2, 'columns': {'id': [1, 2], 'qty': [2, 3], 'bin_id': [None, 9]}}
+    assert columnar([]) == {'count': 0, 'columns': {}}
+
+def test_gzip_above_threshold_only():
+    client = make_app().test_client()
+    resp = client.get('/rows', headers={'Accept-Encoding': 'gzip'})
+    assert resp.headers['Content-Encoding'] == 'gzip' and 'Accept-Encoding' in resp.headers['Vary']
+    assert gzip.decompress(resp.data).startswith(b'[{"id":0,"qty":0}')
+    assert resp.headers['ETag'].startswith('W/')
+    # The weakened ETag still revalidates
+    assert client.get('/rows', headers={'Accept-Encoding': 'gzip', 'If-None-Match': resp.headers['ETag']}).status_code == 304
+    assert 'Content-Encoding' not in client.get('/rows?n=2', headers={'Accept-Encoding': 'gzip'}).headers
+    assert 'Content-Encoding' not in client.get('/rows').headers
+
+def test_json_provider_matches_default():
+    app = make_app()
+    if orjson is not None:
+        assert type(app.json).__name__ == 'OrjsonProvider'
+    obj = {'b': [1, 2.5, None], 'a': 'x', 'price': Decimal('1.10')}
+    assert app.json.loads(app.json.dumps(obj)) == DefaultJSONProvider(app).loads(DefaultJSONProvider(app).dumps(obj))
+
+def test_formatted_responses_vary_on_accept():
+    client = make_app().test_client()
+    for fmt in ('json', 'columnar'):
+        vary = client.get('/formatted?format=' + fmt).headers['Vary']
+        assert 'Accept' in [v.strip() for v in vary.split(',')]
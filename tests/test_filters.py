@@ -0,0 +1,45 @@
+import pytest
+from api.filters import parse_filters, apply_filters, match_filters, MOVEMENT_FILTERS, INVENTORY_FILTERS
+from schemas.inventory import InventorySchema
+from schemas.stock_movement import StockMovementSchema
+
+schema = StockMovementSchema()
+
+def test_ranges_lists_and_equality_compile_to_builder_calls():
+    filters = parse_filters({
+        'product_id__in': '1,2,3',
+        'movement_type': 'sale',
+        'created_at__gte': '2024-01-01T00:00:00',
+        'created_at__lt': '2024-02-01T00:00:00',
+    }, MOVEMENT_FILTERS, schema)
+    calls = []
+    class Query:
+        def __getattr__(self, name):
+            def record(column, value):
+                calls.append((name, column, value))
+                return self
+            return record
+    apply_filters(Query(), filters)
+    assert calls == [
+        ('in_', 'product_id', [1, 2, 3]),
+        ('eq', 'movement_type', 'sale'),
+        ('gte', 'created_at', '2024-01-01T00:00:00'),
+        ('lt', 'created_at', '2024-02-01T00:00:00'),
+    ]
+
+@pytest.mark.parametrize('args', [
+    {'quantity': '5'},
+    {'created_at': '2024-01-01T00:00:00'},
+    {'product_id__gte': '1'},
+    {'product_id': 'abc'},
+    {'movement_type__in': 'sale,teleport'},
+    {'created_at__gte': 'yesterday'},
+])
+def test_rejects_unknown_or_invalid_filters(args):
+    with pytest.raises(ValueError):
+        parse_filters(args, MOVEMENT_FILTERS, schema)
+
+def test_match_filters():
+    filters = parse_filters({'warehouse_id__in': '1,2', 'product_id': '5'}, INVENTORY_FILTERS, InventorySchema())
+    assert match_filters({'warehouse_id': 2, 'product_id': 5}, filters)
+    assert not match_filters({'warehouse_id': 3, 'product_id': 5}, filters)
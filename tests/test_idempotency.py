@@ -0,0 +1,57 @@
+import pytest
+from flask import Flask, g, jsonify, request
+from api import idempotency
+from services.cache import TTLCache
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(idempotency, '_store', TTLCache('idempotency', maxsize=10))
+    app = Flask(__name__)
+    calls = []
+
+    @app.before_request
+    def authenticate():
+        # Stands in for require_auth: tokens 'a1' and 'a2' belong to user 1, 'b1' to user 2
+        token = request.headers.get('Authorization', '').replace('Bearer ', '')
+        if token:
+            g.user = {'id': 1 if token.startswith('a') else 2}
+
+    @app.route('/orders', methods=['POST'])
+    @idempotency.idempotent
+    def create():
+        calls.append(1)
+        return jsonify({'id': len(calls)}), 201
+
+    client = app.test_client()
+    client.calls = calls
+    return client
+
+def test_repeated_key_replays_response(client):
+    first = client.post('/orders', json={'a': 1}, headers={'Idempotency-Key': 'k1'})
+    second = client.post('/orders', json={'a': 1}, headers={'Idempotency-Key': 'k1'})
+    assert first.status_code == second.status_code == 201
+    assert second.json == {'id': 1}
+    assert second.headers['Idempotent-Replayed'] == 'true'
+    assert len(client.calls) == 1
+    client.post('/orders', json={'a': 1})
+    assert len(client.calls) == 2
+
+def test_key_reused_with_different_body(client):
+    client.post('/orders', json={'a': 1}, headers={'Idempotency-Key': 'k1'})
+    assert client.post('/orders', json={'a': 2}, headers={'Idempotency-Key': 'k1'}).status_code == 422
+
+def test_in_flight_key_conflicts(client):
+    with client.application.test_request_context('/orders', method='POST', headers={'Idempotency-Key': 'k1'}):
+        scope = idempotency._scope()
+    idempotency._store.add(scope, {'state': 'pending', 'fingerprint': idempotency.hashlib.sha256(b'{}').hexdigest()})
+    response = client.post('/orders', data='{}', content_type='application/json', headers={'Idempotency-Key': 'k1'})
+    assert response.status_code == 409
+    assert not client.calls
+
+def test_scope_follows_user_across_token_refresh(client):
+    key = {'Idempotency-Key': 'k1'}
+    client.post('/orders', json={'a': 1}, headers=dict(key, Authorization='Bearer a1'))
+    retry = client.post('/orders', json={'a': 1}, headers=dict(key, Authorization='Bearer a2'))
+    assert retry.headers.get('Idempotent-Replayed') == 'true' and len(client.calls) == 1
+    other = client.post('/orders', json={'a': 1}, headers=dict(key, Authorization='Bearer b1'))
+    assert 'Idempotent-Replayed' not in other.headers and len(client.calls) == 2
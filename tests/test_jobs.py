@@ -0,0 +1,96 @@
+import threading
+import time
+import pytest
+from services import jobs
+
+@pytest.fixture(autouse=True)
+def job_db(monkeypatch, tmp_path):
+    monkeypatch.setattr(jobs, 'JOBS_DB', str(tmp_path / 'jobs.sqlite3'))
+    monkeypatch.setattr(jobs, '_local', threading.local())
+    monkeypatch.setattr(jobs, '_handlers', {})
+    monkeypatch.setattr(jobs, 'start_workers', lambda: None)
+    monkeypatch.setattr(jobs, 'RETRY_BACKOFF', 0)
+
+def test_retries_then_succeeds():
+    attempts = []
+    def handler(payload, progress):
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError('timeout')
+        progress(3, 3)
+        return {'n': payload['n']}
+    jobs.register('flaky', handler, max_attempts=2)
+    job_id = jobs.enqueue('flaky', {'n': 5})
+    jobs.run_job(jobs.claim())
+    assert jobs.get_job(job_id)['state'] == 'queued'
+    jobs.run_job(jobs.claim())
+    job = jobs.get_job(job_id)
+    assert job['state'] == 'succeeded' and job['result'] == {'n': 5}
+    assert job['progress'] == {'done': 3, 'total': 3}
+
+def test_value_error_is_not_retried():
+    def handler(payload, progress):
+        raise ValueError('bad input')
+    jobs.register('bad', handler, max_attempts=3)
+    job_id = jobs.enqueue('bad', {})
+    jobs.run_job(jobs.claim())
+    job = jobs.get_job(job_id)
+    assert job['state'] == 'failed' and job['error'] == 'bad input'
+
+def test_concurrency_limit_per_type():
+    jobs.register('serial', lambda payload, progress: None, concurrency=1)
+    jobs.enqueue('serial', {})
+    jobs.enqueue('serial', {})
+    assert jobs.claim() is not None
+    assert jobs.claim() is None
+
+def test_heartbeat_keeps_long_job_claimed(monkeypatch):
+    monkeypatch.setattr(jobs, 'STALE_AFTER', 0.3)
+    started = threading.Event()
+    def handler(payload, progress):
+        started.set()
+        time.sleep(1.0)
+        return 'done'
+    jobs.register('long', handler, concurrency=1, max_attempts=3)
+    job_id = jobs.enqueue('long', {})
+    worker = threading.Thread(target=jobs.run_job, args=(jobs.claim(),))
+    worker.start()
+    started.wait()
+    time.sleep(0.6)
+    # Past STALE_AFTER without progress(), but the heartbeat kept it from being reaped
+    assert jobs.claim() is None
+    worker.join()
+    job = jobs.get_job(job_id)
+    assert job['state'] == 'succeeded' and job['attempts'] == 1
+
+def test_reaped_run_does_not_overwrite_state():
+    def handler(payload, progress):
+        # What claim() does to a run it considers stale
+        jobs._db().execute("update jobs set state = 'failed', error = 'Worker stopped responding'")
+        return 'late'
+    jobs.register('reaped', handler, max_attempts=1)
+    job_id = jobs.enqueue('reaped', {})
+    jobs.run_job(jobs.claim())
+    job = jobs.get_job(job_id)
+    assert job['state'] == 'failed' and job['result'] is None
+
+def test_job_status_is_visible_to_its_owner_and_admins(monkeypatch):
+    from flask import Flask, g, request
+    from api import jobs as jobs_api
+    monkeypatch.setattr(jobs_api, 'start_workers', lambda: None)
+    app = Flask(__name__)
+    @app.before_request
+    def authenticate():
+        # Stands in for require_auth: X-User is '<id>' or '<id>:<role>'
+        user_id, _, role = request.headers.get('X-User', '').partition(':')
+        if user_id:
+            g.user = {'id': int(user_id), 'role': role or 'warehouse'}
+    app.register_blueprint(jobs_api.jobs_bp, url_prefix='/jobs')
+    jobs.register('receipt', lambda payload, progress: {'received': 1})
+    with app.test_request_context(headers={'X-User': '1'}):
+        app.preprocess_request()
+        job_id = jobs.enqueue('receipt', {})
+    client = app.test_client()
+    assert client.get('/jobs/' + job_id, headers={'X-User': '1'}).get_json()['user_id'] == '1'
+    assert client.get('/jobs/' + job_id, headers={'X-User': '2'}).status_code == 404
+    assert client.get('/jobs/' + job_id, headers={'X-User': '3:admin'}).status_code == 200
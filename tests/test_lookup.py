@@ -0,0 +1,73 @@
+import threading
+import time
+from services import lookup
+
+def make_index(fake_db):
+    tables = {
+        'products': [{'id': 1, 'name': 'Shirt', 'sku': 'SH-1', 'is_deleted': False}],
+        'product_variants': [{'id': 10, 'product_id': 1, 'sku': 'SH-1-M', 'barcode': '4006381333931',
+                              'attributes': {'size': 'M'}, 'status': 'active'}],
+        'barcodes': [{'id': 5, 'product_id': 1, 'variant_id': None, 'code': '012345678905', 'type': 'UPC'}],
+    }
+    for name, rows in tables.items():
+        fake_db.seed(name, rows)
+    index = lookup.CodeIndex()
+    index.warm()
+    return index
+
+def test_resolves_barcodes_and_skus(fake_db):
+    index = make_index(fake_db)
+    assert index.lookup(' 4006381333931 ')['variant']['id'] == 10
+    assert index.lookup('012345678905')['kind'] == 'barcode'
+    assert index.lookup('sh-1-m')['kind'] == 'variant_sku'
+    match = index.lookup('SH-1')
+    assert match['kind'] == 'product_sku' and match['variant'] is None
+    assert index.lookup_many(['SH-1', 'nope'])[1] is None
+
+def test_incremental_updates(fake_db):
+    index = make_index(fake_db)
+    index.add_product({'id': 1, 'name': 'Shirt', 'sku': 'SH-2'})
+    assert index.lookup('SH-1') is None
+    index.add_product({'id': 2, 'name': 'Cap', 'sku': 'CAP'})
+    index.add_barcodes([{'product_id': 2, 'code': '999'}])
+    assert index.lookup('999')['product']['name'] == 'Cap'
+    index.remove_product(2)
+    assert index.lookup('CAP') is None and index.lookup('999') is None
+
+def test_variant_missing_from_index_is_not_found(fake_db):
+    index = make_index(fake_db)
+    codes, products, _ = index._state
+    # A code whose variant is absent from the installed build resolves to nothing
+    index._install((codes, products, {}))
+    assert index.lookup('SH-1-M') is None
+    assert index.lookup('SH-1')['kind'] == 'product_sku'
+
+def test_cold_lookups_share_one_build(monkeypatch):
+    index = lookup.CodeIndex()
+    loads = []
+    def load():
+        loads.append(1)
+        time.sleep(0.05)
+        return {kind: {} for kind in lookup.KINDS}, {}, {}
+    monkeypatch.setattr(index, '_load', load)
+    threads = [threading.Thread(target=index.lookup, args=('SH-1',)) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(loads) == 1
+
+def test_write_during_rebuild_survives_install(monkeypatch, fake_db):
+    index = make_index(fake_db)
+    load = index._load
+    def racing_load():
+        state = load()
+        # Created on this worker after the rebuild read the products table
+        index.add_product({'id': 2, 'name': 'Cap', 'sku': 'CAP'})
+        index.add_barcodes([{'product_id': 2, 'code': '999'}])
+        return state
+    monkeypatch.setattr(index, '_load', racing_load)
+    index.rebuild()
+    assert index.lookup('CAP')['product']['name'] == 'Cap'
+    assert index.lookup('999')['kind'] == 'barcode'
+    assert index._journals == []
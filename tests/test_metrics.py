@@ -0,0 +1,29 @@
+import time
+import httpx
+from services import db
+from services.metrics import Registry
+
+def test_render_histogram_and_summary():
+    registry = Registry()
+    labels = (('method', 'GET'), ('route', '/products/'))
+    for value in (0.01, 0.02, 0.3):
+        registry.observe('req_seconds', 'Latency', labels, value, (0.05, 0.5), summary='req_latency_seconds')
+    registry.inc('req_total', 'Requests', labels)
+    text = registry.render()
+    assert 'req_seconds_bucket{method="GET",route="/products/",le="0.05"} 2' in text
+    assert 'req_seconds_bucket{method="GET",route="/products/",le="+Inf"} 3' in text
+    assert 'req_latency_seconds{method="GET",route="/products/",quantile="0.99"} 0.3' in text
+    assert '# TYPE req_latency_seconds summary' in text
+    assert 'req_total{method="GET",route="/products/"} 1' in text
+
+def test_query_log_records_rows_and_bytes():
+    request = httpx.Request('GET', 'https://x.supabase.co/rest/v1/products?select=id&limit=3')
+    response = httpx.Response(200, headers={'Content-Range': '0-2/*'}, content=b'[{"id":1},{"id":2},{"id":3}]', request=request)
+    log = db.start_query_log()
+    try:
+        db._record(request, response, time.perf_counter())
+        db._record(request, httpx.Response(200, headers={'Content-Range': '*/0'}, content=b'[]', request=request), time.perf_counter())
+    finally:
+        db.stop_query_log()
+    assert [entry['rows'] for entry in log] == [3, 0]
+    assert log[0]['path'] == 'products' and log[0]['bytes'] == 28
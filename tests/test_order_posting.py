@@ -0,0 +1,58 @@
+import pytest
+from benchmarks import harness
+from benchmarks.fake_supabase import FakeSupabase
+
+@pytest.fixture
+def fake():
+    fake = FakeSupabase()
+    app = harness.create_app(fake)
+    fake.client = app.test_client()
+    yield fake
+    harness.restore(app.previous_clients)
+
+def seed_order(fake, on_hand=5):
+    fake.seed('inventory', [{'product_id': 1, 'warehouse_id': 1, 'bin_id': None, 'batch_id': None, 'serial_number': None,
+                             'qty_on_hand': on_hand, 'qty_reserved': 0, 'qty_damaged': 0, 'qty_in_transit': 0}])
+    order = fake.seed('sales_orders', [{'customer_id': 1, 'status': 'confirmed'}])[0]
+    line = fake.seed('sales_order_items', [{'order_id': order['id'], 'product_id': 1, 'quantity': 3, 'unit_price': 1.0,
+                                            'shipped': False, 'returned': False}])[0]
+    return order['id'], line
+
+def test_repeated_ship_moves_stock_once(fake):
+    order_id, line = seed_order(fake)
+    for _ in range(2):
+        response = fake.client.post('/api/v1/sales/orders/{}/ship'.format(order_id), json={'warehouse_id': 1, 'items': [{'id': line['id']}]})
+        assert response.status_code == 200
+    assert fake.tables['inventory'][0]['qty_on_hand'] == 2
+    assert fake.tables['sales_order_items'][0]['shipped'] is True
+    assert fake.tables['sales_orders'][0]['status'] == 'shipped'
+
+def test_failed_ship_leaves_line_unflagged(fake):
+    order_id, line = seed_order(fake, on_hand=1)
+    response = fake.client.post('/api/v1/sales/orders/{}/ship'.format(order_id), json={'warehouse_id': 1, 'items': [{'id': line['id']}]})
+    assert response.status_code == 400
+    assert fake.tables['sales_order_items'][0]['shipped'] is False
+    assert fake.tables['sales_orders'][0]['status'] == 'confirmed'
+
+def test_partial_ship_is_rejected(fake):
+    order_id, line = seed_order(fake)
+    response = fake.client.post('/api/v1/sales/orders/{}/ship'.format(order_id),
+                                json={'warehouse_id': 1, 'items': [{'id': line['id'], 'quantity': 1}]})
+    assert response.status_code == 400
+    assert fake.tables['sales_order_items'][0]['shipped'] is False
+    assert fake.tables['inventory'][0]['qty_on_hand'] == 5
+
+def test_receive_validates_items_and_increments_lines(fake):
+    order = fake.seed('purchase_orders', [{'supplier_id': 1, 'status': 'ordered'}])[0]
+    line = fake.seed('purchase_order_items', [{'order_id': order['id'], 'product_id': 1, 'quantity': 10, 'unit_price': 1.0,
+                                               'received_quantity': 4, 'over_receipt': False}])[0]
+    url = '/api/v1/purchase/orders/{}/receive'.format(order['id'])
+    for items in ([{'received_quantity': 1}], [{'id': line['id']}], [{'id': line['id'], 'received_quantity': 'x'}]):
+        assert fake.client.post(url, json={'warehouse_id': 1, 'items': items}).status_code == 400
+    response = fake.client.post(url, json={'warehouse_id': 1, 'items': [{'id': line['id'], 'received_quantity': 4, 'bin_id': 1},
+                                                                          {'id': line['id'], 'received_quantity': 3, 'bin_id': 2}]})
+    assert response.status_code == 200
+    stored = fake.tables['purchase_order_items'][0]
+    assert stored['received_quantity'] == 11 and stored['over_receipt'] is True
+    assert fake.tables['purchase_orders'][0]['status'] == 'received'
+    assert sorted(row['qty_on_hand'] for row in fake.tables['inventory']) == [3, 4]
@@ -0,0 +1,49 @@
+import numpy as np
+from schemas.purchase_order import PurchaseOrderSchema
+from schemas.purchase_order_item import PurchaseOrderItemSchema
+from services import replenishment
+
+def test_forecast_methods():
+    matrix = np.array([[0.0] * 63 + [2.0] * 28, [5.0] * 91])
+    assert np.allclose(replenishment.forecast(matrix, 'moving_average'), [2.0, 5.0])
+    smoothed = replenishment.forecast(matrix, 'exp_smoothing')
+    assert smoothed[0] < 2.0 and np.isclose(smoothed[1], 5.0)
+
+def test_reorder_levels():
+    safety, reorder_point, order_up_to = replenishment.reorder_levels(np.array([10.0]), np.array([0.0]), lead_time=14, review=7)
+    assert safety[0] == 0 and reorder_point[0] == 140 and order_up_to[0] == 210
+
+def test_draft_purchase_orders(fake_db):
+    tables = {
+        'replenishment_forecasts': [
+            {'product_id': 1, 'daily_demand': 10, 'demand_std': 0, 'lead_time_days': 14, 'safety_stock': 0,
+             'reorder_point': 140, 'order_up_to': 210, 'supplier_id': 7, 'unit_price': 2.5},
+            {'product_id': 2, 'daily_demand': 1, 'demand_std': 0, 'lead_time_days': 14, 'safety_stock': 0,
+             'reorder_point': 14, 'order_up_to': 21, 'supplier_id': 7, 'unit_price': 1.0},
+        ],
+        'inventory': [
+            {'id': 1, 'product_id': 1, 'qty_on_hand': 100, 'qty_reserved': 10, 'qty_in_transit': 0},
+            {'id': 2, 'product_id': 2, 'qty_on_hand': 50, 'qty_reserved': 0, 'qty_in_transit': 0},
+        ],
+        'purchase_orders': [{'id': 3, 'status': 'ordered'}],
+        'purchase_order_items': [{'id': 1, 'order_id': 3, 'product_id': 1, 'quantity': 20, 'received_quantity': 0}],
+    }
+    for name, rows in tables.items():
+        fake_db.seed(name, rows)
+    result = replenishment.draft_purchase_orders(created_by=1)
+    # Position 100 - 10 + 20 on order = 110, ordered up to 210
+    assert result['drafts'][0]['items'] == [{'product_id': 1, 'quantity': 100.0, 'unit_price': 2.5}]
+    assert result['drafts'][0]['order']['total'] == 250.0
+    # Each draft is a payload create_po accepts: the order as is, items without order_id
+    PurchaseOrderSchema().load(result['drafts'][0]['order'])
+    PurchaseOrderItemSchema().load(result['drafts'][0]['items'], many=True, partial=('order_id',))
+
+def test_last_suppliers_reads_only_target_products(fake_db):
+    fake_db.seed('latest_product_suppliers', [
+        {'id': 1, 'product_id': 1, 'supplier_id': 7, 'unit_price': 2.5},
+        {'id': 2, 'product_id': 2, 'supplier_id': 8, 'unit_price': 1.0},
+        {'id': 3, 'product_id': 5, 'supplier_id': 9, 'unit_price': None},
+    ])
+    supplier, price = replenishment.last_suppliers(np.array([1, 3, 5]))
+    assert np.array_equal(supplier, [7, np.nan, 9], equal_nan=True)
+    assert np.array_equal(price, [2.5, np.nan, np.nan], equal_nan=True)
@@ -0,0 +1,17 @@
+import pytest
+from benchmarks import harness
+
+# Supabase calls allowed per request on the hot paths. Raising a budget should come
+# with a reason; an N+1 loop shows up here as a budget that scales with ORDER_LINES.
+BUDGETS = {
+    'catalog_browse': 1,
+    'product_master_create': 3,
+    'po_receive': 2,
+    'so_ship': 2,
+    'movement_posting': 1,
+}
+
+@pytest.mark.parametrize('scenario', sorted(BUDGETS))
+def test_round_trip_budget(scenario):
+    result = harness.run(scenario, requests=20)
+    assert result['round_trips'] <= BUDGETS[scenario]
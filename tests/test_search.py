@@ -0,0 +1,82 @@
+import threading
+from services import search
+
+def make_index(fake_db):
+    tables = {
+        'products': [{'id': 1, 'name': 'Cotton T-Shirt', 'sku': 'TS-100', 'is_deleted': False},
+                     {'id': 2, 'name': 'Wool Sweater', 'sku': 'SW-200', 'is_deleted': False},
+                     {'id': 3, 'name': 'Shirt Hanger', 'sku': 'HG-300', 'is_deleted': False}],
+        'categories': [{'id': 7, 'name': 'Apparel', 'tags': ['summer']}],
+        'product_categories': [{'id': 1, 'product_id': 1, 'category_id': 7}],
+        'product_variants': [{'id': 10, 'product_id': 2, 'sku': 'SW-200-L', 'attributes': {'color': 'Navy'}}],
+    }
+    for name, rows in tables.items():
+        fake_db.seed(name, rows)
+    index = search.ProductSearch()
+    index.warm()
+    return index
+
+def ids(result):
+    return [row['id'] for row in result[1]]
+
+def test_matching_and_ranking(fake_db):
+    index = make_index(fake_db)
+    assert ids(index.search('shirt')) == [1, 3]
+    assert ids(index.search('ts-100')) == [1]
+    assert ids(index.search('swe')) == [2]
+    assert ids(index.search('eate')) == [2]
+    assert ids(index.search('sweatre')) == [2]
+    assert ids(index.search('navy')) == [2]
+    assert ids(index.search('summer shirt')) == [1]
+    assert index.search('cotton navy') == (0, [])
+
+def test_ranking_and_paging(fake_db):
+    index = make_index(fake_db)
+    index.add_product({'id': 5, 'name': 'Shirts Rack', 'sku': 'RK-1'})
+    # Exact term matches outrank prefix matches; SKU outranks name
+    assert ids(index.search('shirt')) == [1, 3, 5]
+    assert ids(index.search('sw')) == [2]
+    total, page = index.search('shirt', limit=1, offset=1)
+    assert total == 3 and [row['id'] for row in page] == [3]
+
+def test_incremental_updates(fake_db):
+    index = make_index(fake_db)
+    index.add_product({'id': 4, 'name': 'Rain Jacket', 'sku': 'JK-400'})
+    index.add_variants([{'id': 11, 'product_id': 4, 'sku': 'JK-400-Y', 'attributes': {'color': 'Yellow'}}])
+    index.add_categories([{'product_id': 4, 'category_id': 7}])
+    assert ids(index.search('jacket yellow apparel')) == [4]
+    index.add_product({'id': 2, 'name': 'Wool Cardigan', 'sku': 'SW-200'})
+    assert index.search('sweater')[0] == 0
+    assert ids(index.search('cardigan')) == [2]
+    index.remove_product(4)
+    assert index.search('jacket') == (0, [])
+
+def test_added_terms_merge_into_vocabulary(monkeypatch, fake_db):
+    index = make_index(fake_db)
+    monkeypatch.setattr(search, 'MERGE_TERMS', 4)
+    for i in range(10):
+        index.add_product({'id': 100 + i, 'name': 'Gadget{}'.format(i), 'sku': 'GD-{}'.format(i)})
+    terms, added = index._state.vocab
+    assert len(added) < 4 and terms == sorted(terms)
+    assert index.search('gadg')[0] == 10
+    assert ids(index.search('gadget7')) == [107]
+
+def test_search_does_not_wait_for_writers(fake_db):
+    index = make_index(fake_db)
+    results = []
+    with index._lock:
+        reader = threading.Thread(target=lambda: results.append(ids(index.search('shirt'))))
+        reader.start()
+        reader.join(timeout=2)
+    assert results == [[1, 3]]
+
+def test_write_during_rebuild_survives_install(monkeypatch, fake_db):
+    index = make_index(fake_db)
+    load = index._load
+    def racing_load():
+        state = load()
+        index.add_product({'id': 4, 'name': 'Rain Jacket', 'sku': 'JK-400'})
+        return state
+    monkeypatch.setattr(index, '_load', racing_load)
+    index.rebuild()
+    assert ids(index.search('jacket')) == [4]
@@ -0,0 +1,24 @@
+from services import snapshots
+
+def movement(id, product_id, quantity):
+    return {'id': id, 'movement_type': 'purchase', 'quantity': quantity, 'ref_id': None, 'product_id': product_id,
+            'warehouse_id': 1, 'bin_id': None, 'batch_id': None, 'serial_number': None,
+            'created_at': '2026-01-0{}T00:00:00+00:00'.format(id)}
+
+def test_as_of_replays_in_flight_movements_and_pages_by_product(fake_db):
+    fake_db.seed('products', [{'id': pid} for pid in (1, 2, 3)])
+    # Movement 4 was still in flight when the snapshot took watermark 5
+    fake_db.seed('stock_snapshots', [{'id': 1, 'taken_at': '2026-01-05T12:00:00+00:00', 'last_movement_id': 5,
+                                   'pending_movement_ids': [4]}])
+    fake_db.seed('stock_snapshot_balances', [
+        {'id': 10 + pid, 'snapshot_id': 1, 'product_id': pid, 'warehouse_id': 1, 'bin_id': None, 'batch_id': None,
+         'serial_number': None, 'qty_on_hand': 10, 'qty_reserved': 0, 'qty_damaged': 0, 'qty_in_transit': 0}
+        for pid in (1, 2, 3)])
+    fake_db.seed('stock_movements', [movement(3, 1, 10), movement(4, 2, 5), movement(6, 3, 1), movement(7, 1, 2)])
+    at = '2026-01-06T12:00:00+00:00'
+    first = snapshots.balances_as_of(at, limit=2)
+    assert [(b['product_id'], b['qty_on_hand']) for b in first['balances']] == [(1, 10), (2, 15)]
+    assert first['next_after_id'] == 2
+    rest = snapshots.balances_as_of(at, after_id=first['next_after_id'], limit=2)
+    assert [(b['product_id'], b['qty_on_hand']) for b in rest['balances']] == [(3, 11)]
+    assert rest['next_after_id'] is None